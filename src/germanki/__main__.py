@@ -1,13 +1,6 @@
-import os
 import sys
-from pathlib import Path
-
-
-def main():
-    os.system(
-        f'cd {Path(__file__).parent} && {sys.executable} -m streamlit run --server.enableStaticServing true app.py'
-    )
 
+from germanki.cli import main
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -1,12 +1,22 @@
 import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Union
+from urllib.parse import urlsplit
 
 import requests
 from pydantic import BaseModel, Field
 
+from germanki.anki_uploads import MediaUploadLedger
+from germanki.transport import HTTPTransport, default_transport
+
 
 class AnkiMediaType(Enum):
     IMAGE = 'image'
@@ -19,7 +29,7 @@ class AnkiMedia(BaseModel):
 
     @property
     def filename(self) -> str:
-        return self.path.stem
+        return self.path.name
 
 
 class AnkiCard(BaseModel):
@@ -29,6 +39,84 @@ class AnkiCard(BaseModel):
     media: List[AnkiMedia] = Field(default=[])
 
 
+class Base64File:
+    """Stands for the base64-encoded contents of a file in a JSON payload."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    @property
+    def encoded_size(self) -> int:
+        return 4 * -(-self.path.stat().st_size // 3)
+
+
+class StreamingJSONBody:
+    """File-like JSON request body that encodes files while it is sent.
+
+    `Base64File` values in the payload are serialized as JSON strings holding
+    the base64 encoding of the file, read and encoded one chunk at a time as
+    the body is consumed, so only a chunk of each file is ever in memory.
+    `len()` gives the size of the whole body, which lets `requests` send it
+    with a Content-Length instead of chunked encoding.
+    """
+
+    # a multiple of 3, so encoded chunks concatenate without padding
+    CHUNK_SIZE = 3 * 16 * 1024
+
+    def __init__(self, payload: Any):
+        self.files: List[Base64File] = []
+        marker = f'base64file-{uuid.uuid4().hex}'
+
+        def default(obj: Any) -> str:
+            if isinstance(obj, Base64File):
+                self.files.append(obj)
+                return f'{marker}-{len(self.files) - 1}'
+            raise TypeError(f'{type(obj).__name__} is not JSON serializable')
+
+        text = json.dumps(payload, default=default)
+        self._parts: List[Union[bytes, Base64File]] = []
+        for i, part in enumerate(re.split(f'{marker}-(\\d+)', text)):
+            if i % 2:
+                self._parts.append(self.files[int(part)])
+            elif part:
+                self._parts.append(part.encode('utf-8'))
+        self._length = sum(
+            part.encoded_size if isinstance(part, Base64File) else len(part)
+            for part in self._parts
+        )
+        self._chunks = self._iter_chunks()
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _iter_chunks(self) -> Iterator[bytes]:
+        for part in self._parts:
+            if not isinstance(part, Base64File):
+                yield part
+                continue
+            with open(part.path, 'rb') as file:
+                while chunk := file.read(self.CHUNK_SIZE):
+                    yield base64.b64encode(chunk)
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def escape_search_text(text: str) -> str:
+    """Escapes text so Anki searches for it literally."""
+    return re.sub(r'([\\"*_])', r'\\\1', text)
+
+
 class AnkiConnectError(Exception):
     """Base exception for AnkiConnect errors."""
 
@@ -61,6 +149,8 @@ class AnkiConnectDeckNotExistsError(AnkiConnectError):
 class AnkiConnectClient:
     """Client for interacting with the AnkiConnect API."""
 
+    LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
     def __init__(
         self,
         host: str = 'http://localhost',
@@ -68,11 +158,29 @@ class AnkiConnectClient:
         version: int = 6,
         timeout: int = 5,
         default_tags: List[str] = None,
+        transport: Optional[HTTPTransport] = None,
+        upload_by_path: Optional[bool] = None,
+        upload_ledger: Optional[MediaUploadLedger] = None,
+        deck_names_ttl: float = 30,
     ):
         self.base_url = f'{host}:{port}'
+        # Anki on the same machine reads media files from their path, which
+        # spares encoding and sending them. Defaults to whether Anki is local.
+        self.upload_by_path = (
+            upload_by_path
+            if upload_by_path is not None
+            else urlsplit(host).hostname in self.LOCAL_HOSTS
+        )
         self.version = version
         self.timeout = timeout
-        self.session = None
+        self.upload_ledger = upload_ledger
+        self._digests: Dict[Path, str] = {}
+        # deck names are fetched once for a whole batch of cards
+        self.deck_names_ttl = deck_names_ttl
+        self._deck_names: Optional[List[str]] = None
+        self._deck_names_fetched_at = 0.0
+        self._deck_names_lock = threading.Lock()
+        self.transport = transport if transport else default_transport()
         self.default_tags = (
             default_tags
             if default_tags
@@ -86,18 +194,22 @@ class AnkiConnectClient:
         self, action: str, params: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Internal method to send a request to AnkiConnect."""
-        payload = {
-            'action': action,
-            'version': self.version,
-            'params': params or {},
-        }
+        payload = self._action(action, params)
+        body = StreamingJSONBody(payload)
 
         try:
-            with self.get_session() as session:
-                response = session.post(
+            if body.files:
+                response = self.transport.post(
+                    self.base_url,
+                    data=body,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=self.timeout,
+                )
+            else:
+                response = self.transport.post(
                     self.base_url, json=payload, timeout=self.timeout
                 )
-                response.raise_for_status()
+            response.raise_for_status()
         except requests.RequestException as e:
             raise AnkiConnectRequestError(
                 str(e), getattr(e.response, 'status_code', None)
@@ -141,11 +253,7 @@ class AnkiConnectClient:
         create_deck_if_not_exists: bool = True,
     ) -> Dict[str, Any]:
         """Adds one card."""
-        deck_exists = self._deck_exists(deck_name)
-        if not deck_exists:
-            if not create_deck_if_not_exists:
-                raise AnkiConnectDeckNotExistsError(deck_name=deck_name)
-            self._create_deck(deck_name)
+        self._ensure_deck(deck_name, create_deck_if_not_exists)
 
         self.upload_media_from_card(anki_card)
 
@@ -158,12 +266,179 @@ class AnkiConnectClient:
             },
         )
 
+    def add_cards(
+        self,
+        deck_name: str,
+        anki_cards: List[AnkiCard],
+        tags: Optional[List[str]] = None,
+        model: str = 'Basic',
+        allow_duplicate: bool = False,
+        create_deck_if_not_exists: bool = True,
+        chunk_size: int = 20,
+    ) -> List[Optional[AnkiConnectResponseError]]:
+        """Adds many cards, batching media uploads and notes with `multi`.
+
+        Returns one item per card, in order: `None` if the card was added,
+        or the error that prevented it from being added.
+        """
+        self._ensure_deck(deck_name, create_deck_if_not_exists)
+
+        errors: List[Optional[AnkiConnectResponseError]] = [None] * len(
+            anki_cards
+        )
+        for start in range(0, len(anki_cards), chunk_size):
+            indexes = range(start, min(start + chunk_size, len(anki_cards)))
+
+            # cards sharing a file upload it once
+            chunk_media: Dict[str, AnkiMedia] = {}
+            media_cards: Dict[str, List[int]] = {}
+            for index in indexes:
+                for media in anki_cards[index].media:
+                    if not media.path.exists():
+                        errors[index] = AnkiConnectResponseError(
+                            'storeMediaFile', f'File not found: {media.path}'
+                        )
+                        continue
+                    chunk_media.setdefault(media.filename, media)
+                    media_cards.setdefault(media.filename, []).append(index)
+
+            missing_media = self._missing_media(list(chunk_media.values()))
+            results = self._multi(
+                [
+                    self._action(
+                        'storeMediaFile', self._upload_media_params(media)
+                    )
+                    for media in missing_media
+                ]
+            )
+            self._record_uploads(missing_media, results)
+            media_owners, media_results = [], []
+            for media, result in zip(missing_media, results):
+                for index in media_cards[media.filename]:
+                    media_owners.append(index)
+                    media_results.append(result)
+            self._assign_multi_errors(errors, media_owners, media_results)
+
+            note_owners = [index for index in indexes if errors[index] is None]
+            note_actions = [
+                self._action(
+                    'addNote',
+                    {
+                        'note': self._add_note_payload_params(
+                            deck_name,
+                            anki_cards[index],
+                            tags,
+                            model,
+                            allow_duplicate,
+                        )
+                    },
+                )
+                for index in note_owners
+            ]
+            self._assign_multi_errors(
+                errors, note_owners, self._multi(note_actions)
+            )
+        return errors
+
+    def find_existing_words(
+        self, deck_name: str, words: List[str]
+    ) -> List[bool]:
+        """Tells, for each word, whether the deck has a card for it already.
+
+        Cards are matched on the start of their front, which holds the word
+        followed by a line break. All words are looked up in one request.
+        """
+        if not words or deck_name not in self.deck_names():
+            return [False] * len(words)
+        deck = escape_search_text(deck_name)
+        results = self._multi(
+            [
+                self._action(
+                    'findNotes',
+                    {
+                        'query': f'"deck:{deck}" '
+                        f'"front:{escape_search_text(word)}<br>*"'
+                    },
+                )
+                for word in words
+            ]
+        )
+        return [
+            isinstance(result, list) and bool(result) for result in results
+        ]
+
+    def _action(
+        self, action: str, params: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        return {
+            'action': action,
+            'version': self.version,
+            'params': params or {},
+        }
+
+    def _multi(
+        self, actions: List[Dict[str, Any]]
+    ) -> List[Union[Any, AnkiConnectResponseError]]:
+        """Sends several actions in one request.
+
+        Errors of individual actions are returned in place of their results
+        instead of being raised.
+        """
+        if not actions:
+            return []
+        results = self._request('multi', {'actions': actions})
+        return [
+            AnkiConnectResponseError(action['action'], result['error'])
+            if result.get('error')
+            else result.get('result')
+            for action, result in zip(actions, results)
+        ]
+
+    @staticmethod
+    def _assign_multi_errors(
+        errors: List[Optional[AnkiConnectResponseError]],
+        owners: List[int],
+        results: List[Union[Any, AnkiConnectResponseError]],
+    ) -> None:
+        for index, result in zip(owners, results):
+            if isinstance(result, AnkiConnectResponseError) and (
+                errors[index] is None
+            ):
+                errors[index] = result
+
+    def _ensure_deck(
+        self, deck_name: str, create_deck_if_not_exists: bool
+    ) -> None:
+        if self._deck_exists(deck_name):
+            return
+        if not create_deck_if_not_exists:
+            raise AnkiConnectDeckNotExistsError(deck_name=deck_name)
+        self._create_deck(deck_name)
+
     def _create_deck(self, deck_name: str) -> Dict[str, Any]:
-        return self._request('createDeck', {'deck': deck_name})
+        try:
+            return self._request('createDeck', {'deck': deck_name})
+        finally:
+            self.invalidate_deck_names()
 
     def _deck_exists(self, deck_name: str) -> bool:
-        decks = self._request('deckNames')
-        return decks is not None and deck_name in decks
+        return deck_name in self.deck_names()
+
+    def deck_names(self) -> List[str]:
+        """Names of all decks, cached for `deck_names_ttl` seconds."""
+        with self._deck_names_lock:
+            if (
+                self._deck_names is None
+                or time.monotonic() - self._deck_names_fetched_at
+                > self.deck_names_ttl
+            ):
+                self._deck_names = self._request('deckNames') or []
+                self._deck_names_fetched_at = time.monotonic()
+            return self._deck_names
+
+    def invalidate_deck_names(self) -> None:
+        with self._deck_names_lock:
+            self._deck_names = None
 
     def upload_media(self, anki_media: AnkiMedia) -> Dict[str, Any]:
         """Uploads a media file (image or audio) to Anki."""
@@ -171,28 +446,106 @@ class AnkiConnectClient:
         if not anki_media.path.exists():
             raise FileNotFoundError(f'File not found: {anki_media.path}')
 
-        params = {
+        return self._request(
+            'storeMediaFile', self._upload_media_params(anki_media)
+        )
+
+    def _upload_media_params(
+        self, anki_media: AnkiMedia
+    ) -> Dict[str, Union[str, Base64File]]:
+        if self.upload_by_path:
+            return {
+                'filename': anki_media.filename,
+                'path': str(anki_media.path.resolve()),
+            }
+        return {
             'filename': anki_media.filename,
-            'data': base64.b64encode(anki_media.path.read_bytes()).decode(
-                'utf-8'
-            ),
+            'data': Base64File(anki_media.path),
         }
-        return self._request('storeMediaFile', params)
 
     def upload_media_from_card(
         self, anki_card: AnkiCard
     ) -> List[Dict[str, Any]]:
-        return [self.upload_media(media) for media in anki_card.media]
+        """Uploads the media of the card that Anki does not have yet."""
+        for media in anki_card.media:
+            if not media.path.exists():
+                raise FileNotFoundError(f'File not found: {media.path}')
+        results = []
+        for media in self._missing_media(anki_card.media):
+            results.append(self.upload_media(media))
+            self._record_uploads([media], [results[-1]])
+        return results
+
+    def _missing_media(self, media_list: List[AnkiMedia]) -> List[AnkiMedia]:
+        """Filters out media that Anki already has.
+
+        Files are looked up with one batched `getMediaFilesNames`, even when
+        the upload ledger lists them, so media deleted from Anki or missing
+        from the profile open now is uploaded again. A file with the same
+        name in Anki only has the same contents if the file is
+        content-addressed, named after the SHA-256 of its contents as the
+        media store does, or if the ledger records uploading these contents
+        under that name. Other files are always uploaded.
+        """
+        candidates = [
+            media for media in media_list if self._has_known_contents(media)
+        ]
+        results = self._multi(
+            [
+                self._action('getMediaFilesNames', {'pattern': media.filename})
+                for media in candidates
+            ]
+        )
+        existing = {
+            media.filename
+            for media, result in zip(candidates, results)
+            if isinstance(result, list) and media.filename in result
+        }
+        self._record_uploads(
+            [media for media in candidates if media.filename in existing],
+            [None] * len(existing),
+        )
+        return [
+            media for media in media_list if media.filename not in existing
+        ]
+
+    def _has_known_contents(self, media: AnkiMedia) -> bool:
+        digest = self._media_digest(media)
+        if media.path.stem == digest:
+            return True
+        return self.upload_ledger is not None and (
+            self.upload_ledger.is_uploaded(
+                self.base_url, media.filename, digest
+            )
+        )
 
-    def get_session(self) -> requests.Session:
-        if self.session is not None:
-            return self.session
+    def _record_uploads(
+        self,
+        media_list: List[AnkiMedia],
+        results: List[Union[Any, AnkiConnectResponseError]],
+    ) -> None:
+        if self.upload_ledger is None:
+            return
+        for media, result in zip(media_list, results):
+            if not isinstance(result, AnkiConnectResponseError):
+                self.upload_ledger.record(
+                    self.base_url, media.filename, self._media_digest(media)
+                )
+
+    def _media_digest(self, media: AnkiMedia) -> str:
+        if media.path not in self._digests:
+            with open(media.path, 'rb') as file:
+                self._digests[media.path] = hashlib.file_digest(
+                    file, 'sha256'
+                ).hexdigest()
+        return self._digests[media.path]
 
-        return requests.Session()
+    def get_session(self) -> requests.Session:
+        return self.transport.session
 
     def __enter__(self):
-        self.session = self.get_session()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.session.close()
+        # the pooled session is shared with other clients and outlives this one
+        pass
@@ -0,0 +1,63 @@
+import threading
+import time
+from pathlib import Path
+from typing import Set, Tuple
+
+from germanki.storage import SQLiteStore
+
+
+class MediaUploadLedger(SQLiteStore):
+    """Persisted record of media files uploaded to each Anki instance.
+
+    Entries are keyed by the AnkiConnect URL, the media filename and the
+    SHA-256 of its contents, so a file that changed under the same name is
+    uploaded again. Entries older than `max_age` seconds are ignored.
+
+    The ledger does not tell whether Anki still has a file: it only vouches
+    for the contents of a file Anki reports under that name. It is only
+    useful for media that is not content-addressed, which Germanki itself
+    never uploads.
+    """
+
+    def __init__(self, db_path: Path, max_age: float = 30 * 24 * 3600):
+        super().__init__(db_path)
+        self.max_age = max_age
+        self._uploaded: Set[Tuple[str, str, str]] = set()
+        self._lock = threading.Lock()
+        with self._connection as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS uploads ('
+                ' anki_url TEXT NOT NULL,'
+                ' filename TEXT NOT NULL,'
+                ' digest TEXT NOT NULL,'
+                ' uploaded_at REAL NOT NULL,'
+                ' PRIMARY KEY (anki_url, filename, digest))'
+            )
+
+    def is_uploaded(self, anki_url: str, filename: str, digest: str) -> bool:
+        key = (anki_url, filename, digest)
+        with self._lock:
+            if key in self._uploaded:
+                return True
+        row = self._connection.execute(
+            'SELECT 1 FROM uploads WHERE anki_url = ? AND filename = ?'
+            ' AND digest = ? AND uploaded_at > ?',
+            (*key, time.time() - self.max_age),
+        ).fetchone()
+        if row is None:
+            return False
+        with self._lock:
+            self._uploaded.add(key)
+        return True
+
+    def record(self, anki_url: str, filename: str, digest: str) -> None:
+        key = (anki_url, filename, digest)
+        with self._lock:
+            self._uploaded.add(key)
+        with self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO uploads'
+                ' (anki_url, filename, digest, uploaded_at)'
+                ' VALUES (?, ?, ?, ?)',
+                (*key, time.time()),
+            )
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from germanki.anki_connect import AnkiCard
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+# legacy collection format, which every Anki version can import
+SCHEMA = """
+CREATE TABLE col (
+    id integer PRIMARY KEY, crt integer NOT NULL, mod integer NOT NULL,
+    scm integer NOT NULL, ver integer NOT NULL, dty integer NOT NULL,
+    usn integer NOT NULL, ls integer NOT NULL, conf text NOT NULL,
+    models text NOT NULL, decks text NOT NULL, dconf text NOT NULL,
+    tags text NOT NULL
+);
+CREATE TABLE notes (
+    id integer PRIMARY KEY, guid text NOT NULL, mid integer NOT NULL,
+    mod integer NOT NULL, usn integer NOT NULL, tags text NOT NULL,
+    flds text NOT NULL, sfld integer NOT NULL, csum integer NOT NULL,
+    flags integer NOT NULL, data text NOT NULL
+);
+CREATE TABLE cards (
+    id integer PRIMARY KEY, nid integer NOT NULL, did integer NOT NULL,
+    ord integer NOT NULL, mod integer NOT NULL, usn integer NOT NULL,
+    type integer NOT NULL, queue integer NOT NULL, due integer NOT NULL,
+    ivl integer NOT NULL, factor integer NOT NULL, reps integer NOT NULL,
+    lapses integer NOT NULL, left integer NOT NULL, odue integer NOT NULL,
+    odid integer NOT NULL, flags integer NOT NULL, data text NOT NULL
+);
+CREATE TABLE revlog (
+    id integer PRIMARY KEY, cid integer NOT NULL, usn integer NOT NULL,
+    ease integer NOT NULL, ivl integer NOT NULL, lastIvl integer NOT NULL,
+    factor integer NOT NULL, time integer NOT NULL, type integer NOT NULL
+);
+CREATE TABLE graves (
+    usn integer NOT NULL, oid integer NOT NULL, type integer NOT NULL
+);
+CREATE INDEX ix_notes_usn ON notes (usn);
+CREATE INDEX ix_cards_usn ON cards (usn);
+CREATE INDEX ix_revlog_usn ON revlog (usn);
+CREATE INDEX ix_cards_nid ON cards (nid);
+CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX ix_revlog_cid ON revlog (cid);
+CREATE INDEX ix_notes_csum ON notes (csum);
+"""
+
+DEFAULT_DECK_CONFIG = {
+    'id': 1,
+    'name': 'Default',
+    'mod': 0,
+    'usn': 0,
+    'maxTaken': 60,
+    'autoplay': True,
+    'timer': 0,
+    'replayq': True,
+    'new': {
+        'bury': True,
+        'delays': [1, 10],
+        'initialFactor': 2500,
+        'ints': [1, 4, 7],
+        'order': 1,
+        'perDay': 20,
+        'separate': True,
+    },
+    'lapse': {
+        'delays': [10],
+        'leechAction': 0,
+        'leechFails': 8,
+        'minInt': 1,
+        'mult': 0,
+    },
+    'rev': {
+        'bury': True,
+        'ease4': 1.3,
+        'fuzz': 0.05,
+        'ivlFct': 1,
+        'maxIvl': 36500,
+        'minSpace': 1,
+        'perDay': 100,
+    },
+}
+
+CARD_CSS = """.card {
+    font-family: arial;
+    font-size: 20px;
+    text-align: center;
+    color: black;
+    background-color: white;
+}
+"""
+
+
+def stable_id(text: str) -> int:
+    """Positive ID derived from `text`, stable across exports."""
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:12], 16)
+
+
+def strip_html(text: str) -> str:
+    return re.sub(r'<[^>]*>|\[sound:[^\]]*\]', '', text).strip()
+
+
+class ApkgExporter:
+    """Writes cards to an Anki package (.apkg) without a running Anki.
+
+    The package holds a collection in the legacy `collection.anki2` format,
+    with a note type that has the `Front`, `Back` and `Extra` fields used by
+    `AnkiCardCreator`, and the media files of the cards. Media files are
+    copied into the archive from disk without being loaded in memory.
+
+    IDs and note GUIDs derive from the deck, note type and card front, so
+    importing a new export of the same cards updates them instead of adding
+    duplicates.
+    """
+
+    MODEL_NAME = 'Germanki Basic'
+    FIELDS = ['Front', 'Back', 'Extra']
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        default_tags: Optional[List[str]] = None,
+    ):
+        self.model_name = model_name
+        self.default_tags = (
+            default_tags
+            if default_tags
+            else [
+                'automated',
+                datetime.now().strftime('%Y-%m-%d'),
+            ]
+        )
+
+    def write(
+        self,
+        deck_name: str,
+        anki_cards: List[AnkiCard],
+        output_path: Path,
+        tags: Optional[List[str]] = None,
+    ) -> Path:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        media = self._collect_media(anki_cards)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            collection_path = Path(tmp_dir, 'collection.anki2')
+            self._write_collection(
+                collection_path, deck_name, anki_cards, tags or []
+            )
+            # written next to the output and renamed, so a failed export
+            # does not leave a truncated package behind
+            tmp_output = output_path.with_name(f'.{output_path.name}.part')
+            try:
+                with zipfile.ZipFile(
+                    tmp_output, 'w', compression=zipfile.ZIP_DEFLATED
+                ) as package:
+                    package.write(collection_path, 'collection.anki2')
+                    media_map = {}
+                    for index, (filename, path) in enumerate(media.items()):
+                        # images and MP3s are compressed already
+                        package.write(
+                            path, str(index), compress_type=zipfile.ZIP_STORED
+                        )
+                        media_map[str(index)] = filename
+                    package.writestr('media', json.dumps(media_map))
+                tmp_output.replace(output_path)
+            except BaseException:
+                tmp_output.unlink(missing_ok=True)
+                raise
+
+        logger.info(
+            f'Exported {len(anki_cards)} cards and {len(media)} media files '
+            f'to {output_path}'
+        )
+        return output_path
+
+    @staticmethod
+    def _collect_media(anki_cards: List[AnkiCard]) -> Dict[str, Path]:
+        media: Dict[str, Path] = {}
+        for card in anki_cards:
+            for item in card.media:
+                if not item.path.exists():
+                    raise FileNotFoundError(f'File not found: {item.path}')
+                media.setdefault(item.filename, item.path)
+        return media
+
+    def _write_collection(
+        self,
+        collection_path: Path,
+        deck_name: str,
+        anki_cards: List[AnkiCard],
+        tags: List[str],
+    ) -> None:
+        now = int(time.time())
+        deck_id = stable_id(f'deck:{deck_name}')
+        model_id = stable_id(f'model:{self.model_name}')
+        note_tags = f" {' '.join(self.default_tags + tags)} "
+
+        connection = sqlite3.connect(collection_path)
+        try:
+            connection.executescript(SCHEMA)
+            connection.execute(
+                'INSERT INTO col VALUES'
+                ' (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, ?)',
+                (
+                    now,
+                    now * 1000,
+                    now * 1000,
+                    json.dumps(self._collection_config(deck_id, model_id)),
+                    json.dumps({str(model_id): self._model(model_id, now)}),
+                    json.dumps(
+                        {
+                            '1': self._deck(1, 'Default', now),
+                            str(deck_id): self._deck(deck_id, deck_name, now),
+                        }
+                    ),
+                    json.dumps({'1': DEFAULT_DECK_CONFIG}),
+                    '{}',
+                ),
+            )
+            for position, card in enumerate(anki_cards):
+                guid = stable_id(f'{deck_name}\x1f{card.front}')
+                note_id = now * 1000 + position
+                fields = [card.front, card.back, card.extra]
+                sort_field = strip_html(card.front)
+                connection.execute(
+                    'INSERT INTO notes VALUES'
+                    " (?, ?, ?, ?, -1, ?, ?, ?, ?, 0, '')",
+                    (
+                        note_id,
+                        format(guid, 'x'),
+                        model_id,
+                        now,
+                        note_tags,
+                        '\x1f'.join(fields),
+                        sort_field,
+                        int(
+                            hashlib.sha1(
+                                sort_field.encode('utf-8')
+                            ).hexdigest()[:8],
+                            16,
+                        ),
+                    ),
+                )
+                connection.execute(
+                    'INSERT INTO cards VALUES (?, ?, ?, 0, ?, -1, 0, 0, ?,'
+                    " 0, 0, 0, 0, 0, 0, 0, 0, '')",
+                    (note_id, note_id, deck_id, now, position + 1),
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _collection_config(deck_id: int, model_id: int) -> Dict[str, Any]:
+        return {
+            'activeDecks': [deck_id],
+            'curDeck': deck_id,
+            'curModel': str(model_id),
+            'nextPos': 1,
+            'newSpread': 0,
+            'collapseTime': 1200,
+            'timeLim': 0,
+            'estTimes': True,
+            'dueCounts': True,
+            'sortType': 'noteFld',
+            'sortBackwards': False,
+            'addToCur': True,
+        }
+
+    @staticmethod
+    def _deck(deck_id: int, name: str, now: int) -> Dict[str, Any]:
+        return {
+            'id': deck_id,
+            'name': name,
+            'mod': now,
+            'usn': -1,
+            'desc': '',
+            'dyn': 0,
+            'conf': 1,
+            'collapsed': False,
+            'browserCollapsed': False,
+            'extendNew': 0,
+            'extendRev': 50,
+            'newToday': [0, 0],
+            'revToday': [0, 0],
+            'lrnToday': [0, 0],
+            'timeToday': [0, 0],
+        }
+
+    def _model(self, model_id: int, now: int) -> Dict[str, Any]:
+        return {
+            'id': model_id,
+            'name': self.model_name,
+            'type': 0,
+            'mod': now,
+            'usn': -1,
+            'sortf': 0,
+            'did': None,
+            'tags': [],
+            'vers': [],
+            'css': CARD_CSS,
+            'latexPre': '',
+            'latexPost': '',
+            'latexsvg': False,
+            'req': [[0, 'any', [0]]],
+            'flds': [
+                {
+                    'name': name,
+                    'ord': ord,
+                    'sticky': False,
+                    'rtl': False,
+                    'font': 'Arial',
+                    'size': 20,
+                    'media': [],
+                }
+                for ord, name in enumerate(self.FIELDS)
+            ],
+            'tmpls': [
+                {
+                    'name': 'Card 1',
+                    'ord': 0,
+                    'qfmt': '{{Front}}',
+                    'afmt': (
+                        '{{FrontSide}}<hr id=answer>{{Back}}'
+                        '{{#Extra}}<br>{{Extra}}{{/Extra}}'
+                    ),
+                    'did': None,
+                    'bqfmt': '',
+                    'bafmt': '',
+                }
+            ],
+        }
@@ -79,16 +79,31 @@ with columns[1]:
             key='preview_chatgpt_input',
             icon='👀',
             type='primary',
+            disabled=ui.job_running,
             use_container_width=True,
         ):
-            ui.preview_cards_action(input_field)
+            ui.preview_cards_action(input_field, deck_name)
 
         if st.button(
-            'Create Cards', icon='➕', type='primary', use_container_width=True
+            'Create Cards',
+            icon='➕',
+            type='primary',
+            disabled=ui.job_running,
+            use_container_width=True,
         ):
             ui.create_cards_action(deck_name)
 
 # Preview
+# while a job runs in the background, only the preview is rerun to show its
+# progress, so the inputs stay responsive
+poll_interval = ui.JOB_POLL_INTERVAL if ui.job_running else None
+
+
+@st.fragment(run_every=poll_interval)
+def preview():
+    ui.refresh_preview(polling=poll_interval is not None)
+
+
 with columns[2]:
     with st.container(border=False):
-        ui.refresh_preview()
+        preview()
@@ -1,14 +1,28 @@
+import hashlib
 import json
 import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
 import yaml
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, OpenAI, RateLimitError
 from pydantic import BaseModel
+from tenacity import (
+    RetryCallState,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 from germanki.core import AnkiCardInfo
 from germanki.static import input_examples
+from germanki.storage import SQLiteStore
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
 
 
 class AnkiCardContentsCollection(BaseModel):
@@ -53,6 +67,109 @@ Provide all the answer in a YAML format. Here's an example of the expected outpu
 )
 
 
+_exponential_wait = wait_exponential(multiplier=1, max=30)
+
+
+def _wait_for_rate_limit(retry_state: RetryCallState) -> float:
+    """Waits as long as OpenAI asks to, falling back to exponential backoff."""
+    exception = retry_state.outcome.exception()
+    response = getattr(exception, 'response', None)
+    retry_after = (
+        response.headers.get('retry-after') if response is not None else None
+    )
+    try:
+        return min(float(retry_after), 60)
+    except (TypeError, ValueError):
+        return _exponential_wait(retry_state)
+
+
+def normalize_input_line(line: str) -> str:
+    # case is kept: in German it tells apart words such as Essen and essen
+    return ' '.join(line.split())
+
+
+class CardContentsCache(SQLiteStore):
+    """Disk cache of the cards ChatGPT generated for each input line.
+
+    Entries are keyed on the normalized line, the model, the temperature and
+    a hash of `CHATGPT_PROMPT`, so changing the prompt invalidates them. The
+    least recently used entries are evicted beyond `max_entries`.
+    """
+
+    # 2: lines are no longer lowercased
+    KEY_VERSION = 2
+
+    def __init__(self, db_path: Path, max_entries: int = 10000):
+        super().__init__(db_path)
+        self.max_entries = max_entries
+        with self._connection as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS card_contents ('
+                ' key TEXT PRIMARY KEY,'
+                ' cards TEXT NOT NULL,'
+                ' last_used REAL NOT NULL)'
+            )
+
+    @staticmethod
+    def key(line: str, model: str, temperature: float) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    CardContentsCache.KEY_VERSION,
+                    normalize_input_line(line),
+                    model,
+                    hashlib.sha256(CHATGPT_PROMPT.encode()).hexdigest(),
+                    temperature,
+                ]
+            ).encode()
+        ).hexdigest()
+
+    def get(
+        self, line: str, model: str, temperature: float
+    ) -> Optional[List[AnkiCardInfo]]:
+        key = self.key(line, model, temperature)
+        with self._connection as connection:
+            row = connection.execute(
+                'SELECT cards FROM card_contents WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                'UPDATE card_contents SET last_used = ? WHERE key = ?',
+                (time.time(), key),
+            )
+        return [AnkiCardInfo(**card) for card in json.loads(row[0])]
+
+    def put(
+        self,
+        line: str,
+        model: str,
+        temperature: float,
+        cards: List[AnkiCardInfo],
+    ) -> None:
+        with self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO card_contents (key, cards, last_used)'
+                ' VALUES (?, ?, ?)',
+                (
+                    self.key(line, model, temperature),
+                    json.dumps([card.model_dump() for card in cards]),
+                    time.time(),
+                ),
+            )
+            connection.execute(
+                'DELETE FROM card_contents WHERE key IN ('
+                ' SELECT key FROM card_contents'
+                ' ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM card_contents'
+        ).fetchone()[0]
+
+
 class ChatGPTAPI:
     def __init__(
         self,
@@ -60,13 +177,114 @@ class ChatGPTAPI:
         model='gpt-4o-mini',
         max_tokens_per_query: int = 500,
         temperature: int = 0,
+        lines_per_chunk: int = 10,
+        max_workers: int = 4,
+        cache: Optional[CardContentsCache] = None,
     ):
-        self.client = OpenAI(api_key=openai_api_key)
+        # retries are handled by ChatGPTAPI._complete
+        self.client = OpenAI(api_key=openai_api_key, max_retries=0)
         self.model = model
         self.max_tokens_per_query = max_tokens_per_query
         self.temperature = temperature
+        self.lines_per_chunk = lines_per_chunk
+        self.max_workers = max_workers
+        self.cache = cache
 
     def query(self, prompt) -> AnkiCardContentsCollection:
+        """Generates card contents for each line of `prompt`.
+
+        Lines found in the cache are not sent to ChatGPT. The remaining ones
+        are split into chunks of `lines_per_chunk` lines that are sent
+        concurrently. Cards are returned in input order.
+        """
+        lines = [line.strip() for line in prompt.splitlines() if line.strip()]
+        cards_by_line = {
+            line: self.cache.get(line, self.model, self.temperature)
+            if self.cache is not None
+            else None
+            for line in lines
+        }
+        uncached_lines = list(
+            dict.fromkeys(
+                line for line in lines if cards_by_line[line] is None
+            )
+        )
+        chunks = [
+            uncached_lines[start : start + self.lines_per_chunk]
+            for start in range(0, len(uncached_lines), self.lines_per_chunk)
+        ]
+        if len(lines) > len(uncached_lines):
+            logger.info(
+                f'{len(lines) - len(uncached_lines)} of {len(lines)} lines '
+                'found in the ChatGPT cache'
+            )
+        if len(chunks) > 1:
+            logger.info(
+                f'Querying ChatGPT with {len(lines)} lines '
+                f'in {len(chunks)} chunks'
+            )
+
+        # each chunk is cached as soon as it is done, so when another chunk
+        # fails, the chunks already paid for are not queried again
+        error: Optional[Exception] = None
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_workers, len(chunks)))
+        ) as executor:
+            futures = {
+                executor.submit(self._query_lines, chunk): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                try:
+                    chunk_cards = future.result()
+                except Exception as e:
+                    logger.warning(f'ChatGPT query of a chunk failed: {e}')
+                    error = error or e
+                    continue
+                for line, cards in zip(futures[future], chunk_cards):
+                    cards_by_line[line] = cards
+                    if self.cache is not None and cards:
+                        self.cache.put(
+                            line, self.model, self.temperature, cards
+                        )
+        if error is not None:
+            raise error
+
+        return AnkiCardContentsCollection(
+            card_contents=[
+                card.model_copy(deep=True)
+                for line in lines
+                for card in cards_by_line[line]
+            ]
+        )
+
+    def _query_lines(self, lines: List[str]) -> List[List[AnkiCardInfo]]:
+        """Queries one chunk and groups its cards by the line they came from."""
+        line_indexes = {
+            normalize_input_line(line): index
+            for index, line in enumerate(lines)
+        }
+        grouped_cards: List[List[AnkiCardInfo]] = [[] for _ in lines]
+
+        line_index = 0
+        for card in self._complete('\n'.join(lines))['card_contents']:
+            # cards whose input was not echoed back verbatim stay next to
+            # the card that precedes them
+            line_index = line_indexes.get(
+                normalize_input_line(card.get('input', '')), line_index
+            )
+            grouped_cards[line_index].append(AnkiCardInfo(**card))
+        return grouped_cards
+
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=_wait_for_rate_limit,
+        retry=retry_if_exception_type(
+            (RateLimitError, APITimeoutError, APIConnectionError)
+        ),
+        reraise=True,
+    )
+    def _complete(self, prompt: str) -> Dict[str, Any]:
         completion = self.client.chat.completions.create(
             model=self.model,
             messages=[
@@ -92,6 +310,7 @@ class ChatGPTAPI:
                                 'items': {
                                     'type': 'object',
                                     'required': [
+                                        'input',
                                         'word',
                                         'definition',
                                         'translations',
@@ -101,6 +320,10 @@ class ChatGPTAPI:
                                     ],
                                     'additionalProperties': False,
                                     'properties': {
+                                        'input': {
+                                            'description': 'The input line that generated this card, copied exactly as provided',
+                                            'type': 'string',
+                                        },
                                         'word': {
                                             'description': 'Word provided by the user with extra information, when it applies (case, preposition, "sich")',
                                             'type': 'string',
@@ -143,6 +366,4 @@ class ChatGPTAPI:
             },
         )
 
-        return AnkiCardContentsCollection(
-            **json.loads(completion.choices[0].message.content)
-        )
+        return json.loads(completion.choices[0].message.content)
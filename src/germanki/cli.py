@@ -0,0 +1,449 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO
+
+import yaml
+from pydantic import ValidationError
+
+from germanki.anki_connect import AnkiConnectError
+from germanki.config import Config, TTSSpeaker
+from germanki.core import (
+    AnkiCardInfo,
+    CreateCardResponse,
+    Germanki,
+    MediaUpdateException,
+    MediaUpdateExceptions,
+)
+from germanki.jobs import ImportJob, JobJournal, job_id_for
+from germanki.photos import PhotosClient
+from germanki.photos.fallback import FallbackPhotosClient
+from germanki.photos.pexels import PexelsClient
+from germanki.photos.unsplash import UnsplashClient
+from germanki.transport import HTTPTransport, default_transport
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+DEFAULT_DECK_NAME = 'Germanki Deck'
+PHOTO_SOURCES = ('pexels', 'unsplash', 'auto')
+INPUT_FORMATS = ('auto', 'words', 'yaml')
+
+
+class CLIError(Exception):
+    pass
+
+
+def run_ui() -> int:
+    return subprocess.call(
+        [
+            sys.executable,
+            '-m',
+            'streamlit',
+            'run',
+            '--server.enableStaticServing',
+            'true',
+            'app.py',
+        ],
+        cwd=Path(__file__).parent,
+    )
+
+
+def read_inputs(paths: List[str]) -> List[str]:
+    """Reads each input file, `-` standing for stdin."""
+    return [
+        sys.stdin.read() if path == '-' else Path(path).read_text()
+        for path in paths
+    ]
+
+
+def detect_format(path: str, text: str) -> str:
+    if Path(path).suffix in ('.yaml', '.yml'):
+        return 'yaml'
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError:
+        return 'words'
+    # a YAML card list is a list of mappings, a word list a plain string
+    if isinstance(data, list) and all(isinstance(i, dict) for i in data):
+        return 'yaml'
+    return 'words'
+
+
+def parse_yaml_cards(text: str) -> List[AnkiCardInfo]:
+    """Parses cards in the format of the UI's manual input."""
+    try:
+        cards = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise CLIError(f'Invalid YAML input: {e}')
+    if not cards:
+        return []
+    if not isinstance(cards, list):
+        raise CLIError('YAML input must be a list of cards.')
+    card_contents = []
+    for index, card in enumerate(cards, start=1):
+        if not isinstance(card, dict):
+            raise CLIError(
+                f'Card {index} must be a mapping of card fields, '
+                f'not {card!r}.'
+            )
+        try:
+            card_contents.append(AnkiCardInfo(**card))
+        except ValidationError as e:
+            raise CLIError(f'Invalid card {index}: {e}')
+    return card_contents
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, not {value}')
+    return number
+
+
+def parse_word_lists(texts: List[str], config: Config, workers: int):
+    # imported here so YAML-only runs do not need the OpenAI client
+    from germanki.chatgpt import CardContentsCache, ChatGPTAPI
+
+    if not config.openai_api_key:
+        raise CLIError(
+            'Set OPENAI_API_KEY to generate cards from a list of words.'
+        )
+    chatgpt_api = ChatGPTAPI(
+        config.openai_api_key,
+        max_workers=workers,
+        cache=CardContentsCache(config.cache_filepath('chatgpt.sqlite3')),
+    )
+    lines = [line for text in texts for line in text.splitlines()]
+    if not any(line.strip() for line in lines):
+        return []
+    return chatgpt_api.query('\n'.join(lines)).card_contents
+
+
+def parse_cards(
+    paths: List[str],
+    texts: List[str],
+    input_format: str,
+    config: Config,
+    workers: int,
+) -> List[AnkiCardInfo]:
+    cards: List[AnkiCardInfo] = []
+    word_lists = []
+    for path, text in zip(paths, texts):
+        text_format = (
+            detect_format(path, text)
+            if input_format == 'auto'
+            else input_format
+        )
+        if text_format == 'yaml':
+            cards.extend(parse_yaml_cards(text))
+        else:
+            word_lists.append(text)
+    if word_lists:
+        cards.extend(parse_word_lists(word_lists, config, workers))
+    return cards
+
+
+def create_photos_client(
+    photo_source: str, config: Config, transport: HTTPTransport
+) -> PhotosClient:
+    clients = []
+    if photo_source in ('pexels', 'auto') and config.pexels_api_key:
+        clients.append(
+            PexelsClient(
+                config.pexels_api_key,
+                transport=transport,
+                image_size=config.image_size,
+            )
+        )
+    if photo_source in ('unsplash', 'auto') and config.unsplash_api_key:
+        clients.append(
+            UnsplashClient(
+                config.unsplash_api_key,
+                transport=transport,
+                image_size=config.image_size,
+            )
+        )
+    if not clients:
+        raise CLIError(
+            f'No API key for photo source {photo_source}. '
+            'Set PEXELS_API_KEY or UNSPLASH_API_KEY.'
+        )
+    if len(clients) == 1:
+        return clients[0]
+    return FallbackPhotosClient(
+        clients,
+        hedge_after=2.0,
+        transport=transport,
+        image_size=config.image_size,
+    )
+
+
+def print_progress(stream: TextIO):
+    def progress(done: int, total: int) -> None:
+        end = '\n' if done == total else ''
+        stream.write(f'\rFetching media: {done}/{total} cards{end}')
+        stream.flush()
+
+    return progress
+
+
+def card_report(
+    card: AnkiCardInfo,
+    status: str,
+    error: Optional[str] = None,
+    media_errors: Optional[List[Dict[str, str]]] = None,
+) -> Dict[str, Any]:
+    return {
+        'word': card.word,
+        'status': status,
+        'image': card.translation_image_url,
+        'audio': card.word_audio_url,
+        'error': error,
+        'media_errors': media_errors or [],
+    }
+
+
+def media_error_report(exception: MediaUpdateException) -> Dict[str, str]:
+    return {
+        'media': exception.media_type,
+        'query': exception.query,
+        'error': str(exception.exception),
+    }
+
+
+def build_job_id(args: argparse.Namespace, texts: List[str]) -> str:
+    if args.job:
+        return args.job
+    # notes added through AnkiConnect are part of the job state, while a
+    # package always holds every card
+    target = 'apkg' if args.apkg else 'anki'
+    return job_id_for(
+        args.deck,
+        args.format,
+        args.speaker or '',
+        args.photo_source,
+        target,
+        *texts,
+    )
+
+
+def build(args: argparse.Namespace) -> Dict[str, Any]:
+    config = Config(
+        media_workers=args.workers,
+        skip_existing_cards=not args.include_existing,
+    )
+    paths = args.inputs if args.inputs else ['-']
+    texts = read_inputs(paths)
+    transport = default_transport()
+    germanki = Germanki(
+        create_photos_client(args.photo_source, config, transport),
+        config=config,
+        transport=transport,
+    )
+    if args.speaker:
+        germanki.selected_speaker = args.speaker
+
+    journal = JobJournal(config.cache_filepath('jobs.sqlite3'))
+    job_id = build_job_id(args, texts)
+    if args.restart:
+        journal.delete(job_id)
+    job = ImportJob(germanki, journal, job_id)
+    cards = job.parse(
+        lambda: parse_cards(
+            paths, texts, args.format, config, args.chatgpt_workers
+        )
+    )
+    logger.info(f'Parsed {len(cards)} cards for job {job_id}')
+    created_cards = job.created_cards()
+
+    progress = print_progress(sys.stderr) if args.progress else None
+    # media errors of each card, by card identity
+    media_errors: Dict[int, List[Dict[str, str]]] = {}
+
+    def on_card(index: int, exceptions: List[MediaUpdateException]):
+        if exceptions:
+            media_errors[id(germanki.card_contents[index])] = [
+                media_error_report(exception) for exception in exceptions
+            ]
+
+    def fetched_card_report(
+        card: AnkiCardInfo, status: str, error: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return card_report(card, status, error, media_errors.get(id(card)))
+
+    try:
+        job.fetch_media(
+            # an .apkg export does not need Anki to be running
+            deck_name=None if args.no_export or args.apkg else args.deck,
+            progress=progress,
+            on_card=on_card,
+        )
+    except MediaUpdateExceptions as e:
+        # cards are still exported, without the media that failed
+        logger.warning(f'Could not fetch media for {len(e.exceptions)} items')
+
+    reports = [card_report(card, 'added') for card in created_cards]
+    reports += [
+        card_report(card, 'skipped') for card in germanki.skipped_cards
+    ]
+    if args.no_export:
+        reports += [
+            fetched_card_report(card, 'enriched')
+            for card in germanki.card_contents
+        ]
+    elif args.apkg:
+        germanki.export_apkg(args.deck, Path(args.apkg))
+        reports += [
+            fetched_card_report(card, 'added')
+            for card in germanki.card_contents
+        ]
+    else:
+        try:
+            responses = job.create_cards(args.deck)
+        except AnkiConnectError as e:
+            # batches added before the error are recorded in the job
+            responses = [
+                CreateCardResponse(
+                    card_word=card.word,
+                    exception=None if job.note_created(card) else e,
+                )
+                for card in germanki.card_contents
+            ]
+        for card, response in zip(germanki.card_contents, responses):
+            if response.exception is None:
+                reports.append(fetched_card_report(card, 'added'))
+            else:
+                reports.append(
+                    fetched_card_report(
+                        card, 'failed', str(response.exception)
+                    )
+                )
+
+    summary = {'total': len(reports)}
+    for status in ('added', 'enriched', 'skipped', 'failed'):
+        summary[status] = sum(r['status'] == status for r in reports)
+    summary['media_failed'] = sum(bool(r['media_errors']) for r in reports)
+    return {
+        'job': job_id,
+        'deck': args.deck,
+        'exported': not args.no_export,
+        'apkg': args.apkg,
+        'summary': summary,
+        'cards': reports,
+    }
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='germanki',
+        description='Create Anki cards for German words.',
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('ui', help='Open the web interface (default)')
+
+    build_parser = subparsers.add_parser(
+        'build',
+        help='Create cards without the web interface',
+        description=(
+            'Parse word lists or YAML cards, fetch their images and audio '
+            'and add them to an Anki deck through AnkiConnect.'
+        ),
+    )
+    build_parser.add_argument(
+        'inputs',
+        nargs='*',
+        metavar='INPUT',
+        help=(
+            'Files with one word per line, or YAML cards as in the manual '
+            'input of the web interface. Reads stdin by default or for "-".'
+        ),
+    )
+    build_parser.add_argument(
+        '--format',
+        choices=INPUT_FORMATS,
+        default='auto',
+        help='Input format, detected from each input by default',
+    )
+    build_parser.add_argument('--deck', default=DEFAULT_DECK_NAME)
+    build_parser.add_argument(
+        '--speaker', choices=[speaker.value for speaker in TTSSpeaker]
+    )
+    build_parser.add_argument(
+        '--photo-source', choices=PHOTO_SOURCES, default='auto'
+    )
+    build_parser.add_argument(
+        '--workers',
+        type=positive_int,
+        default=Config().media_workers,
+        help='Cards whose media is fetched concurrently',
+    )
+    build_parser.add_argument(
+        '--chatgpt-workers',
+        type=positive_int,
+        default=4,
+        help='Concurrent ChatGPT requests for word lists',
+    )
+    build_parser.add_argument(
+        '--include-existing',
+        action='store_true',
+        help='Also create cards for words already in the deck',
+    )
+    build_parser.add_argument(
+        '--no-export',
+        action='store_true',
+        help='Only fetch the media, without adding cards to Anki',
+    )
+    build_parser.add_argument(
+        '--apkg',
+        metavar='PATH',
+        help='Write the deck to an Anki package instead of using AnkiConnect',
+    )
+    build_parser.add_argument(
+        '--job',
+        metavar='ID',
+        help=(
+            'Name of the job to resume. By default, running the same inputs '
+            'and options again resumes their job.'
+        ),
+    )
+    build_parser.add_argument(
+        '--restart',
+        action='store_true',
+        help='Start the job over instead of resuming it',
+    )
+    build_parser.add_argument(
+        '--progress',
+        action=argparse.BooleanOptionalAction,
+        default=sys.stderr.isatty(),
+        help='Show progress on stderr',
+    )
+    build_parser.add_argument(
+        '--report',
+        default='-',
+        help='File for the JSON report of each card, stdout by default',
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    if args.command in (None, 'ui'):
+        return run_ui()
+
+    try:
+        report = build(args)
+    except CLIError as e:
+        parser.exit(2, f'germanki: error: {e}\n')
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.report == '-':
+        print(output)
+    else:
+        Path(args.report).write_text(output + '\n')
+    summary = report['summary']
+    # cards added without some of their media also need attention
+    return 1 if summary['failed'] or summary['media_failed'] else 0
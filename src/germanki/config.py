@@ -22,6 +22,12 @@ class AudioPosition(Enum):
     NONE = 'none'
 
 
+class ImageSize(Enum):
+    SMALL = 'small'
+    MEDIUM = 'medium'
+    LARGE = 'large'
+
+
 class TTSSpeaker(Enum):
     VICKI = 'Vicki'
     MARLENE = 'Marlene'
@@ -44,14 +50,66 @@ class Config:
     )
     audio_downloads_folder: Path = Field(default=Path(audio.__file__).parent)
     image_downloads_folder: Path = Field(default=Path(image.__file__).parent)
+    media_index_path: Path = Field(
+        default=Path(image.__file__).parent.parent / 'media.sqlite3',
+        description='SQLite index mapping media queries to stored files',
+    )
+    cache_folder: Path = Field(
+        default=Path(
+            os.environ.get(
+                'GERMANKI_CACHE_DIR', Path.home() / '.cache' / 'germanki'
+            )
+        ),
+        description='Folder for local caches such as ChatGPT responses',
+    )
     enable_extra: bool = Field(default=True)
     image_position: ImagePosition = Field(default=ImagePosition.BACK)
     audio_position: AudioPosition = Field(default=AudioPosition.FRONT)
     speakers: List[TTSSpeaker] = Field(default=list(TTSSpeaker))
     default_speaker: TTSSpeaker = Field(default=TTSSpeaker.VICKI)
+    image_size: ImageSize = Field(
+        default=ImageSize(os.environ.get('GERMANKI_IMAGE_SIZE', 'medium')),
+        description='Size of the images requested from photo providers',
+    )
+    image_max_dimension: int = Field(
+        default=int(os.environ.get('GERMANKI_IMAGE_MAX_DIMENSION', 1024)),
+        ge=0,
+        description=(
+            'Downloaded images larger than this many pixels are downscaled '
+            'and recompressed before being stored. 0 disables it.'
+        ),
+    )
+    image_quality: int = Field(
+        default=int(os.environ.get('GERMANKI_IMAGE_QUALITY', 85)),
+        ge=1,
+        le=95,
+        description='JPEG quality of downscaled images',
+    )
+    max_download_size: int = Field(
+        default=int(
+            os.environ.get('GERMANKI_MAX_DOWNLOAD_SIZE', 20 * 1024 * 1024)
+        ),
+        ge=1,
+        description='Largest media file, in bytes, that is downloaded',
+    )
+    skip_existing_cards: bool = Field(
+        default=os.environ.get('GERMANKI_SKIP_EXISTING_CARDS', '1') != '0',
+        description=(
+            'Leave out cards whose word is already in the target deck '
+            'before fetching their media'
+        ),
+    )
+    media_workers: int = Field(
+        default=int(os.environ.get('GERMANKI_MEDIA_WORKERS', 8)),
+        ge=1,
+        description='Number of cards whose media is fetched concurrently',
+    )
 
     def audio_filepath(self, filename: str) -> Path:
         return self.audio_downloads_folder / filename
 
     def image_filepath(self, filename: str) -> Path:
         return self.image_downloads_folder / filename
+
+    def cache_filepath(self, filename: str) -> Path:
+        return self.cache_folder / filename
@@ -1,24 +1,31 @@
 import base64
 import os
 import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from enum import Enum
 from pathlib import Path
-from random import randint
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 
-import requests
 from pydantic import BaseModel, ConfigDict, Field
 
 import germanki
 from germanki.anki_connect import (
     AnkiCard,
     AnkiConnectClient,
-    AnkiConnectResponseError,
+    AnkiConnectError,
     AnkiMedia,
     AnkiMediaType,
 )
+from germanki.apkg import ApkgExporter
 from germanki.config import Config
-from germanki.photos import PhotosClient, SearchResponse
-from germanki.photos.exceptions import PhotosNotFoundError
+from germanki.images import downscale_image_file
+from germanki.media_store import MediaKind, MediaStore, sanitize_query
+from germanki.photos import PhotosClient
+from germanki.photos.stats import QueryStatistics
+from germanki.singleflight import SingleFlight
+from germanki.transport import HTTPTransport, default_transport
 from germanki.tts_mp3 import TTSAPI
 from germanki.utils import get_logger
 
@@ -52,6 +59,10 @@ class MediaUpdateExceptions(Exception):
         self.exceptions = exceptions
 
 
+def _is_file(path: Optional[str]) -> bool:
+    return bool(path) and Path(path).is_file()
+
+
 class AnkiCardInfo(BaseModel):
     # front
     word: str
@@ -84,25 +95,95 @@ class AnkiCardHTMLPreview(AnkiCard):
 class CreateCardResponse(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     card_word: str
-    exception: Optional[AnkiConnectResponseError] = None
+    exception: Optional[AnkiConnectError] = None
+
+
+class AudioRenderMode(Enum):
+    # reference to the media file uploaded to Anki
+    SOUND_TAG = 'sound_tag'
+    # whole file embedded as a data URI, only meant for previews
+    INLINE = 'inline'
+
+
+class PreviewCache:
+    """LRU cache of rendered card previews.
+
+    Entries are keyed on the card contents, which include the paths of its
+    media files. Media files are named after their contents, so a key also
+    identifies the exact image and audio that were rendered.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._previews: OrderedDict[
+            Tuple[str, ...], AnkiCardHTMLPreview
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(card_contents: AnkiCardInfo) -> Tuple[str, ...]:
+        return (
+            card_contents.model_dump_json(),
+            os.getenv('STREAMLIT_SERVER_ADDRESS', 'localhost'),
+            os.getenv('STREAMLIT_SERVER_PORT', '8501'),
+        )
+
+    def get(
+        self, card_contents: AnkiCardInfo
+    ) -> Optional[AnkiCardHTMLPreview]:
+        key = self.key(card_contents)
+        with self._lock:
+            preview = self._previews.get(key)
+            if preview is not None:
+                self._previews.move_to_end(key)
+            return preview
+
+    def put(
+        self, card_contents: AnkiCardInfo, preview: AnkiCardHTMLPreview
+    ) -> None:
+        key = self.key(card_contents)
+        with self._lock:
+            self._previews[key] = preview
+            self._previews.move_to_end(key)
+            while len(self._previews) > self.maxsize:
+                self._previews.popitem(last=False)
+
+    def invalidate(self, card_contents: AnkiCardInfo) -> None:
+        with self._lock:
+            self._previews.pop(self.key(card_contents), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._previews.clear()
+
+    def __len__(self) -> int:
+        return len(self._previews)
 
 
 class AnkiCardCreator:
+    preview_cache = PreviewCache()
+
     @staticmethod
     def front(
         card_contents: AnkiCardInfo,
         audio: AnkiMedia,
         autoplay: bool = True,
         style: str = '',
+        audio_mode: AudioRenderMode = AudioRenderMode.SOUND_TAG,
     ) -> str:
+        if not audio:
+            return f'{card_contents.word}<br>'
+
+        if audio_mode == AudioRenderMode.SOUND_TAG:
+            return f'{card_contents.word}<br>[sound:{audio.filename}]'
+
         autoplay_controls = 'autoplay' if autoplay else ''
-        b64_audio = Path(audio.path).read_text()
-        return f'{card_contents.word}<br>' + (
+        b64_audio = base64.b64encode(Path(audio.path).read_bytes()).decode()
+        return (
+            f'{card_contents.word}<br>'
             f'<audio controls {autoplay_controls} style="{style}">'
             f'<source src="data:audio/mp3;base64,{b64_audio}" type="audio/mp3">'
             '</audio>'
-            if audio
-            else ''
         )
 
     @staticmethod
@@ -160,6 +241,20 @@ class AnkiCardCreator:
 
     @staticmethod
     def html_preview(card_contents: AnkiCardInfo) -> AnkiCardHTMLPreview:
+        # background jobs update cards while the preview is drawn, so the
+        # preview is rendered and cached from a snapshot of the card: the
+        # key then always matches what was rendered
+        snapshot = card_contents.model_copy(deep=True)
+        preview = AnkiCardCreator.preview_cache.get(snapshot)
+        if preview is None:
+            preview = AnkiCardCreator._render_html_preview(snapshot)
+            AnkiCardCreator.preview_cache.put(snapshot, preview)
+        return preview
+
+    @staticmethod
+    def _render_html_preview(
+        card_contents: AnkiCardInfo,
+    ) -> AnkiCardHTMLPreview:
         audio = None
         image = None
         image_path = None
@@ -183,6 +278,7 @@ class AnkiCardCreator:
                 audio,
                 autoplay=False,
                 style='width: 100%;',
+                audio_mode=AudioRenderMode.INLINE,
             ),
             back=AnkiCardCreator.back(
                 card_contents,
@@ -195,8 +291,13 @@ class AnkiCardCreator:
 
 class MP3Downloader:
     @staticmethod
-    def download_mp3(msg: str, lang: str, file_path: Path) -> None:
-        tts_api = TTSAPI()
+    def download_mp3(
+        msg: str,
+        lang: str,
+        file_path: Path,
+        transport: Optional[HTTPTransport] = None,
+    ) -> None:
+        tts_api = TTSAPI(transport=transport)
         tts_response = tts_api.request_tts(msg=msg, lang=lang)
         if tts_response.success:
             if tts_api.download_mp3(
@@ -212,16 +313,37 @@ class MP3Downloader:
 class Germanki:
     _selected_speaker: str
     _card_contents: List[AnkiCardInfo]
+    skipped_cards: List[AnkiCardInfo]
 
     def __init__(
         self,
         photos_client: PhotosClient,
         config: Config = Config(),
+        transport: Optional[HTTPTransport] = None,
     ):
-        self.photos_client = photos_client
         self.config = config
+        self.transport = transport if transport else default_transport()
+        self.query_stats = QueryStatistics(
+            config.cache_filepath('photo_queries.sqlite3')
+        )
+        # a single client keeps its deck names cached between exports. No
+        # upload ledger is needed: media store files are content-addressed,
+        # so Anki's file names alone tell which media it already has.
+        self.anki_client = AnkiConnectClient(transport=self.transport)
+        self.photos_client = photos_client
+        self.media_store = MediaStore(
+            index_path=config.media_index_path,
+            folders={
+                MediaKind.IMAGE: config.image_downloads_folder,
+                MediaKind.AUDIO: config.audio_downloads_folder,
+            },
+        )
+        # cards sharing a query word or a spoken word fetch its media once
+        self._image_flights = SingleFlight()
+        self._audio_flights = SingleFlight()
         self.selected_speaker = self.default_speaker
         self._card_contents = []
+        self.skipped_cards = []
 
     @property
     def card_contents(self) -> List[AnkiCardInfo]:
@@ -230,34 +352,130 @@ class Germanki:
     @card_contents.setter
     def card_contents(self, card_contents: List[AnkiCardInfo]):
         self._card_contents = card_contents
+        self._update_media()
 
-        logger.info(f'Updating media for {len(self._card_contents)} cards')
-        exceptions = []
-        for index in range(len(card_contents)):
-            try:
-                self.update_card_image(index)
-            except MediaUpdateException as e:
-                exceptions.append(e)
-                logger.info(
-                    f'Card image update with query {e.query} failed. Exception: {e.exception}'
-                )
-
-            try:
-                self.update_card_audio(index)
-            except MediaUpdateException as e:
-                exceptions.append(e)
-                logger.info(
-                    f'Card audio update with query {e.query} failed. Exception: {e.exception}'
-                )
-
+    def _update_media(
+        self,
+        progress: Optional[Callable[[int, int], None]] = None,
+        keep_media: bool = False,
+        on_card: Optional[
+            Callable[[int, List[MediaUpdateException]], None]
+        ] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> None:
+        card_contents = self._card_contents
+        logger.info(
+            f'Updating media for {len(self._card_contents)} cards '
+            f'with {self.config.media_workers} workers'
+        )
+        with ThreadPoolExecutor(
+            max_workers=self.config.media_workers
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self._update_card_media, index, keep_media, cancelled
+                ): index
+                for index in range(len(card_contents))
+            }
+            # callbacks run as soon as each card is done, so callers can
+            # show the first cards while the others are still fetched
+            done = 0
+            for future in as_completed(futures):
+                card_exceptions = future.result()
+                if card_exceptions is None:
+                    continue
+                done += 1
+                if on_card is not None:
+                    on_card(futures[future], card_exceptions)
+                if progress is not None:
+                    progress(done, len(card_contents))
+
+        # exceptions are collected in card order, so they are deterministic
+        # regardless of completion order
+        exceptions = [
+            exception
+            for future in futures
+            for exception in future.result() or []
+        ]
         if len(exceptions) > 0:
             logger.info(f'Media update raised {len(exceptions)} exceptions')
             raise MediaUpdateExceptions(exceptions=exceptions)
 
+        if cancelled is not None and cancelled.is_set():
+            logger.info(f'Media update cancelled after {done} cards')
+            return
         logger.info(
             f'Media successfully updated for {len(self._card_contents)} cards'
         )
 
+    def preview_cards(
+        self,
+        card_contents: List[AnkiCardInfo],
+        deck_name: Optional[str] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+        keep_media: bool = False,
+        on_card: Optional[
+            Callable[[int, List[MediaUpdateException]], None]
+        ] = None,
+        cancelled: Optional[threading.Event] = None,
+        on_start: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Sets the cards to preview, leaving out those already in the deck.
+
+        Cards are checked against the deck before their media is fetched, so
+        repeated imports skip the expensive work for known words. `on_start`
+        is called with the number of cards left once they are checked.
+        `progress` is called with the number of cards done and the total as
+        their media is fetched, and `on_card` with the index of each card in
+        the `card_contents` property and its media errors, in completion
+        order.
+        With `keep_media`, media files the cards already point to are kept
+        instead of fetched again. Once `cancelled` is set, the cards not
+        started yet are left without media and without callbacks.
+        """
+        self.skipped_cards = []
+        if deck_name and self.config.skip_existing_cards:
+            card_contents = self._remove_existing_cards(
+                card_contents, deck_name
+            )
+        self._card_contents = card_contents
+        if on_start is not None:
+            on_start(len(card_contents))
+        self._update_media(progress, keep_media, on_card, cancelled)
+
+    def _remove_existing_cards(
+        self, card_contents: List[AnkiCardInfo], deck_name: str
+    ) -> List[AnkiCardInfo]:
+        try:
+            existing = self.anki_client.find_existing_words(
+                deck_name, [card.word for card in card_contents]
+            )
+        except AnkiConnectError as e:
+            logger.warning(f'Could not look up existing cards in Anki: {e}')
+            return card_contents
+
+        self.skipped_cards = [
+            card for card, exists in zip(card_contents, existing) if exists
+        ]
+        if self.skipped_cards:
+            logger.info(
+                f'Skipping {len(self.skipped_cards)} cards already in '
+                f'deck {deck_name}'
+            )
+        return [
+            card for card, exists in zip(card_contents, existing) if not exists
+        ]
+
+    @property
+    def photos_client(self) -> PhotosClient:
+        return self._photos_client
+
+    @photos_client.setter
+    def photos_client(self, photos_client: PhotosClient):
+        if photos_client.query_stats is None:
+            photos_client.query_stats = self.query_stats
+        self._photos_client = photos_client
+
     @property
     def speakers(self) -> List[str]:
         return [speaker.value for speaker in self.config.speakers]
@@ -276,13 +494,49 @@ class Germanki:
             raise ValueError('Invalid speaker.')
         self._selected_speaker = speaker
 
+    def _update_card_media(
+        self,
+        index: int,
+        keep_media: bool = False,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Optional[List[MediaUpdateException]]:
+        if cancelled is not None and cancelled.is_set():
+            return None
+        card = self._card_contents[index]
+        exceptions = []
+        try:
+            if not (keep_media and _is_file(card.translation_image_url)):
+                self.update_card_image(index)
+        except ImageUpdateException as e:
+            exception = MediaUpdateException(
+                query=', '.join(e.query_words),
+                media_type='image',
+                exception=e,
+            )
+            exceptions.append(exception)
+            logger.info(
+                f'Card image update with query {exception.query} failed. Exception: {e.exceptions}'
+            )
+
+        try:
+            if not (keep_media and _is_file(card.word_audio_url)):
+                self.update_card_audio(index)
+        except MediaUpdateException as e:
+            exceptions.append(e)
+            logger.info(
+                f'Card audio update with query {e.query} failed. Exception: {e.exception}'
+            )
+        return exceptions
+
     def update_card_image(self, index: int) -> None:
         card = self._card_contents[index]
         exceptions = []
 
         for i, query_word in enumerate(card.query_words):
             try:
-                card.translation_image_url = self._get_image(query_word)
+                image_path = self._get_image(query_word)
+                AnkiCardCreator.preview_cache.invalidate(card)
+                card.translation_image_url = str(image_path)
                 logger.debug(
                     f'Card image successfully updated with query {query_word}'
                 )
@@ -302,7 +556,7 @@ class Germanki:
     def update_card_audio(self, index: int) -> None:
         card = self._card_contents[index]
         try:
-            card.word_audio_url = self._get_tts_audio(card.word)
+            audio_path = self._get_tts_audio(card.word)
         except Exception as e:
             logger.debug(
                 f'Could not update card audio with query {card.word}. Error: {e}'
@@ -310,101 +564,112 @@ class Germanki:
             raise MediaUpdateException(
                 query=card.word, media_type='audio', exception=e
             )
+        AnkiCardCreator.preview_cache.invalidate(card)
+        card.word_audio_url = str(audio_path)
 
-    def create_cards(self, deck_name: str) -> List[CreateCardResponse]:
-        responses = []
-        anki_client = AnkiConnectClient()
-        for card_contents in self._card_contents:
-            card = AnkiCardCreator.create(card_contents)
-            response = CreateCardResponse(card_word=card_contents.word)
-            try:
-                self._create_card(
-                    deck_name=deck_name,
-                    anki_client=anki_client,
-                    anki_card=card,
-                )
-            except AnkiConnectResponseError as e:
-                response.exception = e
-
-            responses.append(response)
-        return responses
-
-    def _create_card(
+    def create_cards(
         self,
         deck_name: str,
-        anki_client: AnkiConnectClient,
-        anki_card: AnkiCardInfo,
-    ):
-        anki_client.add_card(
-            deck_name=deck_name,
-            anki_card=anki_card,
+        card_contents: Optional[List[AnkiCardInfo]] = None,
+    ) -> List[CreateCardResponse]:
+        """Adds the cards to Anki, by default all the previewed cards."""
+        if card_contents is None:
+            card_contents = self._card_contents
+        cards = [AnkiCardCreator.create(card) for card in card_contents]
+        errors = self.anki_client.add_cards(
+            deck_name=deck_name, anki_cards=cards
+        )
+        return [
+            CreateCardResponse(card_word=card.word, exception=error)
+            for card, error in zip(card_contents, errors)
+        ]
+
+    def export_apkg(self, deck_name: str, output_path: Path) -> Path:
+        """Writes the cards to an Anki package, without AnkiConnect."""
+        cards = [
+            AnkiCardCreator.create(card_contents)
+            for card_contents in self._card_contents
+        ]
+        return ApkgExporter().write(
+            deck_name=deck_name, anki_cards=cards, output_path=output_path
         )
 
-    def _get_image(self, query: str, max_pages: int = 100) -> Optional[Path]:
-        page = randint(1, max_pages)
-        image_path = self.config.image_filepath(
-            Germanki.convert_query_to_filename(f'{query}_{page}', ext='jpg')
+    def _get_image(self, query: str) -> Optional[Path]:
+        photos_client = self.photos_client
+        return self._image_flights.do(
+            (query, photos_client.media_source),
+            lambda: self._fetch_image(query, photos_client),
         )
-        if image_path.exists():
+
+    def _fetch_image(
+        self, query: str, photos_client: PhotosClient
+    ) -> Optional[Path]:
+        # images are stored by their rank in the search results. The rank
+        # is picked among the results known to exist for the query, so an
+        # image that was already downloaded costs no API call at all.
+        source = photos_client.media_source
+        rank = photos_client.random_rank(query)
+        image_path = self.media_store.lookup(
+            MediaKind.IMAGE, query, source, rank
+        )
+        if image_path:
             logger.debug(f'image already exists: {image_path}')
             return image_path
-        try:
-            logger.debug(f'searching image with query {query}, page {page}')
-            search_response: SearchResponse = (
-                self.photos_client.search_random_photo(
-                    query=query,
-                    per_page=1,
-                    page=page,
-                )
-            )
-            if search_response.total_results == 0:
-                raise
-        except (PhotosNotFoundError):
-            if page > int(page / 2):
-                return self._get_image(query=query, max_pages=int(page / 2))
-            if page == 1:
-                raise
 
-        response = requests.get(search_response.photo_urls[0])
-
-        if response.status_code != 200 or not response.content:
-            raise Exception(f'Error downloading image: {response.status_code}')
-
-        with open(image_path, 'wb') as file:
-            file.write(response.content)
-
-        return image_path
+        logger.debug(f'searching image with query {query}, result {rank}')
+        rank, photo_url = photos_client.photo_url(query, rank)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_file = Path(tmp_dir, 'image.jpg')
+            self.transport.download(
+                photo_url,
+                tmp_file,
+                max_size=self.config.max_download_size,
+                content_types=('image/',),
+            )
+            downscale_image_file(
+                tmp_file,
+                self.config.image_max_dimension,
+                self.config.image_quality,
+            )
+            return self.media_store.put_file(
+                MediaKind.IMAGE,
+                query,
+                source,
+                tmp_file,
+                ext='jpg',
+                page=rank,
+            )
 
     def _get_tts_audio(self, query: str) -> Optional[Path]:
-        base_filename = f'{query}_{self.selected_speaker}'
-        audio_path = self.config.audio_filepath(
-            Germanki.convert_query_to_filename(base_filename, ext='mp3')
+        speaker = self.selected_speaker
+        return self._audio_flights.do(
+            (query, speaker), lambda: self._fetch_tts_audio(query, speaker)
         )
-        if audio_path.exists():
+
+    def _fetch_tts_audio(self, query: str, speaker: str) -> Optional[Path]:
+        audio_path = self.media_store.lookup(MediaKind.AUDIO, query, speaker)
+        if audio_path:
             return audio_path
         try:
             with tempfile.TemporaryDirectory() as tmp_dir:
-                tmp_file = Path(tmp_dir, base_filename)
+                tmp_file = Path(
+                    tmp_dir,
+                    Germanki.convert_query_to_filename(
+                        f'{query}_{speaker}', ext='mp3'
+                    ),
+                )
                 MP3Downloader.download_mp3(
-                    msg=query, lang=self.selected_speaker, file_path=tmp_file
+                    msg=query,
+                    lang=speaker,
+                    file_path=tmp_file,
+                    transport=self.transport,
+                )
+                return self.media_store.put_file(
+                    MediaKind.AUDIO, query, speaker, tmp_file, ext='mp3'
                 )
-                b64_audio = base64.b64encode(tmp_file.read_bytes()).decode()
-                audio_path.write_text(b64_audio)
-                return audio_path
         except Exception as e:
             raise e
 
     @staticmethod
     def convert_query_to_filename(query: str, ext: str) -> str:
-        # remove leading and trailing spaces
-        query = query.strip()
-        # replace spaces with underscores
-        query = query.replace(' ', '_')
-        # only commonly accepted characters in filename
-        query = ''.join(c for c in query if c.isalnum() or c in ['_', '-'])
-        # limit filename size
-        query = query[:50]
-
-        filename = f'{query}.{ext}'
-
-        return filename
+        return f'{sanitize_query(query)}.{ext}'
@@ -0,0 +1,63 @@
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+
+def _downscale(
+    file_path: Path, max_dimension: int, quality: int
+) -> Optional[bytes]:
+    """Returns the downscaled JPEG, or None when the source should be kept."""
+    if max_dimension <= 0:
+        return None
+    try:
+        # only the header is read until the pixels are actually needed
+        with Image.open(file_path) as image:
+            if max(image.size) <= max_dimension:
+                return None
+            original_size = image.size
+            # cameras store the orientation separately from the pixels
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_dimension, max_dimension))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+    except (UnidentifiedImageError, OSError) as e:
+        logger.debug(f'Could not downscale image: {e}')
+        return None
+
+    logger.debug(f'Downscaled image from {original_size} to {image.size}')
+    return output.getvalue()
+
+
+def downscale_image_file(
+    file_path: Path, max_dimension: int, quality: int
+) -> bool:
+    """Shrinks an image to fit in `max_dimension` and recompresses it as JPEG.
+
+    The file is replaced in place. Images that already fit, or that cannot be
+    decoded, are kept as they are, and so is the original when recompressing
+    would not make it smaller. Returns whether the file was replaced.
+    """
+    file_path = Path(file_path)
+    downscaled = _downscale(file_path, max_dimension, quality)
+    if downscaled is None or len(downscaled) >= file_path.stat().st_size:
+        return False
+
+    fd, tmp_name = tempfile.mkstemp(dir=file_path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(downscaled)
+        os.replace(tmp_name, file_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return True
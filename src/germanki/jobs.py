@@ -0,0 +1,420 @@
+import hashlib
+import json
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from germanki.core import (
+    AnkiCardInfo,
+    CreateCardResponse,
+    Germanki,
+    MediaUpdateException,
+)
+from germanki.storage import SQLiteStore
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+
+class CardStage(Enum):
+    PARSED = 'parsed'
+    IMAGE = 'image'
+    AUDIO = 'audio'
+    NOTE_CREATED = 'note_created'
+
+
+def job_id_for(*parts: str) -> str:
+    """Job ID derived from the job inputs, so re-running a job resumes it."""
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class JobJournal(SQLiteStore):
+    """Persisted progress of import jobs.
+
+    A job holds the parsed cards, in order, and the stages each card has
+    completed. Cards are stored with the paths of their media files, so a
+    resumed job reuses the exact media fetched before.
+    """
+
+    def __init__(self, db_path: Path):
+        super().__init__(db_path)
+        with self._connection as connection:
+            connection.executescript(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' job_id TEXT PRIMARY KEY,'
+                ' created_at REAL NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS job_cards ('
+                ' job_id TEXT NOT NULL,'
+                ' position INTEGER NOT NULL,'
+                ' card TEXT NOT NULL,'
+                ' PRIMARY KEY (job_id, position));'
+                'CREATE TABLE IF NOT EXISTS card_stages ('
+                ' job_id TEXT NOT NULL,'
+                ' position INTEGER NOT NULL,'
+                ' stage TEXT NOT NULL,'
+                ' completed_at REAL NOT NULL,'
+                ' PRIMARY KEY (job_id, position, stage));'
+            )
+
+    def cards(self, job_id: str) -> Optional[List[AnkiCardInfo]]:
+        """The parsed cards of the job, or None if it was never parsed."""
+        if (
+            self._connection.execute(
+                'SELECT 1 FROM jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+            is None
+        ):
+            return None
+        rows = self._connection.execute(
+            'SELECT card FROM job_cards WHERE job_id = ? ORDER BY position',
+            (job_id,),
+        ).fetchall()
+        return [AnkiCardInfo.model_validate_json(card) for (card,) in rows]
+
+    def stages(self, job_id: str) -> Dict[int, Set[CardStage]]:
+        stages: Dict[int, Set[CardStage]] = {}
+        for position, stage in self._connection.execute(
+            'SELECT position, stage FROM card_stages WHERE job_id = ?',
+            (job_id,),
+        ):
+            stages.setdefault(position, set()).add(CardStage(stage))
+        return stages
+
+    def record_parsed(self, job_id: str, cards: List[AnkiCardInfo]) -> None:
+        now = time.time()
+        with self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, created_at)'
+                ' VALUES (?, ?)',
+                (job_id, now),
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO job_cards (job_id, position, card)'
+                ' VALUES (?, ?, ?)',
+                [
+                    (job_id, position, card.model_dump_json())
+                    for position, card in enumerate(cards)
+                ],
+            )
+            self._insert_stages(
+                connection, job_id, range(len(cards)), CardStage.PARSED, now
+            )
+
+    def record_card(
+        self,
+        job_id: str,
+        position: int,
+        card: AnkiCardInfo,
+        stages: List[CardStage],
+    ) -> None:
+        """Saves the card as it is now, together with its completed stages."""
+        with self._connection as connection:
+            connection.execute(
+                'UPDATE job_cards SET card = ?'
+                ' WHERE job_id = ? AND position = ?',
+                (card.model_dump_json(), job_id, position),
+            )
+            for stage in stages:
+                self._insert_stages(
+                    connection, job_id, [position], stage, time.time()
+                )
+
+    def record_stage(
+        self, job_id: str, positions: List[int], stage: CardStage
+    ) -> None:
+        with self._connection as connection:
+            self._insert_stages(
+                connection, job_id, positions, stage, time.time()
+            )
+
+    def delete(self, job_id: str) -> None:
+        with self._connection as connection:
+            for table in ('card_stages', 'job_cards', 'jobs'):
+                connection.execute(
+                    f'DELETE FROM {table} WHERE job_id = ?', (job_id,)
+                )
+
+    @staticmethod
+    def _insert_stages(connection, job_id, positions, stage, now) -> None:
+        connection.executemany(
+            'INSERT OR IGNORE INTO card_stages'
+            ' (job_id, position, stage, completed_at) VALUES (?, ?, ?, ?)',
+            [(job_id, position, stage.value, now) for position in positions],
+        )
+
+
+class ImportJob:
+    """Import of a list of cards that can be resumed after a failure.
+
+    Each stage of each card is recorded in the journal as soon as it
+    completes. Running a job again with the same ID skips what is done: the
+    cards are not parsed again, media the cards already have is kept, and
+    notes created in Anki are not added again.
+    """
+
+    def __init__(self, germanki: Germanki, journal: JobJournal, job_id: str):
+        self.germanki = germanki
+        self.journal = journal
+        self.job_id = job_id
+        self.cards: List[AnkiCardInfo] = []
+        self.stages: Dict[int, Set[CardStage]] = {}
+        self._positions: Dict[int, int] = {}
+
+    def parse(
+        self, parse: Callable[[], List[AnkiCardInfo]]
+    ) -> List[AnkiCardInfo]:
+        cards = self.journal.cards(self.job_id)
+        if cards is None:
+            cards = parse()
+            self.journal.record_parsed(self.job_id, cards)
+        else:
+            logger.info(f'Resuming job {self.job_id} with {len(cards)} cards')
+        self.cards = cards
+        self._positions = {id(card): i for i, card in enumerate(cards)}
+        self.stages = self.journal.stages(self.job_id)
+        return cards
+
+    def created_cards(self) -> List[AnkiCardInfo]:
+        """Cards whose note was created by an earlier run of the job."""
+        return [
+            card
+            for position, card in enumerate(self.cards)
+            if self._done(position, CardStage.NOTE_CREATED)
+        ]
+
+    def fetch_media(
+        self,
+        deck_name: Optional[str] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+        on_card: Optional[
+            Callable[[int, List[MediaUpdateException]], None]
+        ] = None,
+        cancelled: Optional[threading.Event] = None,
+        on_start: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Fetches the media of the cards whose note is not created yet.
+
+        `progress`, `on_card`, `cancelled` and `on_start` are passed on to
+        `Germanki.preview_cards`, whose `MediaUpdateExceptions` are raised
+        after recording the stages of every card.
+        """
+        pending = [
+            position
+            for position in range(len(self.cards))
+            if not self._done(position, CardStage.NOTE_CREATED)
+        ]
+
+        def record(index: int, exceptions: List[MediaUpdateException]):
+            card = self.germanki.card_contents[index]
+            failed = {exception.media_type for exception in exceptions}
+            stages = []
+            if card.translation_image_url and 'image' not in failed:
+                stages.append(CardStage.IMAGE)
+            if card.word_audio_url and 'audio' not in failed:
+                stages.append(CardStage.AUDIO)
+            position = self._position(card)
+            self.journal.record_card(self.job_id, position, card, stages)
+            self.stages.setdefault(position, set()).update(stages)
+            if on_card is not None:
+                on_card(index, exceptions)
+
+        self.germanki.preview_cards(
+            [self.cards[position] for position in pending],
+            deck_name=deck_name,
+            progress=progress,
+            keep_media=True,
+            on_card=record,
+            cancelled=cancelled,
+            on_start=on_start,
+        )
+
+    def record_card(self, card: AnkiCardInfo) -> None:
+        """Saves a card changed after its media was fetched."""
+        self.journal.record_card(self.job_id, self._position(card), card, [])
+
+    def create_cards(
+        self,
+        deck_name: str,
+        batch_size: int = 20,
+        on_batch: Optional[
+            Callable[[int, List[CreateCardResponse]], None]
+        ] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> List[CreateCardResponse]:
+        """Adds the fetched cards to Anki, recording those that were added.
+
+        Cards are added in batches, each recorded as soon as it is done, so
+        the notes added before Anki stops responding are not added again.
+        `on_batch` is called with the index of the first card of each batch
+        and its responses. Once `cancelled` is set, no other batch is added.
+        """
+        card_contents = self.germanki.card_contents
+        responses = []
+        for start in range(0, len(card_contents), batch_size):
+            if cancelled is not None and cancelled.is_set():
+                break
+            batch = card_contents[start : start + batch_size]
+            batch_responses = self.germanki.create_cards(deck_name, batch)
+            self._record_created(batch, batch_responses)
+            responses.extend(batch_responses)
+            if on_batch is not None:
+                on_batch(start, batch_responses)
+        return responses
+
+    def _record_created(
+        self,
+        card_contents: List[AnkiCardInfo],
+        responses: List[CreateCardResponse],
+    ) -> None:
+        created = [
+            self._position(card)
+            for card, response in zip(card_contents, responses)
+            if response.exception is None
+        ]
+        self.journal.record_stage(self.job_id, created, CardStage.NOTE_CREATED)
+        for position in created:
+            self.stages.setdefault(position, set()).add(CardStage.NOTE_CREATED)
+
+    def note_created(self, card: AnkiCardInfo) -> bool:
+        return self._done(self._position(card), CardStage.NOTE_CREATED)
+
+    def _position(self, card: AnkiCardInfo) -> int:
+        # the deck check may leave cards out, so cards are matched back to
+        # their position by identity
+        return self._positions[id(card)]
+
+    def _done(self, position: int, stage: CardStage) -> bool:
+        return stage in self.stages.get(position, set())
+
+
+class JobState(Enum):
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+
+class CardStatus(Enum):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+
+class BackgroundJob:
+    """Runs a function in a background thread and tracks its progress.
+
+    The function is called with the job, and reports through it which cards
+    are done and what is left to do. It should stop early once `cancelled`
+    is set. The UI polls the job instead of waiting for it, so the script
+    thread is never blocked on network work.
+    """
+
+    def __init__(
+        self, description: str, function: Callable[['BackgroundJob'], Any]
+    ):
+        self.description = description
+        self.status = description
+        self.cancelled = threading.Event()
+        self.done = 0
+        self.total = 0
+        self.messages: List[str] = []
+        self.warnings: List[str] = []
+        self.result: Any = None
+        self.exception: Optional[Exception] = None
+        self._function = function
+        self._card_errors: Dict[int, Optional[str]] = {}
+        self._tracks_cards = False
+        self._cards_started_at: Optional[float] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name=f'germanki-{description}', daemon=True
+        )
+
+    def start(self) -> 'BackgroundJob':
+        self._started_at = time.monotonic()
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def _run(self) -> None:
+        try:
+            self.result = self._function(self)
+        except Exception as e:
+            logger.exception(f'Job {self.description} failed')
+            self.exception = e
+        finally:
+            self._finished_at = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    @property
+    def state(self) -> JobState:
+        if self.running:
+            return JobState.RUNNING
+        if self.exception is not None:
+            return JobState.FAILED
+        if self.cancelled.is_set():
+            return JobState.CANCELLED
+        return JobState.DONE
+
+    @property
+    def elapsed(self) -> float:
+        if self._started_at is None:
+            return 0.0
+        end = self._finished_at or time.monotonic()
+        return end - self._started_at
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left, estimated from the pace of the cards done so far.
+
+        The pace is measured from `start_cards`, so the work done before the
+        cards are known, like parsing the input, does not count.
+        """
+        if not self.running or not self.done or not self._cards_started_at:
+            return None
+        card_time = time.monotonic() - self._cards_started_at
+        return card_time / self.done * (self.total - self.done)
+
+    def start_cards(self, total: int) -> None:
+        """Starts tracking the status of `total` cards."""
+        with self._lock:
+            self.total = total
+            self.done = 0
+            self._card_errors = {}
+            self._tracks_cards = True
+            self._cards_started_at = time.monotonic()
+
+    def progress(self, done: int, total: int) -> None:
+        self.done, self.total = done, total
+
+    def card_done(self, index: int, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._card_errors[index] = error
+
+    def card_status(self, index: int) -> Optional[CardStatus]:
+        """Status of a card, or None if the job does not handle it."""
+        with self._lock:
+            if not self._tracks_cards:
+                return None
+            if index in self._card_errors:
+                return (
+                    CardStatus.FAILED
+                    if self._card_errors[index]
+                    else CardStatus.DONE
+                )
+        if self.running:
+            return CardStatus.PENDING
+        return CardStatus.CANCELLED if self.cancelled.is_set() else None
@@ -0,0 +1,324 @@
+import base64
+import binascii
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from germanki.config import TTSSpeaker
+from germanki.storage import SQLiteStore
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+
+class MediaKind(Enum):
+    IMAGE = 'image'
+    AUDIO = 'audio'
+
+
+MediaKey = Tuple[MediaKind, str, str, int]
+
+LEGACY_SPEAKERS = {speaker.value for speaker in TTSSpeaker}
+
+
+def sanitize_query(query: str) -> str:
+    """Query as it appears in the name of a cached file."""
+    # remove leading and trailing spaces
+    query = query.strip()
+    # replace spaces with underscores
+    query = query.replace(' ', '_')
+    # only commonly accepted characters in filename
+    query = ''.join(c for c in query if c.isalnum() or c in ['_', '-'])
+    # limit filename size
+    return query[:50]
+
+
+def _is_digest(name: str) -> bool:
+    return len(name) == 64 and all(c in '0123456789abcdef' for c in name)
+
+
+class MediaStore(SQLiteStore):
+    """Content-addressed storage for downloaded media.
+
+    Blobs are written once, named after the SHA-256 of their contents, so
+    identical downloads are stored a single time. A SQLite index maps
+    `(kind, query, source, page)` to a blob, where `source` is the photo
+    provider or the TTS speaker. Blob files are written to a temporary file
+    and renamed into place, and the index runs in WAL mode, so several
+    processes can share the same store.
+    """
+
+    # 1: media cached under query-named files by earlier versions imported
+    SCHEMA_VERSION = 1
+    CHUNK_SIZE = 64 * 1024
+    # earlier versions only downloaded the large2x size from Pexels
+    LEGACY_IMAGE_SOURCE = 'PexelsClient'
+
+    def __init__(self, index_path: Path, folders: Dict[MediaKind, Path]):
+        super().__init__(index_path)
+        self.folders = {kind: Path(folder) for kind, folder in folders.items()}
+        self._entries: Dict[MediaKey, Path] = {}
+        self._lock = threading.Lock()
+        self._create_schema()
+        self._migrate()
+
+    def _create_schema(self) -> None:
+        with self._connection as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                ' digest TEXT PRIMARY KEY,'
+                ' kind TEXT NOT NULL,'
+                ' filename TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' kind TEXT NOT NULL,'
+                ' query TEXT NOT NULL,'
+                ' source TEXT NOT NULL,'
+                ' page INTEGER NOT NULL,'
+                ' digest TEXT NOT NULL REFERENCES blobs(digest),'
+                ' updated_at REAL NOT NULL,'
+                ' PRIMARY KEY (kind, query, source, page))'
+            )
+
+    def _migrate(self) -> None:
+        connection = self._connection
+        # the write lock makes sure only one process runs each migration
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version < 1:
+                self._import_legacy_files(connection)
+            connection.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+    def _import_legacy_files(self, connection: sqlite3.Connection) -> None:
+        """Moves files cached by earlier versions into the store.
+
+        Those were named `<query>_<speaker>.mp3`, holding base64 text, and
+        `<query>_<page>.jpg`, with the query sanitized by `sanitize_query`.
+        They are indexed under the sanitized query, which `lookup` falls
+        back to. Files whose name was truncated past the speaker or page
+        cannot be matched to a key and are removed.
+        """
+        legacy_files = [
+            (kind, path)
+            for kind, pattern in (
+                (MediaKind.AUDIO, '*.mp3'),
+                (MediaKind.IMAGE, '*.jpg'),
+            )
+            if kind in self.folders and self.folders[kind].is_dir()
+            for path in self.folders[kind].glob(pattern)
+            if not _is_digest(path.stem)
+        ]
+        imported = 0
+        for kind, path in legacy_files:
+            query, _, suffix = path.stem.rpartition('_')
+            if kind == MediaKind.AUDIO:
+                try:
+                    data = base64.b64decode(path.read_bytes(), validate=True)
+                except binascii.Error:
+                    # raw MP3 files, like the speaker samples, were never
+                    # written by the cache
+                    continue
+                source, page = suffix, 0
+                if not query or source not in LEGACY_SPEAKERS:
+                    path.unlink()
+                    continue
+            else:
+                data = path.read_bytes()
+                source = self.LEGACY_IMAGE_SOURCE
+                if not query or not suffix.isdigit():
+                    path.unlink()
+                    continue
+                page = int(suffix)
+
+            digest = hashlib.sha256(data).hexdigest()
+            blob_path = self.folders[kind] / f'{digest}{path.suffix}'
+            if not blob_path.exists():
+                self._write_atomic(blob_path, data)
+            self._insert(
+                connection,
+                kind,
+                query,
+                source,
+                page,
+                digest,
+                blob_path,
+                len(data),
+            )
+            path.unlink()
+            imported += 1
+        if imported:
+            logger.info(f'Imported {imported} media files from the old cache')
+
+    def lookup(
+        self, kind: MediaKind, query: str, source: str, page: int = 0
+    ) -> Optional[Path]:
+        """Returns the blob stored for the key, without touching the disk."""
+        key = (kind, query, source, page)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+
+        row = None
+        # files imported from the old cache are keyed on the sanitized query
+        for stored_query in dict.fromkeys([query, sanitize_query(query)]):
+            row = self._connection.execute(
+                'SELECT blobs.filename FROM entries'
+                ' JOIN blobs ON blobs.digest = entries.digest'
+                ' WHERE entries.kind = ? AND entries.query = ?'
+                ' AND entries.source = ? AND entries.page = ?',
+                (kind.value, stored_query, source, page),
+            ).fetchone()
+            if row is not None:
+                break
+        if row is None:
+            return None
+
+        path = self.folders[kind] / row[0]
+        with self._lock:
+            self._entries[key] = path
+        return path
+
+    def put(
+        self,
+        kind: MediaKind,
+        query: str,
+        source: str,
+        data: bytes,
+        ext: str,
+        page: int = 0,
+    ) -> Path:
+        """Stores `data` under the key and returns the path of its blob."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.folders[kind] / f'{digest}.{ext}'
+        if not path.exists():
+            self._write_atomic(path, data)
+        else:
+            logger.debug(f'{kind.value} blob {path.name} already stored')
+        return self._index(kind, query, source, page, digest, path, len(data))
+
+    def put_file(
+        self,
+        kind: MediaKind,
+        query: str,
+        source: str,
+        file_path: Path,
+        ext: str,
+        page: int = 0,
+    ) -> Path:
+        """Stores the contents of `file_path` without loading it in memory."""
+        with open(file_path, 'rb') as file:
+            digest = hashlib.file_digest(file, 'sha256').hexdigest()
+
+        path = self.folders[kind] / f'{digest}.{ext}'
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file, open(
+                    file_path, 'rb'
+                ) as file:
+                    shutil.copyfileobj(file, tmp_file, self.CHUNK_SIZE)
+                os.replace(tmp_name, path)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        else:
+            logger.debug(f'{kind.value} blob {path.name} already stored')
+        return self._index(
+            kind, query, source, page, digest, path, path.stat().st_size
+        )
+
+    def _index(
+        self,
+        kind: MediaKind,
+        query: str,
+        source: str,
+        page: int,
+        digest: str,
+        path: Path,
+        size: int,
+    ) -> Path:
+        with self._connection as connection:
+            self._insert(
+                connection, kind, query, source, page, digest, path, size
+            )
+
+        with self._lock:
+            self._entries[(kind, query, source, page)] = path
+        return path
+
+    @staticmethod
+    def _insert(
+        connection: sqlite3.Connection,
+        kind: MediaKind,
+        query: str,
+        source: str,
+        page: int,
+        digest: str,
+        path: Path,
+        size: int,
+    ) -> None:
+        now = time.time()
+        connection.execute(
+            'INSERT OR IGNORE INTO blobs'
+            ' (digest, kind, filename, size, created_at)'
+            ' VALUES (?, ?, ?, ?, ?)',
+            (digest, kind.value, path.name, size, now),
+        )
+        connection.execute(
+            'INSERT OR REPLACE INTO entries'
+            ' (kind, query, source, page, digest, updated_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (kind.value, query, source, page, digest, now),
+        )
+
+    def total_size(self, kind: Optional[MediaKind] = None) -> int:
+        """Bytes used by stored blobs, optionally of a single kind."""
+        if kind is None:
+            row = self._connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM blobs'
+            ).fetchone()
+        else:
+            row = self._connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM blobs WHERE kind = ?',
+                (kind.value,),
+            ).fetchone()
+        return row[0]
+
+    def blob_count(self, kind: Optional[MediaKind] = None) -> int:
+        if kind is None:
+            row = self._connection.execute(
+                'SELECT COUNT(*) FROM blobs'
+            ).fetchone()
+        else:
+            row = self._connection.execute(
+                'SELECT COUNT(*) FROM blobs WHERE kind = ?', (kind.value,)
+            ).fetchone()
+        return row[0]
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
@@ -1,8 +1,23 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from random import randint
+from typing import List, Optional, Tuple
 
+import requests
 from pydantic import BaseModel
 
+from germanki.config import ImageSize
+from germanki.photos.cache import (
+    SearchResultsCache,
+    default_search_results_cache,
+)
+from germanki.photos.exceptions import (
+    PhotosNoResultsError,
+    PhotosNotFoundError,
+)
+from germanki.photos.rate_limit import RateLimiter, shared_rate_limiter
+from germanki.photos.stats import QueryStatistics
+from germanki.transport import HTTPTransport, default_transport
+
 
 class SearchResponse(BaseModel):
     photo_urls: List[str]
@@ -10,8 +25,54 @@ class SearchResponse(BaseModel):
 
 
 class PhotosClient(ABC):
-    def __init__(self, api_key: Optional[str] = None):
+    # largest page size accepted by the provider's search endpoint
+    MAX_PER_PAGE: int = 30
+    # random picks are limited to the most relevant results
+    MAX_RANK: int = 100
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        transport: Optional[HTTPTransport] = None,
+        results_cache: Optional[SearchResultsCache] = None,
+        query_stats: Optional[QueryStatistics] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        image_size: ImageSize = ImageSize.MEDIUM,
+    ):
         self.api_key = api_key
+        self.image_size = image_size
+        self.transport = transport if transport else default_transport()
+        self.results_cache = (
+            results_cache if results_cache else default_search_results_cache()
+        )
+        self.query_stats = query_stats
+        self.rate_limiter = (
+            rate_limiter
+            if rate_limiter
+            else shared_rate_limiter(self.provider_name)
+        )
+
+    @property
+    def provider_name(self) -> str:
+        return type(self).__name__
+
+    @property
+    def media_source(self) -> str:
+        """Identifies downloaded images by provider and size."""
+        # large images are stored under the bare provider name, which is
+        # what images downloaded before sizes could be chosen used
+        if self.image_size == ImageSize.LARGE:
+            return self.provider_name
+        return f'{self.provider_name}:{self.image_size.value}'
+
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """Sends a GET request paced by the provider's rate limiter."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        response = self.transport.get(url, **kwargs)
+        if self.rate_limiter is not None:
+            self.rate_limiter.update_from_headers(response.headers)
+        return response
 
     @abstractmethod
     def search_random_photo(
@@ -19,3 +80,79 @@ class PhotosClient(ABC):
     ) -> SearchResponse:
         """Abstract method for searching photos."""
         pass
+
+    def search_photos(self, query: str, page: int = 1) -> SearchResponse:
+        """Returns a full page of results, served from the cache if possible."""
+        return self.results_cache.get_or_fetch(
+            (
+                self.provider_name,
+                query,
+                page,
+                self.MAX_PER_PAGE,
+                self.image_size,
+            ),
+            lambda: self._search_and_record(query, page),
+        )
+
+    def _search_and_record(self, query: str, page: int) -> SearchResponse:
+        try:
+            search_response = self.search_random_photo(
+                query=query, per_page=self.MAX_PER_PAGE, page=page
+            )
+        except (PhotosNoResultsError, PhotosNotFoundError):
+            # pages past the last result come back empty
+            self._record_total_results(query, (page - 1) * self.MAX_PER_PAGE)
+            raise
+        self._record_total_results(query, search_response.total_results)
+        return search_response
+
+    def _record_total_results(self, query: str, total_results: int) -> None:
+        if self.query_stats is not None:
+            self.query_stats.record(self.provider_name, query, total_results)
+
+    def known_total_results(self, query: str) -> Optional[int]:
+        if self.query_stats is None:
+            return None
+        return self.query_stats.total_results(self.provider_name, query)
+
+    def random_rank(self, query: str) -> int:
+        """Picks the rank of a random result that is known to exist.
+
+        Only queries never seen before cost a search request.
+        """
+        total_results = self.known_total_results(query)
+        if total_results is None:
+            search_response = self.search_photos(query)
+            total_results = max(
+                search_response.total_results,
+                len(search_response.photo_urls),
+            )
+        if total_results == 0:
+            raise PhotosNoResultsError(
+                f"There are no photos for search term '{query}'."
+            )
+        return randint(1, min(total_results, self.MAX_RANK))
+
+    def photo_url(self, query: str, rank: int) -> Tuple[int, str]:
+        """Returns the URL of the result at `rank` (1-based).
+
+        Providers sometimes report more results than they return, so the
+        rank is clamped to the results actually available and returned
+        along with the URL.
+        """
+        page = (rank - 1) // self.MAX_PER_PAGE + 1
+        try:
+            search_response = self.search_photos(query, page)
+        except (PhotosNoResultsError, PhotosNotFoundError):
+            if page == 1:
+                raise
+            return self.photo_url(
+                query, randint(1, (page - 1) * self.MAX_PER_PAGE)
+            )
+
+        index = (rank - 1) % self.MAX_PER_PAGE
+        if index >= len(search_response.photo_urls):
+            index = len(search_response.photo_urls) - 1
+            rank = (page - 1) * self.MAX_PER_PAGE + index + 1
+            self._record_total_results(query, rank)
+        return rank, search_response.photo_urls[index]
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class SearchResultsCache:
+    """Thread-safe in-memory cache of photo search results with a TTL.
+
+    Keeping whole result pages around lets refreshes and random picks be
+    served locally instead of calling the photos API for every image.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, Tuple[float, T]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: T) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], T]) -> T:
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_default_cache = SearchResultsCache()
+
+
+def default_search_results_cache() -> SearchResultsCache:
+    """Cache shared by all photo clients of the process."""
+    return _default_cache
@@ -33,3 +33,9 @@ class PhotosNoResultsError(PhotosAPIError):
     """Raised when no results are found for a search query."""
 
     pass
+
+
+class PhotosQuotaExceededError(PhotosAPIError):
+    """Raised when the request quota stays exhausted for too long."""
+
+    pass
@@ -0,0 +1,167 @@
+import math
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Dict, List, Optional
+
+import requests
+
+from germanki.photos import PhotosClient, SearchResponse
+from germanki.photos.exceptions import (
+    PhotosAPIError,
+    PhotosNoResultsError,
+    PhotosNotFoundError,
+)
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+
+class ProviderStats:
+    """Exponentially weighted latency and success rate of a provider."""
+
+    def __init__(self, smoothing: float = 0.3):
+        self.smoothing = smoothing
+        self.latency: Optional[float] = None
+        self.success_rate = 1.0
+        self.requests = 0
+
+    def record(self, latency: float, success: bool) -> None:
+        self.requests += 1
+        self.latency = (
+            latency
+            if self.latency is None
+            else self.smoothing * latency + (1 - self.smoothing) * self.latency
+        )
+        self.success_rate = (
+            self.smoothing * float(success)
+            + (1 - self.smoothing) * self.success_rate
+        )
+
+
+class FallbackPhotosClient(PhotosClient):
+    """Queries several photo providers and returns the first good result.
+
+    Providers are tried in priority order. When `hedge_after` is set and the
+    current provider has not answered within that many seconds, the next one
+    is queried as well, and whichever answers first wins. Latency and success
+    rate are tracked per provider, and faster, more reliable providers move
+    ahead of the others.
+    """
+
+    def __init__(
+        self,
+        clients: List[PhotosClient],
+        hedge_after: Optional[float] = None,
+        **kwargs,
+    ):
+        if not clients:
+            raise ValueError('At least one photos client is required.')
+        self.clients = clients
+        super().__init__(**kwargs)
+        self.hedge_after = hedge_after
+        self.MAX_PER_PAGE = min(client.MAX_PER_PAGE for client in clients)
+        self.stats: Dict[str, ProviderStats] = {
+            client.provider_name: ProviderStats() for client in clients
+        }
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=4 * len(clients),
+            thread_name_prefix='photos-fallback',
+        )
+
+    @property
+    def provider_name(self) -> str:
+        return '+'.join(
+            sorted(client.provider_name for client in self.clients)
+        )
+
+    def ordered_clients(self) -> List[PhotosClient]:
+        def score(client: PhotosClient):
+            stats = self.stats[client.provider_name]
+            latency = math.inf if stats.latency is None else stats.latency
+            # success rates are compared coarsely so that a single failure
+            # does not reorder providers with similar reliability
+            return (-round(stats.success_rate, 1), latency)
+
+        with self._stats_lock:
+            # sorted() is stable, so untried providers keep their priority
+            return sorted(self.clients, key=score)
+
+    def search_random_photo(
+        self, query: str, per_page: int = 1, page: int = 1
+    ) -> SearchResponse:
+        clients = self.ordered_clients()
+        pending: Dict[Future, PhotosClient] = {}
+        errors: List[Exception] = []
+
+        def query_next_provider() -> None:
+            client = clients[len(pending) + len(errors)]
+            pending[
+                self._executor.submit(
+                    self._timed_search, client, query, per_page, page
+                )
+            ] = client
+
+        query_next_provider()
+        while pending:
+            can_hedge = len(pending) + len(errors) < len(clients)
+            done, _ = wait(
+                pending,
+                timeout=self.hedge_after if can_hedge else None,
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                logger.debug(
+                    f'No photo results after {self.hedge_after}s, '
+                    'hedging with the next provider'
+                )
+                query_next_provider()
+                continue
+
+            for future in done:
+                client = pending.pop(future)
+                try:
+                    return future.result()
+                except (PhotosAPIError, requests.RequestException) as e:
+                    logger.debug(
+                        f'{client.provider_name} failed for query {query}: {e}'
+                    )
+                    errors.append(e)
+            if len(pending) + len(errors) < len(clients):
+                query_next_provider()
+
+        for error in errors:
+            if not isinstance(
+                error, (PhotosNoResultsError, PhotosNotFoundError)
+            ):
+                raise error
+        raise PhotosNoResultsError(
+            f"There are no photos for search term '{query}'."
+        )
+
+    def _timed_search(
+        self, client: PhotosClient, query: str, per_page: int, page: int
+    ) -> SearchResponse:
+        start = time.monotonic()
+        success = False
+        try:
+            response = client.search_random_photo(
+                query=query, per_page=per_page, page=page
+            )
+            success = True
+            return response
+        except (PhotosNoResultsError, PhotosNotFoundError):
+            # the provider works, it just has nothing for this query
+            success = True
+            raise
+        finally:
+            with self._stats_lock:
+                self.stats[client.provider_name].record(
+                    time.monotonic() - start, success
+                )
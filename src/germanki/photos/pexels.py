@@ -1,7 +1,6 @@
 import os
 from typing import Any, Dict, List, Optional
 
-import requests
 from pydantic import BaseModel
 from tenacity import (
     retry,
@@ -10,7 +9,9 @@ from tenacity import (
     wait_exponential,
 )
 
+from germanki.config import ImageSize
 from germanki.photos import PhotosClient, SearchResponse
+from germanki.photos.cache import SearchResultsCache
 from germanki.photos.exceptions import (
     PhotosAPIError,
     PhotosAuthenticationError,
@@ -18,13 +19,36 @@ from germanki.photos.exceptions import (
     PhotosNotFoundError,
     PhotosRateLimitError,
 )
+from germanki.photos.rate_limit import RateLimiter
+from germanki.transport import HTTPTransport
 from germanki.utils import get_logger
 
 logger = get_logger(__file__)
 
+# medium is 350px high and large 940px wide, see
+# https://www.pexels.com/api/documentation/#photos-overview
+PEXELS_IMAGE_SIZES = {
+    ImageSize.SMALL: 'medium',
+    ImageSize.MEDIUM: 'large',
+    ImageSize.LARGE: 'large2x',
+}
+
 
 class PexelsPhotoSource(BaseModel):
-    large2x: str
+    medium: Optional[str] = None
+    large: Optional[str] = None
+    large2x: Optional[str] = None
+    original: Optional[str] = None
+
+    def url(self, image_size: ImageSize) -> str:
+        """URL of the requested size, or of the next larger one available."""
+        variants = ['medium', 'large', 'large2x', 'original']
+        start = variants.index(PEXELS_IMAGE_SIZES[image_size])
+        for variant in variants[start:] + variants[:start][::-1]:
+            url = getattr(self, variant)
+            if url:
+                return url
+        raise PhotosNotFoundError('Photo has no downloadable source.')
 
 
 class PexelsPhotoInfo(BaseModel):
@@ -35,18 +59,34 @@ class PexelsSearchResponse(BaseModel):
     photos: List[PexelsPhotoInfo]
     total_results: int
 
-    def get_search_response(self) -> SearchResponse:
+    def get_search_response(
+        self, image_size: ImageSize = ImageSize.LARGE
+    ) -> SearchResponse:
         return SearchResponse(
-            photo_urls=[photo.src.large2x for photo in self.photos],
+            photo_urls=[photo.src.url(image_size) for photo in self.photos],
             total_results=self.total_results,
         )
 
 
 class PexelsClient(PhotosClient):
     BASE_URL = 'https://api.pexels.com/v1/'
+    MAX_PER_PAGE = 80
 
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.getenv('PEXELS_API_KEY')
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        transport: Optional[HTTPTransport] = None,
+        results_cache: Optional[SearchResultsCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        image_size: ImageSize = ImageSize.MEDIUM,
+    ):
+        super().__init__(
+            api_key or os.getenv('PEXELS_API_KEY'),
+            transport,
+            results_cache,
+            rate_limiter=rate_limiter,
+            image_size=image_size,
+        )
         if not self.api_key:
             raise PhotosAuthenticationError(
                 'API key is required. Set PEXELS_API_KEY environment variable or pass it explicitly.'
@@ -66,7 +106,7 @@ class PexelsClient(PhotosClient):
     ) -> Dict[str, Any]:
         """Handles API requests with retry logic on rate limiting."""
         url = f'{self.BASE_URL}{endpoint}'
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self._get(url, headers=self.headers, params=params)
 
         if response.status_code == 200:
             return response.json()
@@ -111,4 +151,6 @@ class PexelsClient(PhotosClient):
         if not photos:
             raise PhotosNotFoundError('No photos found.')
 
-        return PexelsSearchResponse(**data).get_search_response()
+        return PexelsSearchResponse(**data).get_search_response(
+            self.image_size
+        )
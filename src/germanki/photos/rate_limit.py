@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from collections.abc import Mapping
+from typing import Dict, Optional
+
+from pydantic.dataclasses import Field, dataclass
+
+from germanki.photos.exceptions import PhotosQuotaExceededError
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+
+@dataclass
+class RateLimitConfig:
+    requests_per_hour: float = Field(gt=0)
+    burst: int = Field(default=10, ge=1)
+    # longest time a request waits for the quota reported by the provider to
+    # reset before failing. Waits for the bucket to refill are always taken.
+    max_wait: float = Field(default=60, ge=0)
+
+
+def _hourly_quota(env_var: str, default: int) -> RateLimitConfig:
+    # the providers grant their quota per hour, so the whole of it may be
+    # spent at once and the bucket only paces once it runs out
+    requests_per_hour = float(os.environ.get(env_var, default))
+    return RateLimitConfig(
+        requests_per_hour=requests_per_hour,
+        burst=max(1, int(requests_per_hour)),
+    )
+
+
+DEFAULT_RATE_LIMITS: Dict[str, RateLimitConfig] = {
+    'PexelsClient': _hourly_quota('GERMANKI_PEXELS_REQUESTS_PER_HOUR', 200),
+    'UnsplashClient': _hourly_quota('GERMANKI_UNSPLASH_REQUESTS_PER_HOUR', 50),
+}
+
+
+def _header_number(headers: Mapping, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket that also follows the quota reported by the provider.
+
+    Requests take a token from a bucket refilled at `requests_per_hour`.
+    Responses update the remaining quota from the `X-Ratelimit-Remaining`
+    and `X-Ratelimit-Reset` headers. Once the provider reports no requests
+    left, callers wait until the reset instead of running into HTTP 429.
+    One limiter is meant to be shared by every thread using a provider.
+    """
+
+    def __init__(self, config: RateLimitConfig):
+        self.config = config
+        self._rate = config.requests_per_hour / 3600
+        self._tokens = float(config.burst)
+        self._updated_at = time.monotonic()
+        self._quota_remaining: Optional[int] = None
+        self._quota_reset: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def quota_remaining(self) -> Optional[int]:
+        return self._quota_remaining
+
+    def acquire(self) -> None:
+        """Blocks until a request may be sent.
+
+        Raises `PhotosQuotaExceededError` if the provider reports its quota
+        exhausted for longer than `max_wait`.
+        """
+        while True:
+            with self._lock:
+                quota_wait = self._quota_wait()
+                wait = quota_wait if quota_wait > 0 else self._take_token()
+            if wait <= 0:
+                return
+            if quota_wait > self.config.max_wait:
+                raise PhotosQuotaExceededError(
+                    f'Request quota exhausted for {wait:.0f} more seconds.'
+                )
+            logger.debug(f'Rate limited, waiting {wait:.1f}s')
+            time.sleep(wait)
+
+    def _quota_wait(self) -> float:
+        """How long until the quota reported by the provider resets."""
+        if self._quota_remaining is None or self._quota_remaining > 0:
+            return 0
+        if self._quota_reset is not None and self._quota_reset > time.time():
+            return self._quota_reset - time.time()
+        # the quota was reset, or the provider does not say when it resets,
+        # so fall back to pacing with the bucket
+        self._quota_remaining = None
+        self._quota_reset = None
+        return 0
+
+    def _take_token(self) -> float:
+        """Takes a token, or returns how long to wait for one."""
+        now = time.monotonic()
+        self._tokens = min(
+            self.config.burst,
+            self._tokens + (now - self._updated_at) * self._rate,
+        )
+        self._updated_at = now
+        if self._tokens < 1:
+            return (1 - self._tokens) / self._rate
+
+        self._tokens -= 1
+        if self._quota_remaining is not None:
+            self._quota_remaining -= 1
+        return 0
+
+    def update_from_headers(self, headers: Mapping) -> None:
+        """Syncs the remaining quota with the provider's response headers."""
+        if not isinstance(headers, Mapping):
+            return
+        remaining = _header_number(headers, 'X-Ratelimit-Remaining')
+        reset = _header_number(headers, 'X-Ratelimit-Reset')
+        with self._lock:
+            if remaining is not None:
+                self._quota_remaining = int(remaining)
+            if reset is not None:
+                self._quota_reset = reset
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def shared_rate_limiter(provider_name: str) -> Optional[RateLimiter]:
+    """Process-wide limiter of a provider, if it has a known rate limit."""
+    with _rate_limiters_lock:
+        if provider_name not in _rate_limiters:
+            config = DEFAULT_RATE_LIMITS.get(provider_name)
+            if config is None:
+                return None
+            _rate_limiters[provider_name] = RateLimiter(config)
+        return _rate_limiters[provider_name]
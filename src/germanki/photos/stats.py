@@ -0,0 +1,62 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from germanki.storage import SQLiteStore
+
+
+class QueryStatistics(SQLiteStore):
+    """Persisted number of search results per provider and query.
+
+    Knowing how many results a query has lets photo clients pick a valid
+    page on the first request. Entries older than `max_age` seconds are
+    ignored, as result counts change over time.
+    """
+
+    def __init__(self, db_path: Path, max_age: float = 30 * 24 * 3600):
+        super().__init__(db_path)
+        self.max_age = max_age
+        self._totals: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        with self._connection as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS query_stats ('
+                ' provider TEXT NOT NULL,'
+                ' query TEXT NOT NULL,'
+                ' total_results INTEGER NOT NULL,'
+                ' last_seen REAL NOT NULL,'
+                ' PRIMARY KEY (provider, query))'
+            )
+
+    def total_results(self, provider: str, query: str) -> Optional[int]:
+        key = (provider, query)
+        with self._lock:
+            entry = self._totals.get(key)
+        if entry is None:
+            entry = self._connection.execute(
+                'SELECT total_results, last_seen FROM query_stats'
+                ' WHERE provider = ? AND query = ?',
+                key,
+            ).fetchone()
+            if entry is None:
+                return None
+            with self._lock:
+                self._totals[key] = entry
+
+        total_results, last_seen = entry
+        if time.time() - last_seen > self.max_age:
+            return None
+        return total_results
+
+    def record(self, provider: str, query: str, total_results: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._totals[(provider, query)] = (total_results, now)
+        with self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO query_stats'
+                ' (provider, query, total_results, last_seen)'
+                ' VALUES (?, ?, ?, ?)',
+                (provider, query, total_results, now),
+            )
@@ -1,7 +1,7 @@
 import os
 from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-import requests
 from tenacity import (
     retry,
     retry_if_exception_type,
@@ -9,7 +9,9 @@ from tenacity import (
     wait_exponential,
 )
 
+from germanki.config import ImageSize
 from germanki.photos import PhotosClient, SearchResponse
+from germanki.photos.cache import SearchResultsCache
 from germanki.photos.exceptions import (
     PhotosAPIError,
     PhotosAuthenticationError,
@@ -17,13 +19,48 @@ from germanki.photos.exceptions import (
     PhotosNotFoundError,
     PhotosRateLimitError,
 )
+from germanki.photos.rate_limit import RateLimiter
+from germanki.transport import HTTPTransport
+
+# small and regular URLs are resized by Unsplash to the `w` parameter, see
+# https://unsplash.com/documentation#dynamically-resizable-images
+UNSPLASH_IMAGE_SIZES = {
+    ImageSize.SMALL: ('small', 400),
+    ImageSize.MEDIUM: ('regular', 800),
+    ImageSize.LARGE: ('full', None),
+}
+
+
+def unsplash_photo_url(urls: Dict[str, str], image_size: ImageSize) -> str:
+    variant, width = UNSPLASH_IMAGE_SIZES[image_size]
+    url = urls.get(variant) or urls['full']
+    if width is None:
+        return url
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query))
+    params['w'] = str(width)
+    return urlunsplit(parts._replace(query=urlencode(params)))
 
 
 class UnsplashClient(PhotosClient):
     BASE_URL = 'https://api.unsplash.com/'
+    MAX_PER_PAGE = 30
 
-    def __init__(self, api_key: Optional[str] = None):
-        super().__init__(api_key or os.getenv('UNSPLASH_API_KEY'))
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        transport: Optional[HTTPTransport] = None,
+        results_cache: Optional[SearchResultsCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        image_size: ImageSize = ImageSize.MEDIUM,
+    ):
+        super().__init__(
+            api_key or os.getenv('UNSPLASH_API_KEY'),
+            transport,
+            results_cache,
+            rate_limiter=rate_limiter,
+            image_size=image_size,
+        )
         if not self.api_key:
             raise PhotosAuthenticationError(
                 'API key is required. Set UNSPLASH_API_KEY environment variable or pass it explicitly.'
@@ -42,7 +79,7 @@ class UnsplashClient(PhotosClient):
         self, endpoint: str, params: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         url = f'{self.BASE_URL}{endpoint}'
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self._get(url, headers=self.headers, params=params)
 
         if response.status_code == 200:
             return response.json()
@@ -76,6 +113,9 @@ class UnsplashClient(PhotosClient):
             )
 
         return SearchResponse(
-            photo_urls=[photo['urls']['full'] for photo in data['results']],
+            photo_urls=[
+                unsplash_photo_url(photo['urls'], self.image_size)
+                for photo in data['results']
+            ],
             total_results=data['total'],
         )
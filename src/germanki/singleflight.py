@@ -0,0 +1,43 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, TypeVar
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key.
+
+    The first caller for a key runs the function. Callers that arrive while
+    it is running wait for it and get the same result, or the same exception.
+    Nothing is cached: once the call finishes, the next caller for the key
+    runs the function again.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            call.set_result(function())
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return call.result()
+
+    def __len__(self) -> int:
+        """Number of calls in flight."""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,26 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class SQLiteStore:
+    """Base class for the local SQLite-backed indexes and caches.
+
+    Each thread gets its own connection. The database runs in WAL mode with
+    a generous busy timeout, so it can be shared by several threads and
+    processes.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
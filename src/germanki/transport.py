@@ -0,0 +1,187 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import requests
+from pydantic.dataclasses import Field, dataclass
+from requests.adapters import HTTPAdapter
+
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
+
+class DownloadError(Exception):
+    pass
+
+
+@dataclass
+class HTTPTransportConfig:
+    pool_connections: int = Field(
+        default=int(os.environ.get('GERMANKI_HTTP_POOL_CONNECTIONS', 10)),
+        ge=1,
+        description='Number of hosts whose connection pools are kept alive',
+    )
+    pool_maxsize: int = Field(
+        default=int(os.environ.get('GERMANKI_HTTP_POOL_MAXSIZE', 16)),
+        ge=1,
+        description='Maximum number of kept-alive connections per host',
+    )
+    connect_timeout: float = Field(
+        default=float(os.environ.get('GERMANKI_HTTP_CONNECT_TIMEOUT', 5)),
+        gt=0,
+        description='Seconds to wait for a connection to be established',
+    )
+    read_timeout: float = Field(
+        default=float(os.environ.get('GERMANKI_HTTP_READ_TIMEOUT', 30)),
+        gt=0,
+        description='Seconds to wait for the server to send data',
+    )
+
+
+class HTTPTransport:
+    """Keep-alive HTTP session shared by all API clients.
+
+    Connections are pooled per host, so bulk runs reuse TCP/TLS connections
+    instead of opening a new one for every request.
+    """
+
+    def __init__(self, config: Optional[HTTPTransportConfig] = None):
+        self.config = config if config else HTTPTransportConfig()
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.config.connect_timeout, self.config.read_timeout)
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self) -> requests.Session:
+        logger.debug(
+            f'Creating HTTP session with {self.config.pool_maxsize} '
+            'connections per host'
+        )
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=self.config.pool_maxsize,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def download(
+        self,
+        url: str,
+        file_path: Path,
+        max_size: Optional[int] = None,
+        content_types: Optional[Sequence[str]] = None,
+        chunk_size: int = 64 * 1024,
+        **kwargs,
+    ) -> int:
+        """Streams the body of a GET request into `file_path`.
+
+        The body is written in chunks to a temporary file next to
+        `file_path`, which is renamed into place once complete, so readers
+        never see a partial file. Responses whose content type does not start
+        with one of `content_types`, or whose body exceeds `max_size` bytes,
+        raise `DownloadError`. Returns the number of bytes written.
+        """
+        file_path = Path(file_path)
+        response = self.get(url, stream=True, **kwargs)
+        try:
+            if response.status_code != 200:
+                raise DownloadError(
+                    f'Error downloading {url}: {response.status_code}'
+                )
+            self._check_content_type(url, response, content_types)
+            content_length = response.headers.get('Content-Length')
+            if max_size is not None and content_length is not None:
+                if int(content_length) > max_size:
+                    raise DownloadError(
+                        f'{url} is larger than {max_size} bytes'
+                    )
+            return self._write_chunks(
+                url, response, file_path, max_size, chunk_size
+            )
+        finally:
+            response.close()
+
+    @staticmethod
+    def _write_chunks(
+        url: str,
+        response: requests.Response,
+        file_path: Path,
+        max_size: Optional[int],
+        chunk_size: int,
+    ) -> int:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=file_path.parent, suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in response.iter_content(chunk_size):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise DownloadError(
+                            f'{url} is larger than {max_size} bytes'
+                        )
+                    file.write(chunk)
+            if size == 0:
+                raise DownloadError(f'{url} returned an empty body')
+            os.replace(tmp_name, file_path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        return size
+
+    @staticmethod
+    def _check_content_type(
+        url: str,
+        response: requests.Response,
+        content_types: Optional[Sequence[str]],
+    ) -> None:
+        content_type = response.headers.get('Content-Type')
+        if not content_types or not content_type:
+            return
+        if not any(content_type.startswith(t) for t in content_types):
+            raise DownloadError(
+                f'{url} returned unexpected content type {content_type}'
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_default_transport: Optional[HTTPTransport] = None
+_default_transport_lock = threading.Lock()
+
+
+def default_transport() -> HTTPTransport:
+    """Process-wide transport used by clients that are not given one."""
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = HTTPTransport()
+    return _default_transport
@@ -2,9 +2,17 @@ import json
 from pathlib import Path
 from typing import Optional
 
-import requests
 from pydantic.dataclasses import dataclass
 
+from germanki.transport import (
+    DownloadError,
+    HTTPTransport,
+    default_transport,
+)
+from germanki.utils import get_logger
+
+logger = get_logger(__file__)
+
 
 @dataclass
 class TTSResponse:
@@ -15,9 +23,17 @@ class TTSResponse:
 
 class TTSAPI:
     DEFAULT_BASE_URL = 'https://ttsmp3.com'
+    # spoken words and sentences are a few dozen kilobytes
+    MAX_MP3_SIZE = 5 * 1024 * 1024
+    MP3_CONTENT_TYPES = ('audio/', 'application/octet-stream')
 
-    def __init__(self, base_url: str = DEFAULT_BASE_URL):
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        transport: Optional[HTTPTransport] = None,
+    ):
         self.base_url = base_url
+        self.transport = transport if transport else default_transport()
 
     def _get_headers(self):
         return {
@@ -28,7 +44,7 @@ class TTSAPI:
     # TODO: better error handling
     def request_tts(self, msg: str, lang: str) -> TTSResponse:
         url = f'{self.base_url}/makemp3_new.php'
-        response = requests.post(
+        response = self.transport.post(
             url,
             headers=self._get_headers(),
             data=dict(
@@ -60,18 +76,20 @@ class TTSAPI:
     # TODO: better error handling
     def download_mp3(self, mp3_url: str, file_path: Path) -> bool:
         url = f'{self.base_url}/dlmp3.php'
-        response = requests.get(
-            url,
-            headers=self._get_headers(),
-            params=dict(
-                mp3=mp3_url,
-                location='direct',
-            ),
-            allow_redirects=True,
-        )
-
-        if response.status_code == 200:
-            with open(file_path, 'wb') as file:
-                file.write(response.content)
-            return True
-        return False
+        try:
+            self.transport.download(
+                url,
+                file_path,
+                max_size=self.MAX_MP3_SIZE,
+                content_types=self.MP3_CONTENT_TYPES,
+                headers=self._get_headers(),
+                params=dict(
+                    mp3=mp3_url,
+                    location='direct',
+                ),
+                allow_redirects=True,
+            )
+        except DownloadError as e:
+            logger.debug(f'Could not download MP3: {e}')
+            return False
+        return True
@@ -1,14 +1,18 @@
 from abc import ABC, abstractmethod
 from enum import Enum
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 import streamlit as st
 import yaml
 from pydantic import Field
 from pydantic.dataclasses import dataclass
 
-from germanki.chatgpt import WEB_UI_CHATGPT_PROMPT, ChatGPTAPI
+from germanki.chatgpt import (
+    WEB_UI_CHATGPT_PROMPT,
+    CardContentsCache,
+    ChatGPTAPI,
+)
 from germanki.config import Config
 from germanki.core import (
     AnkiCardCreator,
@@ -18,9 +22,19 @@ from germanki.core import (
     Germanki,
     MediaUpdateExceptions,
 )
+from germanki.jobs import (
+    BackgroundJob,
+    CardStatus,
+    ImportJob,
+    JobJournal,
+    JobState,
+    job_id_for,
+)
+from germanki.photos.fallback import FallbackPhotosClient
 from germanki.photos.pexels import PexelsClient
 from germanki.photos.unsplash import UnsplashClient
 from germanki.static import audio, input_examples
+from germanki.transport import default_transport
 from germanki.utils import get_logger
 
 logger = get_logger(__file__)
@@ -47,6 +61,7 @@ class InputSource(Enum):
 class PhotoSource(Enum):
     PEXELS = 'Pexels'
     UNSPLASH = 'Unsplash'
+    AUTO = 'Auto'
 
     @staticmethod
     def from_str(photo_source_text: str) -> 'PhotoSource':
@@ -85,11 +100,15 @@ class InputSourceUIHandler(ABC):
 
 
 class ChatGPTUIHandler(InputSourceUIHandler):
-    def __init__(self, openai_api_key: str):
+    def __init__(
+        self,
+        openai_api_key: str,
+        cache: Optional[CardContentsCache] = None,
+    ):
         self.openai_api_key = openai_api_key
         if not self.openai_api_key:
             raise OpenAPIKeyNotProvided('OpenAI API key not provided')
-        self.chatgpt_api = ChatGPTAPI(openai_api_key)
+        self.chatgpt_api = ChatGPTAPI(openai_api_key, cache=cache)
 
     def parse(self, input_text: str) -> List[AnkiCardInfo]:
         logger.info(
@@ -145,31 +164,61 @@ class ManualInputUIHandler(InputSourceUIHandler):
 
 
 class UIController:
+    # seconds to wait for a photo provider before also asking the next one
+    PHOTO_HEDGE_AFTER = 2.0
+    # seconds between refreshes of the preview while a job runs
+    JOB_POLL_INTERVAL = 0.5
+    # cards added to Anki per request, and between two cancel checks
+    CREATE_BATCH_SIZE = 20
+    CARD_STATUS_ICONS = {
+        CardStatus.PENDING: '⏳',
+        CardStatus.FAILED: '⚠️',
+        CardStatus.CANCELLED: '⏹️',
+    }
+
     _germanki: Germanki
     _refresh_config: PreviewRefreshConfig
     _input_source: InputSource
     ui_handler: InputSourceUIHandler
     preview_columns: int
+    preview_page_size: int
+    _preview_page: int
     fallback_input_source: InputSource
     _photo_source: PhotoSource
+    _job: Optional[BackgroundJob]
+    _journal: JobJournal
+    _import_job: Optional[ImportJob]
 
     def __init__(
         self,
         default_input_source: InputSource,
         preview_columns: int = 3,
+        preview_page_size: int = 12,
         fallback_input_source: InputSource = InputSource.MANUAL,
         default_photo_source: PhotoSource = PhotoSource.PEXELS,
     ):
         config = Config()
+        transport = default_transport()
         self._germanki = Germanki(
-            PexelsClient(config.pexels_api_key), config=config
+            PexelsClient(
+                config.pexels_api_key,
+                transport=transport,
+                image_size=config.image_size,
+            ),
+            config=config,
+            transport=transport,
         )
         self.preview_columns = preview_columns
+        self.preview_page_size = preview_page_size
+        self._preview_page = 0
         try:
             self.input_source = default_input_source
         except:
             self.input_source = fallback_input_source
         self._photo_source = default_photo_source
+        self._job = None
+        self._journal = JobJournal(config.cache_filepath('jobs.sqlite3'))
+        self._import_job = None
 
         # ensures nothing is refreshed at first
         self._refresh_config = self._refresh_nothing_config()
@@ -184,7 +233,10 @@ class UIController:
         if input_source == InputSource.CHATGPT:
             try:
                 self.ui_handler = ChatGPTUIHandler(
-                    self._germanki.config.openai_api_key
+                    self._germanki.config.openai_api_key,
+                    cache=CardContentsCache(
+                        self._germanki.config.cache_filepath('chatgpt.sqlite3')
+                    ),
                 )
             except OpenAPIKeyNotProvided:
                 raise OpenAPIKeyNotProvided(
@@ -203,25 +255,82 @@ class UIController:
 
     @photo_source.setter
     def photo_source(self, photo_source: PhotoSource):
+        # set on every rerun: the client, with the provider statistics a
+        # fallback client learns from, is only replaced on a change
+        if photo_source != self._photo_source:
+            self._use_photo_source(photo_source)
+
+    def _use_photo_source(self, photo_source: PhotoSource) -> None:
         if photo_source == PhotoSource.PEXELS:
             if not self._germanki.config.pexels_api_key:
                 st.warning('Pexels API key not provided.')
                 return
             self._germanki.photos_client = PexelsClient(
-                self._germanki.config.pexels_api_key
+                self._germanki.config.pexels_api_key,
+                transport=self._germanki.transport,
+                image_size=self._germanki.config.image_size,
             )
         if photo_source == PhotoSource.UNSPLASH:
             if not self._germanki.config.unsplash_api_key:
                 st.warning('Unsplash API key not provided.')
                 return
             self._germanki.photos_client = UnsplashClient(
-                self._germanki.config.unsplash_api_key
+                self._germanki.config.unsplash_api_key,
+                transport=self._germanki.transport,
+                image_size=self._germanki.config.image_size,
+            )
+        if photo_source == PhotoSource.AUTO:
+            clients = []
+            if self._germanki.config.pexels_api_key:
+                clients.append(
+                    PexelsClient(
+                        self._germanki.config.pexels_api_key,
+                        transport=self._germanki.transport,
+                        image_size=self._germanki.config.image_size,
+                    )
+                )
+            if self._germanki.config.unsplash_api_key:
+                clients.append(
+                    UnsplashClient(
+                        self._germanki.config.unsplash_api_key,
+                        transport=self._germanki.transport,
+                        image_size=self._germanki.config.image_size,
+                    )
+                )
+            if not clients:
+                st.warning('No photo API key provided.')
+                return
+            self._germanki.photos_client = FallbackPhotosClient(
+                clients,
+                hedge_after=self.PHOTO_HEDGE_AFTER,
+                transport=self._germanki.transport,
+                image_size=self._germanki.config.image_size,
             )
         if photo_source not in list(PhotoSource):
             st.warning(f'Invalid photo source {photo_source}.')
 
         self._photo_source = photo_source
 
+    @property
+    def preview_page_count(self) -> int:
+        card_count = len(self._germanki.card_contents)
+        return max(1, -(-card_count // self.preview_page_size))
+
+    @property
+    def preview_page(self) -> int:
+        return min(self._preview_page, self.preview_page_count - 1)
+
+    @preview_page.setter
+    def preview_page(self, page: int):
+        self._preview_page = max(0, min(page, self.preview_page_count - 1))
+
+    def visible_card_indexes(self) -> range:
+        start = self.preview_page * self.preview_page_size
+        end = min(
+            start + self.preview_page_size, len(self._germanki.card_contents)
+        )
+        return range(start, end)
+
     @property
     def default_window_height(self) -> int:
         return 400
@@ -252,6 +361,8 @@ class UIController:
             self._germanki.config.openai_api_key = openai_api_key
         if unsplash_api_key:
             self._germanki.config.unsplash_api_key = unsplash_api_key
+        if pexels_api_key or unsplash_api_key:
+            self._use_photo_source(self._photo_source)
 
     def select_speaker_action(self, selected_speaker_input: str) -> None:
         # TODO: play sample audio
@@ -268,67 +379,282 @@ class UIController:
             st.write('Sample audio:')
             st.audio(sample_audio_path.read_bytes(), format='audio/mpeg')
 
-    def preview_cards_action(self, cards_input: str) -> None:
-        try:
-            st.info('Parsing Input...')
-            card_contents = self.ui_handler.parse(cards_input)
-            st.info('Generating Preview...')
-            self._germanki.card_contents = card_contents
-        except (InvalidManualInputException, InvalidManualInputException) as e:
-            st.warning(f'Please provide valid card contents. Error: {e}')
-        except MediaUpdateExceptions as e:
-            st.warning(f'Could not update card media. Errors: {e.exceptions}')
+    @property
+    def job(self) -> Optional[BackgroundJob]:
+        return self._job
 
-        self._refresh_config = PreviewRefreshConfig(RefreshOption.ALL)
+    @property
+    def job_running(self) -> bool:
+        return self._job is not None and self._job.running
 
-    def create_cards_action(self, deck_name: str):
-        try:
-            responses: List[CreateCardResponse] = self.create_cards(deck_name)
-            for response in responses:
-                if not response.exception:
-                    continue
+    def _start_job(
+        self, description: str, function: Callable[[BackgroundJob], None]
+    ) -> None:
+        if self.job_running:
+            st.warning(
+                f'{self._job.description} is still running. '
+                'Wait for it or cancel it first.'
+            )
+            return
+        self._job = BackgroundJob(description, function).start()
 
-                st.warning(
-                    f"Error while adding card '{response.card_word}'. {response.exception}"
+    def preview_cards_action(
+        self, cards_input: str, deck_name: Optional[str] = None
+    ) -> None:
+        ui_handler = self.ui_handler
+        # the job ID derives from the inputs rather than living in the
+        # session, so previewing the same input again, even after a reload,
+        # resumes the job instead of parsing and fetching everything again
+        import_job = ImportJob(
+            self._germanki,
+            self._journal,
+            job_id_for(
+                'ui',
+                self._input_source.value,
+                self._photo_source.value,
+                self.selected_speaker,
+                deck_name or '',
+                cards_input,
+            ),
+        )
+
+        def preview(job: BackgroundJob) -> None:
+            job.status = 'Parsing input'
+            import_job.parse(lambda: ui_handler.parse(cards_input))
+            self._import_job = import_job
+            created_words = ', '.join(
+                card.word for card in import_job.created_cards()
+            )
+            if created_words:
+                job.messages.append(
+                    f'Cards added by an earlier run: {created_words}'
+                )
+            job.status = 'Checking the deck'
+            self.preview_page = 0
+
+            def on_start(total: int) -> None:
+                # only the cards left after the deck check are tracked
+                job.status = 'Fetching media'
+                job.start_cards(total)
+
+            def on_card(index: int, exceptions) -> None:
+                job.card_done(
+                    index,
+                    ', '.join(
+                        f'{e.media_type}: {e.query}' for e in exceptions
+                    ),
                 )
 
-        except Exception as e:
-            st.warning(f'Error while adding cards. {e}')
-            raise
+            try:
+                import_job.fetch_media(
+                    deck_name,
+                    progress=job.progress,
+                    on_card=on_card,
+                    cancelled=job.cancelled,
+                    on_start=on_start,
+                )
+            except MediaUpdateExceptions as e:
+                job.warnings.append(
+                    f'Could not update card media. Errors: {e.exceptions}'
+                )
+            if self._germanki.skipped_cards:
+                skipped_words = ', '.join(
+                    card.word for card in self._germanki.skipped_cards
+                )
+                job.messages.append(
+                    f'Skipped cards already in deck {deck_name}: '
+                    f'{skipped_words}'
+                )
+
+        self._start_job('Preview', preview)
+        self._refresh_config = PreviewRefreshConfig(RefreshOption.ALL)
+
+    def create_cards_action(self, deck_name: str):
+        import_job = self._import_job
+        if import_job is None:
+            st.warning('Preview the cards before creating them.')
+            return
+
+        def create(job: BackgroundJob) -> None:
+            total = len(self._germanki.card_contents)
+            job.status = f'Adding cards to {deck_name}'
+            job.start_cards(total)
+
+            def on_batch(start: int, responses) -> None:
+                for offset, response in enumerate(responses):
+                    error = response.exception
+                    job.card_done(start + offset, str(error or ''))
+                    if error:
+                        job.warnings.append(
+                            f"Error while adding card '{response.card_word}'. "
+                            f'{error}'
+                        )
+                job.progress(start + len(responses), total)
+
+            # each batch is recorded in the job, so creating the cards again
+            # only adds the notes Anki did not accept
+            import_job.create_cards(
+                deck_name,
+                batch_size=self.CREATE_BATCH_SIZE,
+                on_batch=on_batch,
+                cancelled=job.cancelled,
+            )
+
+        self._start_job('Card creation', create)
         self._refresh_nothing_config()
 
     def create_cards(self, deck_name: str) -> List[CreateCardResponse]:
         return self._germanki.create_cards(deck_name)
 
-    def refresh_preview(self):
+    def draw_job_progress(self, polling: bool = False) -> None:
+        job = self._job
+        if job is None:
+            return
+        if job.running:
+            eta = f', about {job.eta:.0f}s left' if job.eta is not None else ''
+            fraction = job.done / job.total if job.total else 0.0
+            columns = st.columns([5, 1], vertical_alignment='center')
+            with columns[0]:
+                st.progress(
+                    fraction,
+                    text=f'{job.status}: {job.done}/{job.total} cards{eta}',
+                )
+            with columns[1]:
+                st.button(
+                    'Cancel',
+                    icon='⏹️',
+                    key='cancel_job',
+                    on_click=job.cancel,
+                    disabled=job.cancelled.is_set(),
+                    use_container_width=True,
+                )
+            return
+
+        if polling:
+            # reruns the whole app once, so the fragment stops polling and
+            # the buttons are enabled again
+            st.rerun()
+        if job.state == JobState.FAILED:
+            if isinstance(job.exception, InputSourceHandlerException):
+                st.warning(
+                    f'Please provide valid card contents. Error: '
+                    f'{job.exception}'
+                )
+            else:
+                st.warning(f'{job.description} failed. {job.exception}')
+        elif job.state == JobState.CANCELLED:
+            st.info(
+                f'{job.description} cancelled after {job.done} of '
+                f'{job.total} cards.'
+            )
+        for message in job.messages:
+            st.info(message)
+        for warning in job.warnings:
+            st.warning(warning)
+
+    def refresh_preview(self, polling: bool = False):
+        """Draws the progress of the current job and the preview grid.
+
+        Meant to run in a fragment that reruns every `JOB_POLL_INTERVAL`
+        while a job runs, so cards show up as soon as their media is ready.
+        """
+        self.draw_job_progress(polling)
+        # a running preview job may replace the cards while they are drawn,
+        # so the grid is drawn from the list as it is now
+        cards = self._germanki.card_contents
+        # only the cards of the current page are rendered, so the page
+        # payload (including inlined audio) does not grow with the deck
+        if cards:
+            self.draw_page_navigation()
+        visible = self.visible_card_indexes()
         preview_cols = st.columns(self.preview_columns)
-        for index in range(len(self._germanki.card_contents)):
-            with preview_cols[index % self.preview_columns]:
-                self.draw_card(index)
+        for position, card_contents in enumerate(
+            cards[visible.start : visible.stop]
+        ):
+            with preview_cols[position % self.preview_columns]:
+                self.draw_card(visible.start + position, card_contents)
 
-    def draw_card(self, index: int):
-        card: AnkiCardHTMLPreview = AnkiCardCreator.html_preview(
-            self._germanki.card_contents[index]
-        )
+    def draw_page_navigation(self):
+        def go_to_page(page: int) -> None:
+            self.preview_page = page
+
+        def set_page_size() -> None:
+            first_visible_card = self.preview_page * self.preview_page_size
+            self.preview_page_size = st.session_state['preview_page_size']
+            self.preview_page = first_visible_card // self.preview_page_size
+
+        visible = self.visible_card_indexes()
+        columns = st.columns([1, 3, 1, 2], vertical_alignment='center')
+        with columns[0]:
+            st.button(
+                'Previous',
+                icon='⬅️',
+                key='preview_previous_page',
+                disabled=self.preview_page == 0,
+                on_click=go_to_page,
+                args=(self.preview_page - 1,),
+                use_container_width=True,
+            )
+        with columns[1]:
+            st.markdown(
+                f'Page {self.preview_page + 1} of {self.preview_page_count} '
+                f'(cards {visible.start + 1}-{visible.stop} of '
+                f'{len(self._germanki.card_contents)})'
+            )
+        with columns[2]:
+            st.button(
+                'Next',
+                icon='➡️',
+                key='preview_next_page',
+                disabled=self.preview_page >= self.preview_page_count - 1,
+                on_click=go_to_page,
+                args=(self.preview_page + 1,),
+                use_container_width=True,
+            )
+        with columns[3]:
+            page_sizes = sorted({6, 12, 24, 48, self.preview_page_size})
+            st.selectbox(
+                'Cards per page',
+                page_sizes,
+                index=page_sizes.index(self.preview_page_size),
+                key='preview_page_size',
+                on_change=set_page_size,
+                label_visibility='collapsed',
+            )
+
+    def draw_card(self, index: int, card_contents: AnkiCardInfo):
+        card: AnkiCardHTMLPreview = AnkiCardCreator.html_preview(card_contents)
 
         def set_selected_index() -> None:
             self.status_bar = 'Refreshing image...'
             logger.info(
-                f'Requested image refresh for card {self._germanki.card_contents[index].word}'
+                f'Requested image refresh for card {card_contents.word}'
             )
             try:
-                self._germanki.update_card_image(index)
+                # the card is looked up again, in case the cards changed
+                # since it was drawn
+                current_index = next(
+                    i
+                    for i, current in enumerate(self._germanki.card_contents)
+                    if current is card_contents
+                )
+                self._germanki.update_card_image(current_index)
+                if self._import_job is not None:
+                    self._import_job.record_card(card_contents)
+            except StopIteration:
+                st.warning('The card is no longer in the preview.')
             except Exception as e:
                 st.warning(f'Could not add media to card. Error: {e}')
             self.status_bar = ''
 
         def add_refresh_button() -> None:
             st.button(
-                f'Refresh Image (search terms: {self._germanki.card_contents[index].query_words})',
+                f'Refresh Image (search terms: {card_contents.query_words})',
                 icon='🔄',
                 type='secondary',
                 key=f'refresh_images_{index}',
                 on_click=set_selected_index,
+                disabled=self.job_running,
                 use_container_width=True,
             )
 
@@ -357,9 +683,10 @@ class UIController:
             st.markdown(card_part_contents_html(text), unsafe_allow_html=True)
 
         # Start of UI refresh
+        status = self._job.card_status(index) if self._job else None
         with st.expander(
             f'**Card {index+1}**',
-            icon='📄',
+            icon=self.CARD_STATUS_ICONS.get(status, '📄'),
             expanded=True,
         ):
             add_refresh_button()
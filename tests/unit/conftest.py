@@ -0,0 +1,26 @@
+from pathlib import Path
+
+import pytest
+
+from germanki.config import Config
+from germanki.core import Germanki
+from germanki.photos.cache import SearchResultsCache
+from germanki.photos.pexels import PexelsClient
+
+
+@pytest.fixture
+def germanki_instance(tmp_path: Path):
+    config = Config(
+        pexels_api_key='test_key',
+        openai_api_key='test_key',
+        audio_downloads_folder=tmp_path / 'audio',
+        image_downloads_folder=tmp_path / 'image',
+        media_index_path=tmp_path / 'media.sqlite3',
+        cache_folder=tmp_path / 'cache',
+    )
+    return Germanki(
+        photos_client=PexelsClient(
+            'test_key', results_cache=SearchResultsCache()
+        ),
+        config=config,
+    )
@@ -1,5 +1,8 @@
+import base64
+import hashlib
+import json
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 
@@ -10,7 +13,11 @@ from germanki.anki_connect import (
     AnkiConnectResponseError,
     AnkiMedia,
     AnkiMediaType,
+    Base64File,
+    StreamingJSONBody,
+    escape_search_text,
 )
+from germanki.anki_uploads import MediaUploadLedger
 
 
 @pytest.fixture()
@@ -32,17 +39,19 @@ def test_card():
 
 
 @pytest.fixture()
-def test_card_with_media():
+def test_card_with_media(tmp_path: Path):
+    (tmp_path / 'test.jpg').write_bytes(b'image_data')
+    (tmp_path / 'test.mp3').write_bytes(b'audio_data')
     return AnkiCard(
         front='Front Content',
         back='Back Content',
         media=[
             AnkiMedia(
-                path=Path('test.jpg'),
+                path=tmp_path / 'test.jpg',
                 anki_media_type=AnkiMediaType.IMAGE,
             ),
             AnkiMedia(
-                path=Path('test.mp3'),
+                path=tmp_path / 'test.mp3',
                 anki_media_type=AnkiMediaType.AUDIO,
             ),
         ],
@@ -205,3 +214,308 @@ def test_add_note_payload_params_with_tags_and_model(
     assert payload['tags'] == ['automated', 'custom_tag']
     assert payload['modelName'] == model
     assert payload['options']['allowDuplicate'] == allow_duplicate
+
+
+@patch('pathlib.Path.exists')
+@patch('requests.Session.post')
+@patch('pathlib.Path.read_bytes')
+def test_add_cards_batches_requests(
+    mock_read_bytes,
+    mock_post,
+    mock_exists,
+    anki_client: AnkiConnectClient,
+    deck_name,
+    test_card,
+    test_card_with_media,
+):
+    mock_exists.return_value = True
+    mock_read_bytes.return_value = b'image_data'
+
+    def respond(url, json, timeout):
+        response = MagicMock(status_code=200)
+        if json['action'] == 'deckNames':
+            response.json.return_value = {'result': [deck_name]}
+        elif json['action'] == 'multi':
+            actions = json['params']['actions']
+            results = [{'result': 1, 'error': None} for _ in actions]
+            if actions[0]['action'] == 'addNote':
+                results[1] = {
+                    'result': None,
+                    'error': 'cannot create note because it is a duplicate',
+                }
+            response.json.return_value = {'result': results, 'error': None}
+        return response
+
+    mock_post.side_effect = respond
+    errors = anki_client.add_cards(
+        deck_name, [test_card, test_card_with_media, test_card]
+    )
+
+    actions = [
+        call_args[1]['json']['action']
+        for call_args in mock_post.call_args_list
+    ]
+    assert actions == ['deckNames', 'multi', 'multi']
+    assert errors[0] is None
+    assert isinstance(errors[1], AnkiConnectResponseError)
+    assert errors[2] is None
+
+
+@patch('requests.Session.post')
+def test_add_cards_maps_missing_media_to_card(
+    mock_post,
+    anki_client: AnkiConnectClient,
+    deck_name,
+    test_card,
+    test_card_with_media,
+):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {
+        'result': [{'result': 1, 'error': None}],
+        'error': None,
+    }
+    test_card_with_media.media[0].path.unlink()
+    with patch.object(anki_client, '_deck_exists', return_value=True):
+        errors = anki_client.add_cards(
+            deck_name, [test_card_with_media, test_card]
+        )
+
+    assert isinstance(errors[0], AnkiConnectResponseError)
+    assert errors[1] is None
+    note_actions = mock_post.call_args[1]['json']['params']['actions']
+    assert len(note_actions) == 1
+
+
+def test_streaming_json_body_matches_json(tmp_path: Path):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(bytes(range(256)) * 1000)
+    payload = {
+        'action': 'storeMediaFile',
+        'params': {'filename': 'image.jpg', 'data': Base64File(image)},
+    }
+
+    body = StreamingJSONBody(payload)
+    chunks = []
+    while chunk := body.read(1000):
+        chunks.append(chunk)
+
+    expected = json.dumps(
+        {
+            'action': 'storeMediaFile',
+            'params': {
+                'filename': 'image.jpg',
+                'data': base64.b64encode(image.read_bytes()).decode(),
+            },
+        }
+    ).encode()
+    assert b''.join(chunks) == expected
+    assert len(body) == len(expected)
+
+
+def test_local_anki_reads_media_from_path(anki_client: AnkiConnectClient):
+    params = anki_client._upload_media_params(
+        AnkiMedia(path=Path('image.jpg'), anki_media_type=AnkiMediaType.IMAGE)
+    )
+    assert params == {
+        'filename': 'image.jpg',
+        'path': str(Path('image.jpg').resolve()),
+    }
+
+
+@patch('requests.Session.post')
+def test_remote_anki_receives_streamed_media(mock_post, tmp_path: Path):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image_data')
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {'result': 'image.jpg'}
+
+    client = AnkiConnectClient(host='http://192.168.0.10')
+    client.upload_media(
+        AnkiMedia(path=image, anki_media_type=AnkiMediaType.IMAGE)
+    )
+
+    body = mock_post.call_args[1]['data']
+    assert isinstance(body, StreamingJSONBody)
+    assert (
+        json.loads(body.read())['params']['data']
+        == base64.b64encode(b'image_data').decode()
+    )
+
+
+@pytest.fixture()
+def stored_media(tmp_path: Path):
+    data = b'stored image'
+    path = tmp_path / f'{hashlib.sha256(data).hexdigest()}.jpg'
+    path.write_bytes(data)
+    return AnkiMedia(path=path, anki_media_type=AnkiMediaType.IMAGE)
+
+
+def multi_responder(existing_files):
+    def respond(url, json, timeout):
+        response = MagicMock(status_code=200)
+        results = []
+        for action in json['params']['actions']:
+            if action['action'] == 'getMediaFilesNames':
+                pattern = action['params']['pattern']
+                result = [pattern] if pattern in existing_files else []
+            else:
+                result = 1
+            results.append({'result': result, 'error': None})
+        response.json.return_value = {'result': results, 'error': None}
+        return response
+
+    return respond
+
+
+@patch('requests.Session.post')
+def test_add_cards_skips_media_anki_has(
+    mock_post, tmp_path: Path, deck_name, stored_media
+):
+    ledger = MediaUploadLedger(tmp_path / 'uploads.sqlite3')
+    client = AnkiConnectClient(upload_ledger=ledger)
+    cards = [
+        AnkiCard(front=f'{i}', back='back', media=[stored_media])
+        for i in range(3)
+    ]
+    mock_post.side_effect = multi_responder({stored_media.filename})
+
+    with patch.object(client, '_deck_exists', return_value=True):
+        assert client.add_cards(deck_name, cards) == [None] * 3
+        sent = [
+            [
+                action['action']
+                for action in call[1]['json']['params']['actions']
+            ]
+            for call in mock_post.call_args_list
+        ]
+        assert sent == [['getMediaFilesNames'], ['addNote'] * 3]
+
+    # a ledger entry does not replace the lookup: the profile open in Anki
+    # may have changed, and the media is uploaded to it again
+    mock_post.reset_mock()
+    mock_post.side_effect = multi_responder(set())
+    with patch.object(client, '_deck_exists', return_value=True):
+        client.add_cards(deck_name, cards)
+    sent = [
+        [action['action'] for action in call[1]['json']['params']['actions']]
+        for call in mock_post.call_args_list
+    ]
+    assert sent == [
+        ['getMediaFilesNames'],
+        ['storeMediaFile'],
+        ['addNote'] * 3,
+    ]
+
+
+@patch('requests.Session.post')
+def test_ledger_vouches_for_named_media(mock_post, tmp_path: Path, deck_name):
+    path = tmp_path / 'Hund.mp3'
+    path.write_bytes(b'audio')
+    media = AnkiMedia(path=path, anki_media_type=AnkiMediaType.AUDIO)
+    ledger = MediaUploadLedger(tmp_path / 'uploads.sqlite3')
+    client = AnkiConnectClient(upload_ledger=ledger)
+    mock_post.side_effect = multi_responder({media.filename})
+
+    # a file named after its query may hold other contents in Anki
+    assert client._missing_media([media]) == [media]
+    mock_post.assert_not_called()
+
+    ledger.record(
+        client.base_url, media.filename, hashlib.sha256(b'audio').hexdigest()
+    )
+    assert client._missing_media([media]) == []
+    mock_post.assert_called_once()
+
+
+@patch('requests.Session.post')
+def test_add_cards_uploads_shared_media_once(
+    mock_post, tmp_path: Path, deck_name, stored_media
+):
+    ledger = MediaUploadLedger(tmp_path / 'uploads.sqlite3')
+    client = AnkiConnectClient(upload_ledger=ledger)
+    cards = [
+        AnkiCard(front=f'{i}', back='back', media=[stored_media])
+        for i in range(2)
+    ]
+    mock_post.side_effect = multi_responder(set())
+
+    with patch.object(client, '_deck_exists', return_value=True):
+        client.add_cards(deck_name, cards)
+
+    store_actions = mock_post.call_args_list[1][1]['json']['params']['actions']
+    assert [action['action'] for action in store_actions] == ['storeMediaFile']
+    assert ledger.is_uploaded(
+        client.base_url,
+        stored_media.filename,
+        stored_media.path.stem,
+    )
+
+
+@patch('requests.Session.post')
+def test_deck_names_are_cached(mock_post, deck_name, test_card):
+    decks = ['Default']
+
+    def respond(url, json, timeout):
+        response = MagicMock(status_code=200)
+        if json['action'] == 'deckNames':
+            response.json.return_value = {'result': list(decks)}
+        else:
+            if json['action'] == 'createDeck':
+                decks.append(json['params']['deck'])
+            response.json.return_value = {'result': 1}
+        return response
+
+    mock_post.side_effect = respond
+    client = AnkiConnectClient()
+    for _ in range(3):
+        client.add_card(deck_name, test_card)
+
+    actions = [call[1]['json']['action'] for call in mock_post.call_args_list]
+    # the cache is refreshed once after the deck is created
+    assert actions == [
+        'deckNames',
+        'createDeck',
+        'addNote',
+        'deckNames',
+        'addNote',
+        'addNote',
+    ]
+
+
+def test_escape_search_text():
+    assert escape_search_text('a*b_c"d\\e') == 'a\\*b\\_c\\"d\\\\e'
+
+
+@patch('requests.Session.post')
+def test_find_existing_words(mock_post, anki_client: AnkiConnectClient):
+    mock_post.return_value.status_code = 200
+    mock_post.return_value.json.return_value = {
+        'result': [
+            {'result': [], 'error': None},
+            {'result': [1234], 'error': None},
+        ],
+        'error': None,
+    }
+    with patch.object(anki_client, 'deck_names', return_value=['My Deck']):
+        existing = anki_client.find_existing_words(
+            'My Deck', ['Hallo', 'das_Haus']
+        )
+
+    assert existing == [False, True]
+    queries = [
+        action['params']['query']
+        for action in mock_post.call_args[1]['json']['params']['actions']
+    ]
+    assert queries == [
+        '"deck:My Deck" "front:Hallo<br>*"',
+        '"deck:My Deck" "front:das\\_Haus<br>*"',
+    ]
+
+
+@patch('requests.Session.post')
+def test_find_existing_words_in_missing_deck(
+    mock_post, anki_client: AnkiConnectClient
+):
+    with patch.object(anki_client, 'deck_names', return_value=[]):
+        assert anki_client.find_existing_words('New', ['Hallo']) == [False]
+    mock_post.assert_not_called()
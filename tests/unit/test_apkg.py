@@ -0,0 +1,93 @@
+import json
+import sqlite3
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from germanki.anki_connect import AnkiCard, AnkiMedia, AnkiMediaType
+from germanki.apkg import ApkgExporter
+
+
+@pytest.fixture()
+def anki_cards(tmp_path: Path):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image bytes')
+    audio = tmp_path / 'audio.mp3'
+    audio.write_bytes(b'audio bytes')
+    return [
+        AnkiCard(
+            front=f'{word}<br>[sound:audio.mp3]',
+            back=f'{translation}<br><img src="image.jpg">',
+            extra='',
+            media=[
+                AnkiMedia(anki_media_type=AnkiMediaType.IMAGE, path=image),
+                AnkiMedia(anki_media_type=AnkiMediaType.AUDIO, path=audio),
+            ],
+        )
+        for word, translation in [('Hund', 'dog'), ('Katze', 'cat')]
+    ]
+
+
+def read_collection(package: zipfile.ZipFile, tmp_path: Path):
+    collection_path = tmp_path / 'collection.anki2'
+    collection_path.write_bytes(package.read('collection.anki2'))
+    return sqlite3.connect(collection_path)
+
+
+def test_write_package(anki_cards, tmp_path: Path):
+    output_path = tmp_path / 'out' / 'deck.apkg'
+    ApkgExporter(default_tags=['test']).write('Tiere', anki_cards, output_path)
+
+    with zipfile.ZipFile(output_path) as package:
+        media_map = json.loads(package.read('media'))
+        # media shared by both cards is stored once
+        assert sorted(media_map.values()) == ['audio.mp3', 'image.jpg']
+        for index, filename in media_map.items():
+            assert package.read(index) == (tmp_path / filename).read_bytes()
+
+        connection = read_collection(package, tmp_path / 'out')
+        notes = connection.execute(
+            'SELECT flds, sfld, tags FROM notes ORDER BY id'
+        ).fetchall()
+        assert notes[0] == (
+            'Hund<br>[sound:audio.mp3]\x1fdog<br><img src="image.jpg">\x1f',
+            'Hund',
+            ' test ',
+        )
+        decks = json.loads(
+            connection.execute('SELECT decks FROM col').fetchone()[0]
+        )
+        deck_id = next(
+            int(i) for i, deck in decks.items() if deck['name'] == 'Tiere'
+        )
+        assert connection.execute(
+            'SELECT did, due FROM cards ORDER BY id'
+        ).fetchall() == [(deck_id, 1), (deck_id, 2)]
+        models = json.loads(
+            connection.execute('SELECT models FROM col').fetchone()[0]
+        )
+        (model,) = models.values()
+        assert [f['name'] for f in model['flds']] == ['Front', 'Back', 'Extra']
+
+
+def test_guids_are_stable_across_exports(anki_cards, tmp_path: Path):
+    guids = []
+    for name in ('first.apkg', 'second.apkg'):
+        ApkgExporter().write('Tiere', anki_cards, tmp_path / name)
+        with zipfile.ZipFile(tmp_path / name) as package:
+            connection = read_collection(package, tmp_path)
+            guids.append(
+                connection.execute('SELECT guid FROM notes').fetchall()
+            )
+            connection.close()
+    assert guids[0] == guids[1]
+    assert len(set(guids[0])) == 2
+
+
+def test_missing_media_leaves_no_package(anki_cards, tmp_path: Path):
+    anki_cards[0].media[0].path.unlink()
+    output_path = tmp_path / 'deck.apkg'
+    with pytest.raises(FileNotFoundError):
+        ApkgExporter().write('Tiere', anki_cards, output_path)
+    assert list(tmp_path.glob('*.apkg*')) == []
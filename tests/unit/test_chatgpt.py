@@ -0,0 +1,144 @@
+from unittest.mock import patch
+
+import pytest
+
+from germanki.chatgpt import CardContentsCache, ChatGPTAPI
+from germanki.core import AnkiCardInfo
+
+
+def card(input_line: str, word: str) -> dict:
+    return {
+        'input': input_line,
+        'word': word,
+        'translations': [word],
+        'definition': '',
+        'examples': [],
+        'extra': '',
+        'image_query_words': [word],
+    }
+
+
+@pytest.fixture()
+def chatgpt_api():
+    return ChatGPTAPI(openai_api_key='fake-key', lines_per_chunk=2)
+
+
+def fake_complete(prompt: str) -> dict:
+    lines = prompt.splitlines()
+    # answer out of order, with two cards for "sich freuen"
+    cards = []
+    for line in reversed(lines):
+        if line == 'sich freuen':
+            cards.append(card(line, 'sich freuen + über + akk.'))
+            cards.append(card('freuen', 'sich freuen + auf + akk.'))
+        else:
+            cards.append(card(line, line.capitalize()))
+    return {'card_contents': cards}
+
+
+def test_query_splits_input_in_chunks(chatgpt_api: ChatGPTAPI):
+    with patch.object(
+        chatgpt_api, '_complete', side_effect=fake_complete
+    ) as mock_complete:
+        collection = chatgpt_api.query('hund\n\nkatze\nsich freuen\nmaus\n')
+
+    prompts = sorted(call.args[0] for call in mock_complete.call_args_list)
+    assert prompts == ['hund\nkatze', 'sich freuen\nmaus']
+    assert [card.word for card in collection.card_contents] == [
+        'Hund',
+        'Katze',
+        'sich freuen + über + akk.',
+        'sich freuen + auf + akk.',
+        'Maus',
+    ]
+
+
+def test_query_matches_lines_ignoring_spaces(chatgpt_api: ChatGPTAPI):
+    with patch.object(
+        chatgpt_api,
+        '_complete',
+        return_value={
+            'card_contents': [
+                card('essen ', 'essen'),
+                card(' Essen', 'das Essen'),
+                card('sich  freuen', 'sich freuen'),
+            ]
+        },
+    ):
+        grouped = chatgpt_api._query_lines(['Essen', 'essen', 'sich freuen'])
+
+    assert [[card.word for card in cards] for cards in grouped] == [
+        ['das Essen'],
+        ['essen'],
+        ['sich freuen'],
+    ]
+
+
+@pytest.fixture()
+def cache(tmp_path):
+    return CardContentsCache(tmp_path / 'chatgpt.sqlite3', max_entries=3)
+
+
+def test_query_only_sends_uncached_lines(tmp_path, cache: CardContentsCache):
+    chatgpt_api = ChatGPTAPI(
+        openai_api_key='fake-key', lines_per_chunk=2, cache=cache
+    )
+    with patch.object(chatgpt_api, '_complete', side_effect=fake_complete):
+        chatgpt_api.query('hund\nkatze')
+
+    with patch.object(
+        chatgpt_api, '_complete', side_effect=fake_complete
+    ) as mock_complete:
+        collection = chatgpt_api.query('hund\nmaus\nkatze')
+
+    mock_complete.assert_called_once_with('maus')
+    assert [card.word for card in collection.card_contents] == [
+        'Hund',
+        'Maus',
+        'Katze',
+    ]
+
+
+def test_chunks_done_are_cached_when_another_fails(
+    cache: CardContentsCache,
+):
+    chatgpt_api = ChatGPTAPI(
+        openai_api_key='fake-key', lines_per_chunk=2, cache=cache
+    )
+
+    def complete(prompt: str) -> dict:
+        if 'maus' in prompt:
+            raise ValueError('invalid JSON')
+        return fake_complete(prompt)
+
+    with patch.object(chatgpt_api, '_complete', side_effect=complete):
+        with pytest.raises(ValueError):
+            chatgpt_api.query('hund\nkatze\nmaus')
+
+    assert cache.get('hund', chatgpt_api.model, 0)[0].word == 'Hund'
+    assert cache.get('katze', chatgpt_api.model, 0)[0].word == 'Katze'
+    assert cache.get('maus', chatgpt_api.model, 0) is None
+
+
+def test_cache_key_depends_on_model_and_prompt(cache: CardContentsCache):
+    cards = [AnkiCardInfo(**card('hund', 'Hund'))]
+    cache.put('hund', 'gpt-4o-mini', 0, cards)
+
+    assert cache.get(' hund ', 'gpt-4o-mini', 0)[0].word == 'Hund'
+    # case changes the meaning of German words
+    assert cache.get('Hund', 'gpt-4o-mini', 0) is None
+    assert cache.get('hund', 'gpt-4o', 0) is None
+    with patch('germanki.chatgpt.CHATGPT_PROMPT', 'another prompt'):
+        assert cache.get('hund', 'gpt-4o-mini', 0) is None
+
+
+def test_cache_evicts_least_recently_used(cache: CardContentsCache):
+    cards = [AnkiCardInfo(**card('hund', 'Hund'))]
+    for line in ['eins', 'zwei', 'drei']:
+        cache.put(line, 'gpt-4o-mini', 0, cards)
+    cache.get('eins', 'gpt-4o-mini', 0)
+    cache.put('vier', 'gpt-4o-mini', 0, cards)
+
+    assert len(cache) == 3
+    assert cache.get('eins', 'gpt-4o-mini', 0) is not None
+    assert cache.get('zwei', 'gpt-4o-mini', 0) is None
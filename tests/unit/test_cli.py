@@ -0,0 +1,211 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from germanki import cli
+from germanki.anki_connect import AnkiConnectResponseError
+from germanki.config import Config
+from germanki.core import Germanki
+from germanki.transport import HTTPTransport
+
+CARDS_YAML = """
+- word: Hund
+  translations: [dog]
+  definition: Ein Haustier.
+  examples: [Der Hund bellt.]
+  extra: der Hund, -e
+- word: Katze
+  translations: [cat]
+  definition: Ein Haustier.
+  examples: [Die Katze schläft.]
+  extra: die Katze, -n
+"""
+
+
+@pytest.fixture()
+def cards_file(tmp_path: Path) -> Path:
+    path = tmp_path / 'cards.txt'
+    path.write_text(CARDS_YAML)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def local_config(monkeypatch, tmp_path: Path):
+    def config(**kwargs):
+        return Config(
+            pexels_api_key='fake-key',
+            openai_api_key='',
+            audio_downloads_folder=tmp_path / 'audio',
+            image_downloads_folder=tmp_path / 'image',
+            media_index_path=tmp_path / 'media.sqlite3',
+            cache_folder=tmp_path / 'cache',
+            **kwargs,
+        )
+
+    monkeypatch.setattr('germanki.cli.Config', config)
+
+
+@pytest.fixture()
+def mock_media():
+    with patch.object(
+        Germanki, '_get_image', return_value=Path('image.jpg')
+    ), patch.object(Germanki, '_get_tts_audio', return_value=Path('a.mp3')):
+        yield
+
+
+@pytest.mark.parametrize(
+    'path, text, expected',
+    [
+        ('cards.yaml', 'Hund', 'yaml'),
+        ('-', CARDS_YAML, 'yaml'),
+        ('-', 'Hund\nKatze\n', 'words'),
+        ('-', 'sich freuen: auf', 'words'),
+    ],
+)
+def test_detect_format(path, text, expected):
+    assert cli.detect_format(path, text) == expected
+
+
+def test_build_without_export(mock_media, cards_file: Path, tmp_path: Path):
+    report_path = tmp_path / 'report.json'
+    exit_code = cli.main(
+        [
+            'build',
+            str(cards_file),
+            '--no-export',
+            '--no-progress',
+            '--report',
+            str(report_path),
+        ]
+    )
+
+    report = json.loads(report_path.read_text())
+    assert exit_code == 0
+    assert report['summary']['enriched'] == 2
+    assert report['cards'][0] == {
+        'word': 'Hund',
+        'status': 'enriched',
+        'image': 'image.jpg',
+        'audio': 'a.mp3',
+        'error': None,
+        'media_errors': [],
+    }
+
+
+def test_build_resumes_its_job(mock_media, cards_file: Path, capsys):
+    with patch(
+        'germanki.anki_connect.AnkiConnectClient.find_existing_words',
+        return_value=[False, False],
+    ), patch(
+        'germanki.anki_connect.AnkiConnectClient.add_cards',
+        side_effect=[[None, None], AssertionError('added again')],
+    ):
+        cli.main(['build', str(cards_file), '--no-progress'])
+        first_report = json.loads(capsys.readouterr().out)
+        exit_code = cli.main(['build', str(cards_file), '--no-progress'])
+
+    report = json.loads(capsys.readouterr().out)
+    assert exit_code == 0
+    assert report['job'] == first_report['job']
+    assert report['summary']['added'] == 2
+
+
+def test_build_reports_failed_cards(mock_media, cards_file: Path, capsys):
+    with patch(
+        'germanki.anki_connect.AnkiConnectClient.find_existing_words',
+        return_value=[True, False],
+    ), patch(
+        'germanki.anki_connect.AnkiConnectClient.add_cards',
+        return_value=[AnkiConnectResponseError('addNote', 'duplicate')],
+    ):
+        exit_code = cli.main(['build', str(cards_file), '--deck', 'Tiere'])
+
+    report = json.loads(capsys.readouterr().out)
+    assert exit_code == 1
+    assert report['deck'] == 'Tiere'
+    assert [(c['word'], c['status']) for c in report['cards']] == [
+        ('Hund', 'skipped'),
+        ('Katze', 'failed'),
+    ]
+
+
+def test_build_reports_media_errors(cards_file: Path, capsys):
+    with patch.object(
+        Germanki, '_get_image', return_value=Path('image.jpg')
+    ), patch.object(
+        Germanki, '_get_tts_audio', side_effect=ValueError('TTS is down')
+    ):
+        exit_code = cli.main(['build', str(cards_file), '--no-export'])
+
+    report = json.loads(capsys.readouterr().out)
+    assert exit_code == 1
+    assert report['summary']['enriched'] == 2
+    assert report['summary']['media_failed'] == 2
+    assert report['cards'][0]['media_errors'] == [
+        {'media': 'audio', 'query': 'Hund', 'error': 'TTS is down'}
+    ]
+
+
+def test_build_apkg(cards_file: Path, tmp_path: Path, capsys):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image')
+    audio = tmp_path / 'a.mp3'
+    audio.write_bytes(b'audio')
+    apkg_path = tmp_path / 'deck.apkg'
+    with patch.object(
+        Germanki, '_get_image', return_value=image
+    ), patch.object(Germanki, '_get_tts_audio', return_value=audio), patch(
+        'germanki.anki_connect.AnkiConnectClient.find_existing_words'
+    ) as mock_find:
+        exit_code = cli.main(
+            ['build', str(cards_file), '--apkg', str(apkg_path)]
+        )
+
+    report = json.loads(capsys.readouterr().out)
+    assert exit_code == 0
+    assert report['summary']['added'] == 2
+    assert apkg_path.exists()
+    mock_find.assert_not_called()
+
+
+def test_word_list_requires_openai_key(cards_file: Path):
+    cards_file.write_text('Hund\nKatze\n')
+    with pytest.raises(SystemExit) as exc_info:
+        cli.main(['build', str(cards_file), '--no-export'])
+    assert exc_info.value.code == 2
+
+
+@pytest.mark.parametrize(
+    'text, error',
+    [
+        ('- Hund\n', 'Card 1 must be a mapping'),
+        (CARDS_YAML + '- word: Maus\n', 'Invalid card 3'),
+    ],
+)
+def test_invalid_yaml_cards_name_the_card(text, error):
+    with pytest.raises(cli.CLIError, match=error):
+        cli.parse_yaml_cards(text)
+
+
+def test_photo_clients_use_the_given_transport():
+    transport = HTTPTransport()
+    client = cli.create_photos_client(
+        'auto', cli.Config(unsplash_api_key='fake-key'), transport
+    )
+    assert [c.transport for c in [client, *client.clients]] == [transport] * 3
+
+
+@pytest.mark.parametrize('option', ['--workers', '--chatgpt-workers'])
+def test_worker_counts_must_be_positive(option, capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        cli.create_parser().parse_args(['build', option, '0'])
+    assert exc_info.value.code == 2
+    assert 'must be at least 1' in capsys.readouterr().err
+
+
+@patch('germanki.cli.run_ui', return_value=0)
+def test_ui_is_the_default_command(mock_run_ui):
+    assert cli.main([]) == 0
+    mock_run_ui.assert_called_once()
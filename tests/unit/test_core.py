@@ -1,18 +1,25 @@
+import threading
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 
-from germanki.anki_connect import AnkiMedia, AnkiMediaType
-from germanki.config import Config
+from germanki.anki_connect import (
+    AnkiConnectRequestError,
+    AnkiMedia,
+    AnkiMediaType,
+)
 from germanki.core import (
     AnkiCardCreator,
+    AnkiCardHTMLPreview,
     AnkiCardInfo,
+    AudioRenderMode,
     Germanki,
+    MediaUpdateExceptions,
     MP3Downloader,
+    PreviewCache,
 )
 from germanki.photos import SearchResponse
-from germanki.photos.pexels import PexelsClient
 
 
 @pytest.fixture
@@ -32,12 +39,6 @@ def anki_card_creator():
     return AnkiCardCreator()
 
 
-@pytest.fixture
-def germanki_instance():
-    config = Config(pexels_api_key='test_key', openai_api_key='test_key')
-    return Germanki(photos_client=PexelsClient('test_key'), config=config)
-
-
 @patch('germanki.tts_mp3.TTSAPI.request_tts')
 @patch('germanki.tts_mp3.TTSAPI.download_mp3')
 def test_mp3_downloader_success(mock_download, mock_request, tmp_path):
@@ -65,37 +66,66 @@ def test_mp3_downloader_failure(mock_request, tmp_path):
     mock_request.assert_called_once_with(msg='Hallo', lang='de')
 
 
+def test_tts_audio_uses_the_germanki_transport(germanki_instance):
+    with patch('germanki.core.TTSAPI') as mock_tts_api:
+        mock_tts_api.return_value.request_tts.return_value.success = False
+        with pytest.raises(Exception):
+            germanki_instance._get_tts_audio('Hallo')
+
+    mock_tts_api.assert_called_once_with(transport=germanki_instance.transport)
+
+
 @patch('germanki.photos.pexels.PexelsClient.search_random_photo')
 def test_get_image_success(mock_search, germanki_instance):
     mock_search.return_value = SearchResponse(
         photo_urls=['https://example.com/image.jpg'], total_results=1
     )
 
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_get.return_value.status_code = 200
-        mock_get.return_value.content = b'fake image data'
+        mock_get.return_value.headers = {'Content-Type': 'image/jpeg'}
+        mock_get.return_value.iter_content.return_value = [b'fake image']
 
-        image_path = germanki_instance._get_image('Hallo', max_pages=1)
+        image_path = germanki_instance._get_image('Hallo')
         assert isinstance(image_path, Path)
 
 
+@patch('germanki.photos.pexels.PexelsClient.search_random_photo')
+def test_get_image_reuses_search_results(mock_search, germanki_instance):
+    mock_search.return_value = SearchResponse(
+        photo_urls=[f'https://example.com/{i}.jpg' for i in range(40)],
+        total_results=40,
+    )
+
+    with patch('requests.Session.get') as mock_get:
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {'Content-Type': 'image/jpeg'}
+        mock_get.return_value.iter_content.return_value = [b'fake image']
+
+        for _ in range(5):
+            germanki_instance._get_image('Hallo')
+
+    mock_search.assert_called_once_with(query='Hallo', per_page=80, page=1)
+
+
 @patch('germanki.config.Config.image_filepath')
 def test_convert_query_to_filename(mock_image_filepath):
     filename = Germanki.convert_query_to_filename('Hallo Welt!', ext='jpg')
     assert filename == 'Hallo_Welt.jpg'
 
 
-@patch('pathlib.Path.read_text', new=lambda _: 'b64_audio')
+@patch('pathlib.Path.read_bytes', new=lambda _: b'audio')
 def test_anki_card_creator_front(test_card_info):
     audio_with_autoplay = AnkiCardCreator.front(
         test_card_info,
         audio=AnkiMedia(path='test', anki_media_type=AnkiMediaType.AUDIO),
         autoplay=True,
+        audio_mode=AudioRenderMode.INLINE,
     )
     assert audio_with_autoplay.replace(' ', '') == (
         'Hallo<br>'
         '<audio controls autoplay style="">'
-        '<source src="data:audio/mp3;base64,b64_audio" type="audio/mp3">'
+        '<source src="data:audio/mp3;base64,YXVkaW8=" type="audio/mp3">'
         '</audio>'
     ).replace(' ', '')
 
@@ -104,11 +134,12 @@ def test_anki_card_creator_front(test_card_info):
         audio=AnkiMedia(path='test', anki_media_type=AnkiMediaType.AUDIO),
         autoplay=True,
         style='width: 100%;',
+        audio_mode=AudioRenderMode.INLINE,
     )
     assert audio_with_autoplay_and_style.replace(' ', '') == (
         'Hallo<br>'
         '<audio controls autoplay style="width:100%;">'
-        '<source src="data:audio/mp3;base64,b64_audio" type="audio/mp3">'
+        '<source src="data:audio/mp3;base64,YXVkaW8=" type="audio/mp3">'
         '</audio>'
     ).replace(' ', '')
 
@@ -116,15 +147,42 @@ def test_anki_card_creator_front(test_card_info):
         test_card_info,
         audio=AnkiMedia(path='test', anki_media_type=AnkiMediaType.AUDIO),
         autoplay=False,
+        audio_mode=AudioRenderMode.INLINE,
     )
     assert audio_without_autoplay.replace(' ', '') == (
         'Hallo<br>'
         '<audio controls style="">'
-        '<source src="data:audio/mp3;base64,b64_audio" type="audio/mp3">'
+        '<source src="data:audio/mp3;base64,YXVkaW8=" type="audio/mp3">'
         '</audio>'
     ).replace(' ', '')
 
 
+def test_anki_card_creator_front_sound_tag(test_card_info):
+    front = AnkiCardCreator.front(
+        test_card_info,
+        audio=AnkiMedia(
+            path='audio/abc123.mp3', anki_media_type=AnkiMediaType.AUDIO
+        ),
+    )
+    assert front == 'Hallo<br>[sound:abc123.mp3]'
+
+
+def test_anki_card_creator_front_without_audio(test_card_info):
+    assert AnkiCardCreator.front(test_card_info, audio=None) == 'Hallo<br>'
+
+
+def test_anki_card_creator_create_references_media(test_card_info):
+    test_card_info.word_audio_url = 'audio/abc123.mp3'
+    test_card_info.translation_image_url = 'image/def456.jpg'
+    card = AnkiCardCreator.create(test_card_info)
+    assert card.front == 'Hallo<br>[sound:abc123.mp3]'
+    assert '<img src="def456.jpg"' in card.back
+    assert [media.filename for media in card.media] == [
+        'def456.jpg',
+        'abc123.mp3',
+    ]
+
+
 def test_anki_card_creator_back(test_card_info):
     image_without_style = AnkiCardCreator.back(
         test_card_info,
@@ -155,7 +213,7 @@ def test_anki_card_creator_extra(test_card_info):
     ).replace(' ', '')
 
 
-@patch('pathlib.Path.read_text', new=lambda _: 'b64_audio')
+@patch('pathlib.Path.read_bytes', new=lambda _: b'audio')
 @patch('pathlib.Path.relative_to', new=lambda self, _: self.stem)
 def test_anki_card_creator_html_preview():
     anki_card_info = AnkiCardInfo(
@@ -172,7 +230,7 @@ def test_anki_card_creator_html_preview():
     assert preview.front.replace(' ', '') == (
         'Hallo<br>'
         '<audio controls style="width:100%;">'
-        '<source src="data:audio/mp3;base64,b64_audio" type="audio/mp3">'
+        '<source src="data:audio/mp3;base64,YXVkaW8=" type="audio/mp3">'
         '</audio>'
     ).replace(' ', '')
 
@@ -185,3 +243,187 @@ def test_anki_card_creator_html_preview():
         'Erklärung: A greeting in German<br><br>'
         "Beispiele:<br>1. Hallo,wiegeht's?"
     ).replace(' ', '')
+
+
+def test_card_contents_collects_media_exceptions_in_card_order(
+    germanki_instance,
+):
+    cards = [
+        AnkiCardInfo(
+            word=word,
+            translations=[word],
+            definition='',
+            examples=[],
+            extra='',
+        )
+        for word in ['eins', 'zwei', 'drei', 'vier']
+    ]
+
+    def fail_on_even_words(query: str):
+        if query in ['zwei', 'vier']:
+            raise Exception('TTS failed')
+        return Path(f'{query}.mp3')
+
+    with patch.object(
+        germanki_instance, '_get_image', return_value=Path('image.jpg')
+    ), patch.object(
+        germanki_instance, '_get_tts_audio', side_effect=fail_on_even_words
+    ):
+        with pytest.raises(MediaUpdateExceptions) as exc_info:
+            germanki_instance.card_contents = cards
+
+    assert [e.query for e in exc_info.value.exceptions] == ['zwei', 'vier']
+    assert [card.word for card in germanki_instance.card_contents] == [
+        'eins',
+        'zwei',
+        'drei',
+        'vier',
+    ]
+    assert str(cards[0].word_audio_url) == 'eins.mp3'
+    assert all(card.translation_image_url for card in cards)
+
+
+def test_preview_cache_evicts_least_recently_used(test_card_info):
+    cache = PreviewCache(maxsize=2)
+    cards = [
+        test_card_info.model_copy(update={'word': word})
+        for word in ['eins', 'zwei', 'drei']
+    ]
+    preview = AnkiCardHTMLPreview(front='', back='', extra='')
+    cache.put(cards[0], preview)
+    cache.put(cards[1], preview)
+    cache.get(cards[0])
+    cache.put(cards[2], preview)
+
+    assert cache.get(cards[0]) is preview
+    assert cache.get(cards[1]) is None
+    assert len(cache) == 2
+
+
+def test_html_preview_is_memoized(test_card_info):
+    AnkiCardCreator.preview_cache.clear()
+    with patch.object(
+        AnkiCardCreator,
+        '_render_html_preview',
+        wraps=AnkiCardCreator._render_html_preview,
+    ) as mock_render:
+        first = AnkiCardCreator.html_preview(test_card_info)
+        second = AnkiCardCreator.html_preview(test_card_info)
+
+    assert first is second
+    assert mock_render.call_count == 1
+
+
+def test_html_preview_is_cached_under_rendered_card(test_card_info):
+    AnkiCardCreator.preview_cache.clear()
+    render = AnkiCardCreator._render_html_preview
+
+    def render_while_card_changes(card_contents):
+        # a background job updates the card in the middle of the render
+        test_card_info.extra = 'changed'
+        return render(card_contents)
+
+    with patch.object(
+        AnkiCardCreator,
+        '_render_html_preview',
+        side_effect=render_while_card_changes,
+    ):
+        preview = AnkiCardCreator.html_preview(test_card_info)
+
+    assert 'changed' not in preview.extra
+    assert AnkiCardCreator.preview_cache.get(test_card_info) is None
+
+
+def test_update_card_audio_invalidates_preview(
+    germanki_instance, test_card_info
+):
+    AnkiCardCreator.preview_cache.clear()
+    germanki_instance._card_contents = [test_card_info]
+    AnkiCardCreator.html_preview(test_card_info)
+    assert len(AnkiCardCreator.preview_cache) == 1
+
+    with patch.object(
+        germanki_instance, '_get_tts_audio', return_value=Path('new.mp3')
+    ):
+        germanki_instance.update_card_audio(0)
+
+    assert len(AnkiCardCreator.preview_cache) == 0
+    assert AnkiCardCreator.preview_cache.get(test_card_info) is None
+
+
+def make_cards(words):
+    return [
+        AnkiCardInfo(
+            word=word,
+            translations=[word],
+            definition='',
+            examples=[],
+            extra='',
+        )
+        for word in words
+    ]
+
+
+def test_preview_cards_skips_cards_already_in_deck(germanki_instance):
+    cards = make_cards(['eins', 'zwei', 'drei'])
+    with patch.object(
+        germanki_instance.anki_client,
+        'find_existing_words',
+        return_value=[False, True, False],
+    ), patch.object(
+        germanki_instance, '_update_card_media', return_value=[]
+    ) as mock_update:
+        germanki_instance.preview_cards(cards, 'Deck')
+
+    assert [card.word for card in germanki_instance.card_contents] == [
+        'eins',
+        'drei',
+    ]
+    assert [card.word for card in germanki_instance.skipped_cards] == ['zwei']
+    assert mock_update.call_count == 2
+
+
+def test_preview_cards_without_anki_keeps_all_cards(germanki_instance):
+    cards = make_cards(['eins', 'zwei'])
+    with patch.object(
+        germanki_instance.anki_client,
+        'find_existing_words',
+        side_effect=AnkiConnectRequestError('Connection refused'),
+    ), patch.object(germanki_instance, '_update_card_media', return_value=[]):
+        germanki_instance.preview_cards(cards, 'Deck')
+
+    assert germanki_instance.card_contents == cards
+    assert germanki_instance.skipped_cards == []
+
+
+def test_preview_cards_reports_cards_as_they_finish(germanki_instance):
+    cards = make_cards(['eins', 'zwei'])
+    first_card_done = threading.Event()
+
+    def update_card_media(index, keep_media, cancelled):
+        # the first card only finishes once the second was reported
+        if index == 0:
+            first_card_done.wait(5)
+        return []
+
+    def on_card(index, exceptions):
+        finished.append(index)
+        first_card_done.set()
+
+    finished = []
+    with patch.object(
+        germanki_instance, '_update_card_media', side_effect=update_card_media
+    ):
+        germanki_instance.preview_cards(cards, on_card=on_card)
+
+    assert finished == [1, 0]
+
+
+def test_cancelled_preview_skips_remaining_cards(germanki_instance):
+    cancelled = threading.Event()
+    cancelled.set()
+    with patch.object(germanki_instance, '_get_image') as mock_image:
+        germanki_instance.preview_cards(
+            make_cards(['eins', 'zwei']), cancelled=cancelled
+        )
+    mock_image.assert_not_called()
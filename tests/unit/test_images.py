@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from PIL import Image
+
+from germanki.images import downscale_image_file
+
+
+def make_image(path: Path, width: int, height: int) -> Path:
+    Image.effect_noise((width, height), 64).convert('RGB').save(
+        path, format='PNG'
+    )
+    return path
+
+
+def test_large_image_is_downscaled(tmp_path):
+    path = make_image(tmp_path / 'image.jpg', 2000, 1000)
+    size = path.stat().st_size
+
+    assert downscale_image_file(path, max_dimension=500, quality=80)
+    assert path.stat().st_size < size
+    with Image.open(path) as image:
+        assert image.format == 'JPEG'
+        assert image.size == (500, 250)
+
+
+def test_small_image_is_kept(tmp_path):
+    path = make_image(tmp_path / 'image.jpg', 300, 200)
+    data = path.read_bytes()
+
+    assert not downscale_image_file(path, max_dimension=500, quality=80)
+    assert path.read_bytes() == data
+
+
+def test_downscaling_can_be_disabled(tmp_path):
+    path = make_image(tmp_path / 'image.jpg', 2000, 1000)
+    assert not downscale_image_file(path, max_dimension=0, quality=80)
+
+
+def test_invalid_image_is_kept(tmp_path):
+    path = tmp_path / 'image.jpg'
+    path.write_bytes(b'not an image')
+
+    assert not downscale_image_file(path, 500, 80)
+    assert path.read_bytes() == b'not an image'
@@ -0,0 +1,211 @@
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from germanki.anki_connect import (
+    AnkiConnectRequestError,
+    AnkiConnectResponseError,
+)
+from germanki.core import AnkiCardInfo, Germanki
+from germanki.jobs import (
+    BackgroundJob,
+    CardStage,
+    CardStatus,
+    ImportJob,
+    JobJournal,
+    JobState,
+    job_id_for,
+)
+
+
+def make_cards(*words: str):
+    return [
+        AnkiCardInfo(
+            word=word,
+            translations=[word.lower()],
+            definition='',
+            examples=[],
+            extra='',
+        )
+        for word in words
+    ]
+
+
+@pytest.fixture
+def journal(tmp_path: Path):
+    return JobJournal(tmp_path / 'jobs.sqlite3')
+
+
+@pytest.fixture
+def media(tmp_path: Path):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image')
+    audio = tmp_path / 'audio.mp3'
+    audio.write_bytes(b'audio')
+    with patch.object(
+        Germanki, '_get_image', return_value=image
+    ) as mock_image, patch.object(
+        Germanki, '_get_tts_audio', return_value=audio
+    ) as mock_audio:
+        yield mock_image, mock_audio
+
+
+def test_job_id_depends_on_inputs():
+    assert job_id_for('Deck', 'Hund') == job_id_for('Deck', 'Hund')
+    assert job_id_for('Deck', 'Hund') != job_id_for('Deck', 'Katze')
+
+
+def test_journal_round_trip(journal: JobJournal):
+    assert journal.cards('job') is None
+
+    cards = make_cards('Hund', 'Katze')
+    journal.record_parsed('job', cards)
+    cards[1].word_audio_url = 'katze.mp3'
+    journal.record_card('job', 1, cards[1], [CardStage.AUDIO])
+
+    assert journal.cards('job') == cards
+    assert journal.stages('job') == {
+        0: {CardStage.PARSED},
+        1: {CardStage.PARSED, CardStage.AUDIO},
+    }
+
+    journal.delete('job')
+    assert journal.cards('job') is None
+    assert journal.stages('job') == {}
+
+
+def test_empty_job_is_not_parsed_again(journal: JobJournal):
+    parse = MagicMock(return_value=[])
+    ImportJob(MagicMock(), journal, 'job').parse(parse)
+    ImportJob(MagicMock(), journal, 'job').parse(parse)
+    parse.assert_called_once()
+
+
+def test_resumed_job_skips_finished_work(
+    germanki_instance: Germanki, journal: JobJournal, media
+):
+    mock_image, mock_audio = media
+    parse = MagicMock(return_value=make_cards('Hund', 'Katze'))
+
+    job = ImportJob(germanki_instance, journal, 'job')
+    job.parse(parse)
+    job.fetch_media()
+    with patch.object(
+        germanki_instance.anki_client,
+        'add_cards',
+        return_value=[None, AnkiConnectResponseError('addNote', 'closed')],
+    ):
+        job.create_cards('Deck')
+
+    assert journal.stages('job') == {
+        0: set(CardStage),
+        1: set(CardStage) - {CardStage.NOTE_CREATED},
+    }
+
+    # a new process resumes the job: only the failed note is added again
+    job = ImportJob(germanki_instance, journal, 'job')
+    cards = job.parse(parse)
+    assert job.created_cards() == [cards[0]]
+    job.fetch_media()
+    with patch.object(
+        germanki_instance.anki_client, 'add_cards', return_value=[None]
+    ) as mock_add_cards:
+        job.create_cards('Deck')
+
+    parse.assert_called_once()
+    assert mock_image.call_count == 2
+    assert mock_audio.call_count == 2
+    (anki_card,) = mock_add_cards.call_args.kwargs['anki_cards']
+    assert anki_card.front.startswith('Katze')
+    assert all(
+        CardStage.NOTE_CREATED in s for s in journal.stages('job').values()
+    )
+
+
+def test_batches_are_recorded_until_anki_fails(
+    germanki_instance: Germanki, journal: JobJournal, media
+):
+    job = ImportJob(germanki_instance, journal, 'job')
+    job.parse(lambda: make_cards('Hund', 'Katze', 'Maus'))
+    job.fetch_media()
+    with patch.object(
+        germanki_instance.anki_client,
+        'add_cards',
+        side_effect=[[None, None], AnkiConnectRequestError('closed')],
+    ), pytest.raises(AnkiConnectRequestError):
+        job.create_cards('Deck', batch_size=2)
+
+    assert [job.note_created(card) for card in job.cards] == [
+        True,
+        True,
+        False,
+    ]
+
+
+def test_background_job_tracks_cards():
+    release = threading.Event()
+
+    def run(job: BackgroundJob):
+        job.start_cards(2)
+        job.card_done(0)
+        job.progress(1, 2)
+        release.wait(5)
+        job.card_done(1, 'image: Katze')
+        job.progress(2, 2)
+        return 'result'
+
+    job = BackgroundJob('Preview', run).start()
+    while job.done < 1:
+        time.sleep(0.01)
+    assert job.state == JobState.RUNNING
+    assert job.eta is not None
+    assert job.card_status(0) == CardStatus.DONE
+    assert job.card_status(1) == CardStatus.PENDING
+
+    release.set()
+    job.join(5)
+    assert job.state == JobState.DONE
+    assert job.result == 'result'
+    assert job.eta is None
+    assert job.card_status(1) == CardStatus.FAILED
+
+
+def test_background_job_eta_leaves_out_parsing():
+    release = threading.Event()
+
+    def run(job: BackgroundJob):
+        # parsing, before the cards are known
+        time.sleep(0.5)
+        job.start_cards(2)
+        job.card_done(0)
+        job.progress(1, 2)
+        release.wait(5)
+
+    job = BackgroundJob('Preview', run).start()
+    while job.done < 1:
+        time.sleep(0.01)
+    assert job.eta < 0.4
+    release.set()
+    job.join(5)
+
+
+def test_background_job_cancel_and_failure():
+    def run(job: BackgroundJob):
+        job.start_cards(1)
+        job.cancelled.wait(5)
+
+    job = BackgroundJob('Preview', run).start()
+    job.cancel()
+    job.join(5)
+    assert job.state == JobState.CANCELLED
+    assert job.card_status(0) == CardStatus.CANCELLED
+
+    job = BackgroundJob('Preview', MagicMock(side_effect=ValueError('x')))
+    job.start().join(5)
+    assert job.state == JobState.FAILED
+    assert isinstance(job.exception, ValueError)
+    # a job that never started tracking cards does not own the preview
+    assert job.card_status(0) is None
@@ -0,0 +1,117 @@
+import base64
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from germanki.media_store import MediaKind, MediaStore
+
+
+@pytest.fixture()
+def store(tmp_path: Path):
+    return MediaStore(
+        index_path=tmp_path / 'media.sqlite3',
+        folders={
+            MediaKind.IMAGE: tmp_path / 'image',
+            MediaKind.AUDIO: tmp_path / 'audio',
+        },
+    )
+
+
+def test_lookup_missing(store: MediaStore):
+    assert store.lookup(MediaKind.IMAGE, 'dog', 'PexelsClient', 1) is None
+
+
+def test_put_names_blob_after_content(store: MediaStore, tmp_path: Path):
+    path = store.put(
+        MediaKind.IMAGE, 'dog', 'PexelsClient', b'dog image', 'jpg', page=3
+    )
+    digest = hashlib.sha256(b'dog image').hexdigest()
+    assert path == tmp_path / 'image' / f'{digest}.jpg'
+    assert path.read_bytes() == b'dog image'
+    assert store.lookup(MediaKind.IMAGE, 'dog', 'PexelsClient', 3) == path
+    assert store.lookup(MediaKind.IMAGE, 'dog', 'PexelsClient', 2) is None
+
+
+def test_distinct_queries_do_not_collide(store: MediaStore):
+    first = store.put(MediaKind.AUDIO, 'schön', 'Vicki', b'1', 'mp3')
+    second = store.put(MediaKind.AUDIO, 'schon', 'Vicki', b'2', 'mp3')
+    assert first != second
+    assert store.lookup(MediaKind.AUDIO, 'schön', 'Vicki') == first
+    assert store.lookup(MediaKind.AUDIO, 'schon', 'Vicki') == second
+
+
+def test_identical_content_is_deduplicated(store: MediaStore):
+    first = store.put(MediaKind.IMAGE, 'team', 'PexelsClient', b'img', 'jpg')
+    second = store.put(MediaKind.IMAGE, 'squad', 'PexelsClient', b'img', 'jpg')
+    assert first == second
+    assert store.blob_count() == 1
+    assert store.total_size() == len(b'img')
+
+
+def test_size_accounting_per_kind(store: MediaStore):
+    store.put(MediaKind.IMAGE, 'dog', 'PexelsClient', b'12345', 'jpg')
+    store.put(MediaKind.AUDIO, 'Hund', 'Vicki', b'123', 'mp3')
+    assert store.total_size(MediaKind.IMAGE) == 5
+    assert store.total_size(MediaKind.AUDIO) == 3
+    assert store.total_size() == 8
+
+
+def test_index_is_shared_between_instances(store: MediaStore, tmp_path: Path):
+    path = store.put(MediaKind.AUDIO, 'Hund', 'Vicki', b'audio', 'mp3')
+    other = MediaStore(
+        index_path=tmp_path / 'media.sqlite3',
+        folders={MediaKind.AUDIO: tmp_path / 'audio'},
+    )
+    assert other.lookup(MediaKind.AUDIO, 'Hund', 'Vicki') == path
+
+
+def test_legacy_cache_files_are_imported_once(tmp_path: Path):
+    folders = {
+        MediaKind.IMAGE: tmp_path / 'image',
+        MediaKind.AUDIO: tmp_path / 'audio',
+    }
+    for folder in folders.values():
+        folder.mkdir()
+    legacy_audio = folders[MediaKind.AUDIO] / 'warten__auf__akk_Vicki.mp3'
+    legacy_audio.write_bytes(base64.b64encode(b'mp3'))
+    legacy_image = folders[MediaKind.IMAGE] / 'waiting_7.jpg'
+    legacy_image.write_bytes(b'jpg')
+    # the speaker samples live in the same folder as raw MP3s
+    sample = folders[MediaKind.AUDIO] / 'sample_Vicki.mp3'
+    sample.write_bytes(b'\xff\xfb raw mp3')
+    # truncated past the speaker, so it matches no key
+    truncated = folders[MediaKind.AUDIO] / f'{"x" * 48}_V.mp3'
+    truncated.write_bytes(base64.b64encode(b'mp3'))
+
+    store = MediaStore(index_path=tmp_path / 'media.sqlite3', folders=folders)
+
+    audio_path = store.lookup(MediaKind.AUDIO, 'warten + auf + akk.', 'Vicki')
+    assert audio_path.read_bytes() == b'mp3'
+    assert audio_path.stem == hashlib.sha256(b'mp3').hexdigest()
+    image_path = store.lookup(MediaKind.IMAGE, 'waiting', 'PexelsClient', 7)
+    assert image_path.read_bytes() == b'jpg'
+    assert not legacy_audio.exists()
+    assert not legacy_image.exists()
+    assert not truncated.exists()
+    assert sample.exists()
+
+    # later files with legacy names are left alone
+    legacy_audio.write_bytes(base64.b64encode(b'mp3'))
+    legacy_image.write_bytes(b'jpg')
+    MediaStore(index_path=tmp_path / 'media.sqlite3', folders=folders)
+    assert legacy_audio.exists()
+    assert legacy_image.exists()
+
+
+def test_put_file_matches_put(store: MediaStore, tmp_path: Path):
+    source = tmp_path / 'download.mp3'
+    source.write_bytes(b'audio' * 100_000)
+
+    path = store.put_file(MediaKind.AUDIO, 'Hallo', 'Vicki', source, 'mp3')
+
+    digest = hashlib.sha256(b'audio' * 100_000).hexdigest()
+    assert path == tmp_path / 'audio' / f'{digest}.mp3'
+    assert path.read_bytes() == source.read_bytes()
+    assert store.total_size(MediaKind.AUDIO) == 500_000
+    assert store.lookup(MediaKind.AUDIO, 'Hallo', 'Vicki') == path
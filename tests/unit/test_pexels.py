@@ -2,7 +2,9 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
+from germanki.config import ImageSize
 from germanki.photos import SearchResponse
+from germanki.photos.cache import SearchResultsCache
 from germanki.photos.exceptions import (
     PhotosAPIError,
     PhotosAuthenticationError,
@@ -24,7 +26,7 @@ def test_client_init():
     assert PexelsClient(api_key='test_key').api_key == 'test_key'
 
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_client_init_no_api_key(mock_get, monkeypatch):
     monkeypatch.delenv('PEXELS_API_KEY', raising=False)
     with pytest.raises(PhotosAuthenticationError):
@@ -35,7 +37,7 @@ def test_headers(client: PexelsClient):
     assert client.headers == {'Authorization': 'test_key'}
 
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_request_success(mock_get, client: PexelsClient):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -56,7 +58,7 @@ def test_request_success(mock_get, client: PexelsClient):
         (500, PhotosAPIError),
     ],
 )
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_request_errors(
     mock_get, client: PexelsClient, status_code, exception
 ):
@@ -66,7 +68,7 @@ def test_request_errors(
         client._request('search')
 
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_request_rate_limit_retry(mock_get, client: PexelsClient):
     mock_get.side_effect = [
         MagicMock(status_code=429, text='Rate limit exceeded'),
@@ -80,7 +82,7 @@ def test_request_rate_limit_retry(mock_get, client: PexelsClient):
     assert mock_get.call_count == 3
 
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_search_random_photo_success(mock_get, client: PexelsClient):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -93,7 +95,33 @@ def test_search_random_photo_success(mock_get, client: PexelsClient):
     assert response.photo_urls[0] == 'image_url'
 
 
-@patch('requests.get')
+@pytest.mark.parametrize(
+    'image_size, expected_url',
+    [
+        (ImageSize.SMALL, 'medium_url'),
+        (ImageSize.MEDIUM, 'large_url'),
+        (ImageSize.LARGE, 'large2x_url'),
+    ],
+)
+def test_search_response_picks_image_size(image_size, expected_url):
+    response = PexelsSearchResponse(
+        photos=[
+            {
+                'src': {
+                    'medium': 'medium_url',
+                    'large': 'large_url',
+                    'large2x': 'large2x_url',
+                }
+            }
+        ],
+        total_results=1,
+    )
+    assert response.get_search_response(image_size).photo_urls == [
+        expected_url
+    ]
+
+
+@patch('requests.Session.get')
 def test_search_random_photo_no_results(mock_get, client: PexelsClient):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -104,7 +132,7 @@ def test_search_random_photo_no_results(mock_get, client: PexelsClient):
         client.search_random_photo('invalid_query')
 
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_search_random_photo_empty_photos_list(mock_get, client: PexelsClient):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -113,3 +141,27 @@ def test_search_random_photo_empty_photos_list(mock_get, client: PexelsClient):
     }
     with pytest.raises(PhotosNotFoundError):
         client.search_random_photo('empty_query')
+
+
+@patch('requests.Session.get')
+def test_search_photos_is_cached(mock_get):
+    client = PexelsClient(
+        api_key='test_key', results_cache=SearchResultsCache()
+    )
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {
+        'photos': [{'src': {'large2x': 'image_url'}}],
+        'total_results': 1,
+    }
+    first = client.search_photos('nature')
+    second = client.search_photos('nature')
+
+    assert first is second
+    mock_get.assert_called_once()
+    assert mock_get.call_args[1]['params']['per_page'] == 80
+
+
+def test_search_results_cache_expires():
+    cache = SearchResultsCache(ttl=0)
+    cache.put('key', 'value')
+    assert cache.get('key') is None
@@ -0,0 +1,287 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from germanki.config import ImageSize
+from germanki.photos import PhotosClient, SearchResponse
+from germanki.photos.cache import SearchResultsCache
+from germanki.photos.exceptions import (
+    PhotosAPIError,
+    PhotosNoResultsError,
+    PhotosQuotaExceededError,
+)
+from germanki.photos.fallback import FallbackPhotosClient
+from germanki.photos.rate_limit import (
+    DEFAULT_RATE_LIMITS,
+    RateLimitConfig,
+    RateLimiter,
+    shared_rate_limiter,
+)
+from germanki.photos.stats import QueryStatistics
+from germanki.photos.unsplash import unsplash_photo_url
+
+
+class FakePhotosClient(PhotosClient):
+    MAX_PER_PAGE = 10
+
+    def __init__(self, total_results: int, returned_results: int, **kwargs):
+        super().__init__('fake-key', **kwargs)
+        self.total_results = total_results
+        self.returned_results = returned_results
+        self.searches = []
+
+    def search_random_photo(
+        self, query: str, per_page: int = 1, page: int = 1
+    ) -> SearchResponse:
+        self.searches.append(page)
+        first = (page - 1) * per_page
+        last = min(first + per_page, self.returned_results)
+        if self.total_results == 0:
+            raise PhotosNoResultsError('no results')
+        return SearchResponse(
+            photo_urls=[f'url_{rank + 1}' for rank in range(first, last)],
+            total_results=self.total_results,
+        )
+
+
+@pytest.fixture()
+def query_stats(tmp_path):
+    return QueryStatistics(tmp_path / 'photo_queries.sqlite3')
+
+
+def make_client(query_stats, total_results=25, returned_results=25):
+    return FakePhotosClient(
+        total_results,
+        returned_results,
+        results_cache=SearchResultsCache(),
+        query_stats=query_stats,
+    )
+
+
+def test_random_rank_of_unknown_query_searches_once(query_stats):
+    client = make_client(query_stats)
+    ranks = {client.random_rank('dog') for _ in range(50)}
+
+    assert client.searches == [1]
+    assert ranks <= set(range(1, 26))
+    assert query_stats.total_results('FakePhotosClient', 'dog') == 25
+
+
+def test_known_query_needs_no_search(tmp_path, query_stats):
+    make_client(query_stats).random_rank('dog')
+
+    other_session = make_client(
+        QueryStatistics(tmp_path / 'photo_queries.sqlite3')
+    )
+    other_session.random_rank('dog')
+    assert other_session.searches == []
+
+
+def test_photo_url_fetches_page_of_rank(query_stats):
+    client = make_client(query_stats)
+    assert client.photo_url('dog', 23) == (23, 'url_23')
+    assert client.searches == [3]
+
+
+def test_photo_url_clamps_to_returned_results(query_stats):
+    client = make_client(query_stats, total_results=100, returned_results=15)
+    assert client.photo_url('dog', 18) == (15, 'url_15')
+    assert query_stats.total_results('FakePhotosClient', 'dog') == 15
+
+
+def test_query_without_results_is_remembered(query_stats):
+    client = make_client(query_stats, total_results=0, returned_results=0)
+    with pytest.raises(PhotosNoResultsError):
+        client.random_rank('asdfgh')
+    with pytest.raises(PhotosNoResultsError):
+        client.random_rank('asdfgh')
+    assert client.searches == [1]
+
+
+def test_stale_statistics_are_ignored(query_stats):
+    query_stats.record('FakePhotosClient', 'dog', 25)
+    with patch('time.time', return_value=10**12):
+        assert query_stats.total_results('FakePhotosClient', 'dog') is None
+
+
+@pytest.fixture()
+def rate_limiter():
+    return RateLimiter(
+        RateLimitConfig(requests_per_hour=3600, burst=2, max_wait=60)
+    )
+
+
+@patch('time.sleep')
+def test_rate_limiter_allows_burst_then_paces(mock_sleep, rate_limiter):
+    rate_limiter.acquire()
+    rate_limiter.acquire()
+    mock_sleep.assert_not_called()
+
+    with patch('time.monotonic', side_effect=[1000, 1001]):
+        rate_limiter._updated_at = 1000
+        rate_limiter._tokens = 0
+        rate_limiter.acquire()
+    mock_sleep.assert_called_once_with(1)
+
+
+@pytest.mark.parametrize('provider', ['PexelsClient', 'UnsplashClient'])
+@patch('time.sleep')
+def test_provider_quota_is_spent_before_pacing(mock_sleep, provider):
+    config = DEFAULT_RATE_LIMITS[provider]
+    rate_limiter = RateLimiter(config)
+    with patch('time.monotonic', return_value=1000):
+        rate_limiter._updated_at = 1000
+        for _ in range(config.burst):
+            rate_limiter.acquire()
+        mock_sleep.assert_not_called()
+
+    # past the hourly quota, requests wait for the bucket however long
+    # it takes to refill instead of failing
+    with patch('time.monotonic', side_effect=[1000, 1000 + 3600]):
+        rate_limiter.acquire()
+    (wait,), _ = mock_sleep.call_args
+    assert wait == pytest.approx(3600 / config.requests_per_hour)
+
+
+def test_rate_limiter_waits_for_quota_reset(rate_limiter):
+    rate_limiter.update_from_headers(
+        {'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '1010'}
+    )
+    with patch('time.time', return_value=1000):
+        assert rate_limiter._quota_wait() == 10
+    with patch('time.time', return_value=1011):
+        assert rate_limiter._quota_wait() == 0
+    assert rate_limiter.quota_remaining is None
+
+
+def test_rate_limiter_fails_when_quota_resets_too_late(rate_limiter):
+    rate_limiter.update_from_headers(
+        {
+            'X-Ratelimit-Remaining': '0',
+            'X-Ratelimit-Reset': str(time.time() + 3600),
+        }
+    )
+    with pytest.raises(PhotosQuotaExceededError):
+        rate_limiter.acquire()
+
+
+def test_rate_limiter_tracks_remaining_quota(rate_limiter):
+    rate_limiter.update_from_headers({'X-Ratelimit-Remaining': '5'})
+    rate_limiter.acquire()
+    assert rate_limiter.quota_remaining == 4
+
+    rate_limiter.update_from_headers(MagicMock())
+    assert rate_limiter.quota_remaining == 4
+
+
+def test_clients_share_provider_rate_limiter(query_stats):
+    assert shared_rate_limiter('PexelsClient') is shared_rate_limiter(
+        'PexelsClient'
+    )
+    assert shared_rate_limiter('FakePhotosClient') is None
+    assert make_client(query_stats).rate_limiter is None
+
+
+class SlowClient(PhotosClient):
+    def __init__(self, delay=0.0, error=None, **kwargs):
+        super().__init__('fake-key', **kwargs)
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def search_random_photo(
+        self, query: str, per_page: int = 1, page: int = 1
+    ) -> SearchResponse:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return SearchResponse(photo_urls=[self.provider_name], total_results=1)
+
+
+class FirstClient(SlowClient):
+    pass
+
+
+class SecondClient(SlowClient):
+    pass
+
+
+def test_fallback_uses_next_provider_on_error():
+    first = FirstClient(error=PhotosAPIError('down'))
+    second = SecondClient()
+    client = FallbackPhotosClient([first, second])
+
+    response = client.search_random_photo('dog')
+
+    assert response.photo_urls == ['SecondClient']
+    assert first.calls == 1
+
+
+def test_fallback_raises_no_results_when_no_provider_has_photos():
+    client = FallbackPhotosClient(
+        [
+            FirstClient(error=PhotosNoResultsError('none')),
+            SecondClient(error=PhotosNoResultsError('none')),
+        ]
+    )
+    with pytest.raises(PhotosNoResultsError):
+        client.search_random_photo('dog')
+
+
+def test_fallback_raises_provider_error():
+    client = FallbackPhotosClient(
+        [
+            FirstClient(error=PhotosNoResultsError('none')),
+            SecondClient(error=PhotosAPIError('down')),
+        ]
+    )
+    with pytest.raises(PhotosAPIError, match='down'):
+        client.search_random_photo('dog')
+
+
+def test_fallback_hedges_slow_provider():
+    first = FirstClient(delay=0.5)
+    second = SecondClient()
+    client = FallbackPhotosClient([first, second], hedge_after=0.05)
+
+    start = time.monotonic()
+    response = client.search_random_photo('dog')
+
+    assert response.photo_urls == ['SecondClient']
+    assert time.monotonic() - start < 0.4
+
+
+def test_fallback_prefers_reliable_providers():
+    first = FirstClient(error=PhotosAPIError('down'))
+    second = SecondClient()
+    client = FallbackPhotosClient([first, second])
+    assert client.ordered_clients() == [first, second]
+
+    client.search_random_photo('dog')
+
+    assert client.ordered_clients() == [second, first]
+    client.search_random_photo('dog')
+    assert first.calls == 1
+
+
+def test_unsplash_photo_url_sets_width():
+    urls = {
+        'full': 'https://images.unsplash.com/photo-1?q=85',
+        'regular': 'https://images.unsplash.com/photo-1?q=80&w=1080',
+        'small': 'https://images.unsplash.com/photo-1?q=80&w=400',
+    }
+    assert (
+        unsplash_photo_url(urls, ImageSize.MEDIUM)
+        == 'https://images.unsplash.com/photo-1?q=80&w=800'
+    )
+    assert unsplash_photo_url(urls, ImageSize.LARGE) == urls['full']
+
+
+def test_media_source_depends_on_image_size():
+    assert (
+        SlowClient(image_size=ImageSize.SMALL).media_source
+        == 'SlowClient:small'
+    )
+    assert SlowClient(image_size=ImageSize.LARGE).media_source == 'SlowClient'
@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from germanki.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        return 'image.jpg'
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flights.do, 'Hund', fetch)
+        started.wait(timeout=5)
+        followers = [
+            executor.submit(flights.do, 'Hund', fetch) for _ in range(3)
+        ]
+        # lets the followers reach the in-flight call
+        time.sleep(0.1)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == ['image.jpg'] * 4
+    assert len(calls) == 1
+    assert len(flights) == 0
+
+
+def test_distinct_keys_run_separately():
+    flights = SingleFlight()
+    assert flights.do('Hund', lambda: 1) == 1
+    assert flights.do('Katze', lambda: 2) == 2
+    # finished calls are not cached
+    assert flights.do('Hund', lambda: 3) == 3
+
+
+def test_exception_is_raised_and_not_kept():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError('no photos')
+
+    with pytest.raises(ValueError, match='no photos'):
+        flights.do('Hund', fail)
+    assert flights.do('Hund', lambda: 'image.jpg') == 'image.jpg'
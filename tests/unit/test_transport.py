@@ -0,0 +1,104 @@
+from unittest.mock import patch
+
+import pytest
+
+from germanki.transport import (
+    DownloadError,
+    HTTPTransport,
+    HTTPTransportConfig,
+    default_transport,
+)
+
+
+@pytest.fixture()
+def transport():
+    return HTTPTransport(
+        HTTPTransportConfig(
+            pool_maxsize=4, connect_timeout=1.5, read_timeout=10
+        )
+    )
+
+
+def test_session_is_reused(transport: HTTPTransport):
+    assert transport.session is transport.session
+
+
+def test_session_pool_size(transport: HTTPTransport):
+    adapter = transport.session.get_adapter('https://api.pexels.com')
+    assert adapter._pool_maxsize == 4
+
+
+@patch('requests.Session.get')
+def test_get_uses_default_timeout(mock_get, transport: HTTPTransport):
+    transport.get('https://example.com')
+    assert mock_get.call_args[1]['timeout'] == (1.5, 10)
+
+
+@patch('requests.Session.post')
+def test_post_keeps_explicit_timeout(mock_post, transport: HTTPTransport):
+    transport.post('https://example.com', timeout=5)
+    assert mock_post.call_args[1]['timeout'] == 5
+
+
+def test_close_creates_new_session(transport: HTTPTransport):
+    session = transport.session
+    transport.close()
+    assert transport.session is not session
+
+
+def test_default_transport_is_shared():
+    assert default_transport() is default_transport()
+
+
+@pytest.fixture()
+def mock_response():
+    with patch('requests.Session.get') as mock_get:
+        response = mock_get.return_value
+        response.status_code = 200
+        response.headers = {'Content-Type': 'image/jpeg'}
+        response.iter_content.return_value = [b'first ', b'second']
+        yield response
+
+
+def test_download_streams_to_file(
+    mock_response, transport: HTTPTransport, tmp_path
+):
+    file_path = tmp_path / 'media' / 'image.jpg'
+    size = transport.download(
+        'https://example.com/image.jpg', file_path, content_types=['image/']
+    )
+
+    assert size == 12
+    assert file_path.read_bytes() == b'first second'
+    assert list(file_path.parent.iterdir()) == [file_path]
+    mock_response.close.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    'headers, max_size',
+    [
+        ({'Content-Type': 'text/html'}, None),
+        ({'Content-Type': 'image/jpeg', 'Content-Length': '1000'}, 100),
+        ({'Content-Type': 'image/jpeg'}, 10),
+    ],
+)
+def test_download_rejects_unexpected_responses(
+    mock_response, transport: HTTPTransport, tmp_path, headers, max_size
+):
+    mock_response.headers = headers
+    with pytest.raises(DownloadError):
+        transport.download(
+            'https://example.com/image.jpg',
+            tmp_path / 'image.jpg',
+            max_size=max_size,
+            content_types=['image/'],
+        )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_fails_on_http_error(
+    mock_response, transport: HTTPTransport, tmp_path
+):
+    mock_response.status_code = 404
+    with pytest.raises(DownloadError, match='404'):
+        transport.download('https://example.com', tmp_path / 'image.jpg')
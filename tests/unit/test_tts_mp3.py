@@ -12,7 +12,7 @@ def tts_client():
     return TTSAPI()
 
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_request_tts_success(mock_post, tts_client: TTSAPI):
     mock_post.return_value.status_code = 200
     mock_post.return_value.content = json.dumps(
@@ -24,7 +24,7 @@ def test_request_tts_success(mock_post, tts_client: TTSAPI):
     assert response.error_message is None
 
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_request_tts_no_mp3_url(mock_post, tts_client: TTSAPI):
     mock_post.return_value.status_code = 200
     mock_post.return_value.content = json.dumps({}).encode('utf8')
@@ -34,7 +34,7 @@ def test_request_tts_no_mp3_url(mock_post, tts_client: TTSAPI):
     assert response.error_message == 'MP3 URL not found.'
 
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_request_tts_invalid_json(mock_post, tts_client: TTSAPI):
     mock_post.return_value.status_code = 200
     mock_post.return_value.content = b'invalid json'
@@ -44,7 +44,7 @@ def test_request_tts_invalid_json(mock_post, tts_client: TTSAPI):
     assert response.error_message == 'Error decoding JSON response.'
 
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_request_tts_http_error(mock_post, tts_client: TTSAPI):
     mock_post.return_value.status_code = 500
     response = tts_client.request_tts('Hallo', 'de')
@@ -53,10 +53,11 @@ def test_request_tts_http_error(mock_post, tts_client: TTSAPI):
     assert response.error_message == 'Failed with status code 500'
 
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_download_mp3_success(mock_get, tts_client: TTSAPI, tmp_path: Path):
     mock_get.return_value.status_code = 200
-    mock_get.return_value.content = b'mp3 data'
+    mock_get.return_value.headers = {'Content-Type': 'audio/mpeg'}
+    mock_get.return_value.iter_content.return_value = [b'mp3 ', b'data']
     file_path = tmp_path / 'test.mp3'
     result = tts_client.download_mp3(
         'https://example.com/audio.mp3', file_path
@@ -66,7 +67,7 @@ def test_download_mp3_success(mock_get, tts_client: TTSAPI, tmp_path: Path):
     assert file_path.read_bytes() == b'mp3 data'
 
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_download_mp3_http_error(mock_get, tts_client: TTSAPI, tmp_path: Path):
     mock_get.return_value.status_code = 404
     file_path = tmp_path / 'test.mp3'
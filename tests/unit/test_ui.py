@@ -4,13 +4,20 @@ import pytest
 import yaml
 from streamlit.testing.v1 import AppTest
 
-from germanki.core import AnkiCardInfo
+from germanki.anki_connect import AnkiConnectResponseError
+from germanki.config import Config
+from germanki.core import AnkiCardInfo, Germanki
+from germanki.jobs import CardStatus, JobState
+from germanki.photos.fallback import FallbackPhotosClient
 from germanki.ui import (
     ChatGPTUIHandler,
+    InputSource,
     InputSourceUIHandler,
     InvalidManualInputException,
     ManualInputUIHandler,
     OpenAPIKeyNotProvided,
+    PhotoSource,
+    UIController,
 )
 
 
@@ -85,3 +92,195 @@ def test_cannot_instance_source_ui_handler():
 def test_default_manual_input_is_valid_yaml():
     manual_input = ManualInputUIHandler()._default_manual_input()
     yaml.load(manual_input, Loader=yaml.Loader)
+
+
+@pytest.fixture()
+def ui_controller(monkeypatch, tmp_path):
+    monkeypatch.setenv('PEXELS_API_KEY', 'fake-key')
+    monkeypatch.setattr(
+        'germanki.ui.Config',
+        lambda: Config(
+            media_index_path=tmp_path / 'media.sqlite3',
+            cache_folder=tmp_path / 'cache',
+        ),
+    )
+    controller = UIController(InputSource.MANUAL, preview_page_size=4)
+    controller._germanki._card_contents = [
+        AnkiCardInfo(
+            word=f'Wort {index}',
+            translations=['word'],
+            definition='',
+            examples=[],
+            extra='',
+        )
+        for index in range(10)
+    ]
+    return controller
+
+
+def test_preview_pages(ui_controller: UIController):
+    assert ui_controller.preview_page_count == 3
+    assert ui_controller.visible_card_indexes() == range(0, 4)
+
+    ui_controller.preview_page = 2
+    assert ui_controller.visible_card_indexes() == range(8, 10)
+
+
+def test_preview_page_is_clamped(ui_controller: UIController):
+    ui_controller.preview_page = 10
+    assert ui_controller.preview_page == 2
+
+    ui_controller.preview_page = -1
+    assert ui_controller.preview_page == 0
+
+    ui_controller.preview_page = 2
+    ui_controller._germanki._card_contents = (
+        ui_controller._germanki.card_contents[:3]
+    )
+    assert ui_controller.preview_page == 0
+    assert ui_controller.visible_card_indexes() == range(0, 3)
+
+
+def cards_yaml(*words: str) -> str:
+    return yaml.dump(
+        [
+            {
+                'word': word,
+                'translations': [word.lower()],
+                'definition': '',
+                'examples': [],
+                'extra': '',
+            }
+            for word in words
+        ]
+    )
+
+
+def test_preview_is_drawn_from_the_cards_at_its_start(
+    ui_controller: UIController,
+):
+    cards = ui_controller._germanki.card_contents
+
+    def draw_card(index, card_contents):
+        # a preview job leaves a single card while the page is drawn
+        ui_controller._germanki._card_contents = cards[:1]
+
+    with patch.object(ui_controller, 'draw_page_navigation'), patch.object(
+        ui_controller, 'draw_card', side_effect=draw_card
+    ) as mock_draw_card:
+        ui_controller.refresh_preview()
+
+    assert [call.args for call in mock_draw_card.call_args_list] == [
+        (index, cards[index]) for index in range(4)
+    ]
+
+
+def test_photo_client_is_kept_across_reruns(ui_controller: UIController):
+    ui_controller._germanki.config.unsplash_api_key = 'fake-key'
+    ui_controller.photo_source = PhotoSource.AUTO
+    client = ui_controller._germanki.photos_client
+    assert isinstance(client, FallbackPhotosClient)
+
+    ui_controller.photo_source = PhotoSource.AUTO
+    assert ui_controller._germanki.photos_client is client
+
+    ui_controller.update_api_keys_action('', '', 'other-key')
+    assert ui_controller._germanki.photos_client is not client
+
+
+def test_preview_runs_in_background(ui_controller: UIController, tmp_path):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image')
+    cards_input = cards_yaml('Hund', 'Katze')
+    with patch.object(
+        Germanki, '_get_image', return_value=image
+    ), patch.object(
+        Germanki, '_get_tts_audio', side_effect=ValueError('TTS is down')
+    ):
+        ui_controller.preview_cards_action(cards_input)
+        ui_controller.job.join(5)
+
+    job = ui_controller.job
+    assert job.state == JobState.DONE
+    assert [card.word for card in ui_controller._germanki.card_contents] == [
+        'Hund',
+        'Katze',
+    ]
+    assert job.card_status(0) == CardStatus.FAILED
+    assert job.done == job.total == 2
+    assert 'Could not update card media' in job.warnings[0]
+
+
+def test_preview_tracks_cards_left_after_deck_check(
+    ui_controller: UIController, tmp_path
+):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image')
+    totals = []
+
+    def get_image(query):
+        totals.append(ui_controller.job.total)
+        return image
+
+    with patch.object(
+        ui_controller._germanki.anki_client,
+        'find_existing_words',
+        return_value=[True, False],
+    ), patch.object(
+        Germanki, '_get_image', side_effect=get_image
+    ), patch.object(
+        Germanki, '_get_tts_audio', return_value=image
+    ):
+        ui_controller.preview_cards_action(cards_yaml('Hund', 'Katze'), 'Deck')
+        ui_controller.job.join(5)
+
+    job = ui_controller.job
+    assert [card.word for card in ui_controller._germanki.card_contents] == [
+        'Katze'
+    ]
+    # the card already in the deck is never counted
+    assert totals == [1]
+    assert job.done == job.total == 1
+    assert job.card_status(0) == CardStatus.DONE
+    assert job.card_status(1) is None
+
+
+def test_invalid_input_fails_the_preview_job(ui_controller: UIController):
+    ui_controller.preview_cards_action('')
+    ui_controller.job.join(5)
+    assert ui_controller.job.state == JobState.FAILED
+    assert isinstance(ui_controller.job.exception, InvalidManualInputException)
+
+
+def test_jobs_resume_in_a_new_session(ui_controller: UIController, tmp_path):
+    image = tmp_path / 'image.jpg'
+    image.write_bytes(b'image')
+    audio = tmp_path / 'audio.mp3'
+    audio.write_bytes(b'audio')
+    cards_input = cards_yaml('Hund', 'Katze')
+    with patch.object(
+        Germanki, '_get_image', return_value=image
+    ), patch.object(Germanki, '_get_tts_audio', return_value=audio):
+        ui_controller.preview_cards_action(cards_input)
+        ui_controller.job.join(5)
+    with patch.object(
+        ui_controller._germanki.anki_client,
+        'add_cards',
+        return_value=[None, AnkiConnectResponseError('addNote', 'closed')],
+    ):
+        ui_controller.create_cards_action('Deck')
+        ui_controller.job.join(5)
+    assert ui_controller.job.card_status(0) == CardStatus.DONE
+    assert ui_controller.job.card_status(1) == CardStatus.FAILED
+
+    # the session is lost: the same input resumes the job from the journal
+    other = UIController(InputSource.MANUAL)
+    with patch.object(
+        ManualInputUIHandler, 'parse'
+    ) as mock_parse, patch.object(Germanki, '_get_image') as mock_image:
+        other.preview_cards_action(cards_input)
+        other.job.join(5)
+    mock_parse.assert_not_called()
+    mock_image.assert_not_called()
+    assert [card.word for card in other._germanki.card_contents] == ['Katze']
+    assert other.job.messages == ['Cards added by an earlier run: Hund']